@@ -1,12 +1,9 @@
 from flask import Flask, jsonify, request
-import sqlite3
 import json
 from flask_cors import CORS # Flask-CORSをインポート
 from flask_socketio import SocketIO, emit
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-import threading
 from datetime import datetime
 import time
 
@@ -17,24 +14,60 @@ from components.message import message_o
 from components.colorset import colorset_o
 from components.student import student_o
 from components.themes import themes_o
-from components.init import get_db_connection
+from components.db import get_db_connection
+from components.db import pool_stats
+from components import metrics
+from components.query_plan import audit_query_plans
+from components.camp_score import apply_vote, camp_id_map, fetch_camp_scores, remove_sticky_votes
+from components.settlement import settle_theme, start_settlement_worker
+from components.summary_worker import fallback_summary, start_summary_workers, submit_summary
+from components.position_coalescer import PositionCoalescer
+from components.event_log import create_event_log
+from components import sticky_list
+from components import resource_version
+from components import sticky_changes
+from components import hot_board
+from components import change_bus
+from components.change_bus import log_change
+from components import ai_cache
+from components.llm import LLMError, get_provider
 from components.topicset import topicset_o
 from components.reward import reward_o
-from components.ai_help import ai_help_bp
+from components.ai_help import ai_help_bp, advice_debouncer
 from components.ai_advice import ai_advice_o
 from components.room_vote import room_vote_o
+from components.logger import get_logger, setup_logging
+from components import async_mode, socket_queue
+
+log = get_logger('app')
 
 # Load environment variables safely
 try:
     load_dotenv()
 except Exception as e:
-    print(f"Warning: Could not load .env file: {e}")
+    log.warning("Could not load .env file: %s", e)
     # Continue without .env file
 
+# .env を読み込んだ後にログの出力先とレベルを設定する
+setup_logging()
+sticky_log = get_logger('sticky')
+socket_log = get_logger('socket')
+vote_log = get_logger('vote')
+ai_log = get_logger('ai')
+
 app = Flask(__name__)
-CORS(app) # CORSをアプリケーション全体に適用
+CORS(app, expose_headers=['X-Board-Seq', 'X-Board-Epoch', 'X-Next-Cursor', 'X-Board-Version']) # CORSをアプリケーション全体に適用
+
+# 実行モードは SOCKETIO_ASYNC_MODE で選ぶ（本番は server.py から eventlet で起動する）
+# SOCKETIO_MESSAGE_QUEUE を設定すると、複数のワーカー間でイベントを共有する
+socketio = SocketIO(app,cors_allowed_origins= "*", async_mode=async_mode.ASYNC_MODE,
+                    **socket_queue.socketio_options())
 
-socketio = SocketIO(app,cors_allowed_origins= "*")
+# 全ルート（Blueprint を含む）のレイテンシ・SQL を計測し、/metrics で公開する
+metrics.init_app(app)
+metrics.gauge_func(
+    'sqlite_pool_connections', 'SQLite connection pool counters',
+    lambda: {(name,): value for name, value in pool_stats().items()}, ('stat',))
 
 @app.route('/')
 def health():
@@ -42,18 +75,25 @@ def health():
 
 
 init_db()
+# 他のワーカーでの書き込みを change_log から受け取り、ETag・付箋一覧のキャッシュを無効にする
+change_bus.bus.start()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
-    print("Warning: GEMINI_API_KEY not found in environment variables")
+# CHECK_QUERY_PLANS=1 のときは起動時にホットパスのクエリが SCAN になっていないか確認する
+if os.getenv('CHECK_QUERY_PLANS') == '1':
+    _plan_conn = get_db_connection()
+    _plan_failures = audit_query_plans(_plan_conn)
+    _plan_conn.close()
+    if _plan_failures:
+        raise RuntimeError(f"インデックスが使われていないクエリがあります: {_plan_failures}")
+
+# 要約・アドバイスに使う LLM（LLM_PROVIDER で Gemini / ローカルの代替モデルを切り替える。無ければ None）
+llm = get_provider()
 
 def check_and_clear_expired_camps():
     """定期的にチェックし、終了した議論のcamp_idを削除"""
     while True:
         try:
-            conn = sqlite3.connect('database.db')
+            conn = get_db_connection()
             c = conn.cursor()
             
             # 現在の時刻を取得する
@@ -76,19 +116,24 @@ def check_and_clear_expired_camps():
                 ''', (school_id,))
                 
                 if c.rowcount > 0:
-                    print(f"Cleared camp_id for {c.rowcount} students in school {school_id}")
+                    log.info("Cleared camp_id for %s students in school %s", c.rowcount, school_id)
+                    log_change(conn, 'students', school_id)
             
             conn.commit()
             conn.close()
+            resource_version.bump(('student_camps',))
             
         except Exception as e:
-            print(f"Error in check_and_clear_expired_camps: {e}")
+            log.exception("Error in check_and_clear_expired_camps: %s", e)
         
         time.sleep(300)
 
 # camp_clear_thread = threading.Thread(target=check_and_clear_expired_camps, daemon=True)
 # camp_clear_thread.start()
 
+# 終了したテーマの精算（勝敗・学生ポイント）はバックグラウンドで1回だけ行う
+start_settlement_worker()
+
 app.register_blueprint(colorset_o)
 app.register_blueprint(signup_o)
 app.register_blueprint(login_o)
@@ -96,97 +141,253 @@ app.register_blueprint(student_o)
 app.register_blueprint(topicset_o)
 app.register_blueprint(reward_o)
 app.register_blueprint(ai_help_bp)
+
+def advice_room(sticky_id, student_id):
+    """付箋チャットのうち、その学生の接続だけが入るルーム（AIアドバイスの送信先）"""
+    return f"sticky_{sticky_id}:student_{student_id}"
+
+def emit_ai_advice(sticky_id, student_id, advice):
+    """生成されたAIアドバイスを依頼した学生にだけ送信"""
+    socketio.emit('ai_advice_updated', {
+        'sticky_id': sticky_id,
+        'student_id': student_id,
+        'advice': advice
+    }, to=advice_room(sticky_id, student_id))
+
+def emit_ai_advice_chunk(sids, sticky_id, student_id, chunk):
+    """ストリーミング中のアドバイスの部分を依頼したクライアントにだけ送信"""
+    for sid in sids:
+        socketio.emit('ai_advice_chunk', {
+            'sticky_id': sticky_id,
+            'student_id': student_id,
+            'chunk': chunk
+        }, to=sid)
+
+def emit_ai_advice_done(sids, sticky_id, student_id, advice, error):
+    """ストリーミングの完了を送信（advice が最終的な全文。途中の部分はこれで置き換える）"""
+    for sid in sids:
+        socketio.emit('ai_advice_done', {
+            'sticky_id': sticky_id,
+            'student_id': student_id,
+            'advice': advice,
+            'error': str(error) if error else None
+        }, to=sid)
+
+advice_debouncer.on_ready = emit_ai_advice
+advice_debouncer.on_chunk = emit_ai_advice_chunk
+advice_debouncer.on_done = emit_ai_advice_done
 app.register_blueprint(ai_advice_o)
 app.register_blueprint(room_vote_o)
 
 # Sticky Notes API endpoints
+def fetch_sticky_info(c, sticky_id):
+    """Socket で送信する付箋の完全な情報を取得（付箋が無ければ None）"""
+    c.execute('''SELECT s.sticky_id, s.student_id, s.sticky_content, s.sticky_color, s.x_axis, s.y_axis, s.display_index,
+                        s.feedback_A, s.feedback_B, s.feedback_C, s.ai_summary_content, s.ai_teammate_avg_prediction,
+                        s.ai_enemy_avg_prediction, s.ai_overall_avg_prediction, s.teammate_avg_score, s.enemy_avg_score,
+                        s.overall_avg_score, s.created_at, st.name, s.school_id, st.camp_id, s.version
+                 FROM sticky s
+                 JOIN students st ON s.student_id = st.student_id
+                 WHERE s.sticky_id = ?''', (sticky_id,))
+    sticky_data = c.fetchone()
+    if not sticky_data:
+        return None
+    return {
+        'sticky_id': sticky_data[0],
+        'student_id': sticky_data[1],
+        'sticky_content': sticky_data[2],
+        'sticky_color': sticky_data[3],
+        'x_axis': sticky_data[4],
+        'y_axis': sticky_data[5],
+        'display_index': sticky_data[6],
+        'feedback_A': sticky_data[7],
+        'feedback_B': sticky_data[8],
+        'feedback_C': sticky_data[9],
+        'ai_summary_content': sticky_data[10],
+        'ai_teammate_avg_prediction': sticky_data[11],
+        'ai_enemy_avg_prediction': sticky_data[12],
+        'ai_overall_avg_prediction': sticky_data[13],
+        'teammate_avg_score': sticky_data[14],
+        'enemy_avg_score': sticky_data[15],
+        'overall_avg_score': sticky_data[16],
+        'created_at': sticky_data[17],
+        'student_name': sticky_data[18],
+        'school_id': sticky_data[19],
+        'author_camp_id': sticky_data[20],
+        'version': sticky_data[21]
+    }
+
+# 旧クライアント向けに sticky_updated の全項目の送信を続けるか
+# 全クライアントが差分に対応したら 0 にすると、全項目の取得（JOIN）と送信を省ける
+STICKY_FULL_UPDATES = os.getenv('STICKY_FULL_UPDATES', '1') != '0'
+
+# 学校ごとのボードのイベントに連番 seq を付けて保持する（再接続したクライアントへの再送に使う）
+board_events = create_event_log()
+
+# 討論中のボードの付箋一覧はメモリに保持し、書き込みの処理から直接更新する
+hot_boards = hot_board.HotBoardCache() if hot_board.HOT_BOARD_CACHE else None
+if hot_boards:
+    metrics.gauge_func(
+        'hot_board_cache', 'Boards and approximate bytes held by the in-process board cache',
+        lambda: {(name,): value for name, value in hot_boards.stats().items()}, ('stat',))
+
+def emit_board_event(event, payload, school_id, to=None):
+    """ボードのイベントを記録し、seq を付けて送信する（to を省略すると学校全体のルーム）"""
+    seq = board_events.record(school_id, event, payload)
+    socketio.emit(event, dict(payload, seq=seq), to=to or f"school_{school_id}")
+    return seq
+
+def school_rooms(school_id):
+    """(学校全体, 差分対応のクライアント, 全項目のクライアント) のルーム名"""
+    return f"school_{school_id}", f"school_{school_id}:delta", f"school_{school_id}:full"
+
+def emit_sticky_updated(c, sticky_id, school_id, version, changes):
+    """sticky_updated を送信する
+
+    join_school で sticky_delta: true を指定したクライアントには、変更された項目と
+    sticky_id・version（付箋ごとに単調増加する版数）だけを送る。それ以外のクライアントには従来どおり全項目を送る。
+    """
+    _, delta_room, full_room = school_rooms(school_id)
+    payload = {'sticky_id': sticky_id, 'version': version, 'delta': True}
+    payload.update(changes)
+    # 再送するのは差分（全項目のクライアントは再接続時に全件を取得し直す）
+    seq = emit_board_event('sticky_updated', payload, school_id, to=delta_room)
+    if STICKY_FULL_UPDATES:
+        sticky_info = fetch_sticky_info(c, sticky_id)
+        if sticky_info:
+            socketio.emit('sticky_updated', dict(sticky_info, seq=seq), to=full_room)
+
+# 要約のプロンプトのバージョン（プロンプトを変えたらバージョンを上げてキャッシュを無効にする）
+SUMMARY_PROMPT_VERSION = 1
+
+def summarize_sticky(sticky_content, school_id=None):
+    """LLM で付箋を30字以内に要約（失敗・制限中は先頭30字）。要約ワーカーから呼ばれる"""
+    def generate():
+        try:
+            ai_summary_content = llm.generate(f'以下の内容を基に30字以内で要約###内容###{sticky_content}',
+                                              operation='summary', school_id=school_id)
+            ai_log.debug("LLM summary: %s", ai_summary_content)
+            return ai_summary_content
+        except LLMError as e:
+            ai_log.warning("LLM call failed: %s", e)
+            return None
+
+    summary = ai_cache.cached_generate('summary', SUMMARY_PROMPT_VERSION, llm.model, sticky_content, generate)
+    return summary if summary is not None else fallback_summary(sticky_content)
+
+def emit_sticky_summarized(sticky_id, school_id, version, summary):
+    """要約が保存された付箋を同校の全ユーザーに送信"""
+    conn = get_db_connection()
+    try:
+        emit_sticky_updated(conn.cursor(), sticky_id, school_id, version, {'ai_summary_content': summary})
+    finally:
+        conn.close()
+
+# 要約はリクエストを待たせないようにバックグラウンドのワーカーで作成する
+if llm:
+    start_summary_workers(summarize_sticky, emit_sticky_summarized)
+
+def emit_sticky_positions(school_id, positions):
+    """ドラッグ中の付箋の位置をまとめて同校の全ユーザーに送信"""
+    socketio.emit('sticky_positions', {'positions': positions}, to=f"school_{school_id}")
+
+def record_sticky_positions(school_id, positions):
+    """保存した位置を版数付きで記録・送信する（差分で同期しているクライアントが版数を進められるように）"""
+    resource_version.bump_board(school_id)
+    emit_board_event('sticky_positions', {'positions': positions, 'saved': True}, school_id)
+
+# ドラッグ中の位置は PATCH ごとに保存・送信せず、まとめて送信・保存する
+sticky_positions = PositionCoalescer(emit_sticky_positions, on_saved=record_sticky_positions).start()
+
+def parse_position(item):
+    """{sticky_id, x_axis, y_axis} を検証して (sticky_id, x, y) を返す（不正なら None）"""
+    try:
+        sticky_id = int(item['sticky_id'])
+        x, y = item['x_axis'], item['y_axis']
+    except (KeyError, TypeError, ValueError):
+        return None
+    if isinstance(x, bool) or isinstance(y, bool) or not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+        return None
+    return sticky_id, x, y
+
+@app.route('/api/sticky/positions', methods=['POST'])
+def update_sticky_positions():
+    """ドラッグ中の付箋の位置をまとめて受け取る（"drag_end": true でドラッグ終了としてすぐに保存する）"""
+    if not request.json or not isinstance(request.json.get('positions'), list):
+        return jsonify({'error': 'positions が必要です'}), 400
+    try:
+        accepted = 0
+        for item in request.json['positions']:
+            position = parse_position(item) if isinstance(item, dict) else None
+            if not position:
+                continue
+            sticky_id, x, y = position
+            school_id = sticky_positions.school_of(sticky_id)
+            if school_id is None:
+                continue
+            sticky_positions.update(sticky_id, school_id, x, y, final=bool(request.json.get('drag_end')))
+            accepted += 1
+        return jsonify({'status': 'success', 'accepted': accepted}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/sticky', methods=['POST'])
 def create_sticky():
     
     if not request.json:
         return jsonify({'error': 'リクエストボディが必要です'}), 400
     
-    # デバッグ情報：受信データのチェック
-    print(f"DEBUG: Received request data: {request.json}")
-    
     required_fields = ['student_id', 'sticky_content', 'sticky_color']
     for field in required_fields:
         if field not in request.json:
-            print(f"DEBUG: Missing field: {field}")
+            sticky_log.debug("Missing field: %s", field)
             return jsonify({'error': f'{field}が必要です'}), 400
     
     # theme_idを取得（任意項目として扱う場合はgetでOK）
     theme_id = request.json.get('theme_id')
 
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
-        # この接続を外部キーを有効にする
-        c.execute('PRAGMA foreign_keys = ON')
-        
         # 生徒が存在しているかどうかを確認する
         student_id = request.json['student_id']
-        print(f"DEBUG: Looking for student_id: {student_id} (type: {type(student_id)})")
         
-        c.execute('SELECT student_id FROM students WHERE student_id = ?', (student_id,))
+        c.execute('SELECT student_id, school_id, camp_id FROM students WHERE student_id = ?', (student_id,))
         student = c.fetchone()
-        print(f"DEBUG: Student found: {student}")
-        
-        # 生徒全員を同時にチェックする
-        c.execute('SELECT student_id, name, number FROM students')
-        all_students = c.fetchall()
-        print(f"DEBUG: All students in database: {all_students}")
         
         if not student:
             conn.close()
-            print(f"DEBUG: Student {student_id} not found in database")
+            sticky_log.debug("Student not found", extra={'fields': {'student_id': student_id}})
             return jsonify({'error': '指定された学生が見つかりません'}), 400
         
+        school_id = student[1]
+        
         # 新しい付箋のdisplay_indexを取得（同じ学校の最大index + 1）
-        c.execute('''SELECT MAX(s.display_index) FROM sticky s 
-                     JOIN students st ON s.student_id = st.student_id 
-                     WHERE st.school_id = (SELECT school_id FROM students WHERE student_id = ?)''', 
-                  (student_id,))
+        c.execute(sticky_list.MAX_DISPLAY_INDEX_SQL, (school_id,))
         max_index_result = c.fetchone()
         new_display_index = (max_index_result[0] or 0) + 1
         
-        # gemini要約
+        # AI要約はバックグラウンドで作成するので、キャッシュに無ければまずは先頭30字を入れておく
         sticky_content = request.json['sticky_content']
-        ai_summary_content = ""
-        try:
-            if GEMINI_API_KEY:
-                print(f"DEBUG: Attempting Gemini API call with key: {GEMINI_API_KEY[:10]}...")
-                gemini = genai.GenerativeModel("gemini-2.5-flash")
-                response = gemini.generate_content(f'以下の内容を基に30字以内で要約###内容###{sticky_content}')
-                # レスポンスから要約文を抽出（仮に response.text だとします。実際はAPI仕様に合わせてください）
-                ai_summary_content = response.text if hasattr(response, "text") else str(response)
-                print(f"DEBUG: Gemini API response: {ai_summary_content}")
-            else:
-                print("DEBUG: No GEMINI_API_KEY found, using fallback")
-                ai_summary_content = sticky_content[:30]
-        except Exception as e:
-            print(f"DEBUG: Gemini API call failed: {e}")
-            ai_summary_content = sticky_content[:30]
+        cached_summary = None
+        if llm:
+            cached_summary = ai_cache.lookup('summary', SUMMARY_PROMPT_VERSION, llm.model, sticky_content)
+        ai_summary_content = cached_summary or fallback_summary(sticky_content)
         
-        # 作成者の陣営IDを取得
-        c.execute('SELECT camp_id FROM students WHERE student_id = ?', (request.json['student_id'],))
-        author_camp_result = c.fetchone()
-        if not author_camp_result or author_camp_result[0] is None:
+        # 作成者の陣営ID
+        if student[2] is None:
             conn.close()
             return jsonify({'error': '付箋作成者の陣営が設定されていません'}), 400
-        author_camp_id = author_camp_result[0]
-        print(f"\n=== Creating Sticky ===")
-        print(f"Author ID: {request.json['student_id']}")
-        print(f"Author Camp ID: {author_camp_id}")
+        author_camp_id = student[2]
         
         # 付箋插入（作成時の陣営IDを保存）
         c.execute('''INSERT INTO sticky (
         student_id, sticky_content, sticky_color, x_axis, y_axis, display_index, 
         feedback_A, feedback_B, feedback_C, ai_summary_content, 
         ai_teammate_avg_prediction, ai_enemy_avg_prediction, ai_overall_avg_prediction, 
-        teammate_avg_score, enemy_avg_score, overall_avg_score, theme_id, author_camp_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        teammate_avg_score, enemy_avg_score, overall_avg_score, theme_id, author_camp_id, school_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                  (request.json['student_id'], 
                   request.json['sticky_content'],
                   request.json['sticky_color'],
@@ -204,56 +405,32 @@ def create_sticky():
                   request.json.get('enemy_avg_score', 0),
                   request.json.get('overall_avg_score', 0),
                   theme_id,
-                  author_camp_id
+                  author_camp_id,
+                  school_id
                  ))
         
         sticky_id = c.lastrowid
+        board_version = sticky_changes.mark_sticky_changed(c, sticky_id)
+        sticky_log.debug("Created sticky", extra={'fields': {
+            'sticky_id': sticky_id, 'student_id': student_id, 'author_camp_id': author_camp_id}})
         
         # 作成された付箋の完全な情報を取得してSocketで送信
-        c.execute('''SELECT s.sticky_id, s.student_id, s.sticky_content, s.sticky_color, s.x_axis, s.y_axis, s.display_index,
-                            s.feedback_A, s.feedback_B, s.feedback_C, s.ai_summary_content, s.ai_teammate_avg_prediction,
-                            s.ai_enemy_avg_prediction, s.ai_overall_avg_prediction, s.teammate_avg_score, s.enemy_avg_score,
-                            s.overall_avg_score, s.created_at, st.name, st.school_id, st.camp_id
-                     FROM sticky s
-                     JOIN students st ON s.student_id = st.student_id
-                     WHERE s.sticky_id = ?''', (sticky_id,))
-        
-        sticky_data = c.fetchone()
+        sticky_info = fetch_sticky_info(c, sticky_id)
         conn.commit()
         conn.close()
+        resource_version.bump_board(school_id, theme_id)
+        if hot_boards and sticky_info:
+            hot_boards.apply(school_id, theme_id, board_version, sticky_info)
         
-        if sticky_data:
-            # 新しい付箋のデータを全クライアントに送信
-            sticky_info = {
-                'sticky_id': sticky_data[0],
-                'student_id': sticky_data[1],
-                'sticky_content': sticky_data[2],
-                'sticky_color': sticky_data[3],
-                'x_axis': sticky_data[4],
-                'y_axis': sticky_data[5],
-                'display_index': sticky_data[6],
-                'feedback_A': sticky_data[7],
-                'feedback_B': sticky_data[8],
-                'feedback_C': sticky_data[9],
-                'ai_summary_content': sticky_data[10],
-                'ai_teammate_avg_prediction': sticky_data[11],
-                'ai_enemy_avg_prediction': sticky_data[12],
-                'ai_overall_avg_prediction': sticky_data[13],
-                'teammate_avg_score': sticky_data[14],
-                'enemy_avg_score': sticky_data[15],
-                'overall_avg_score': sticky_data[16],
-                'created_at': sticky_data[17],
-                'student_name': sticky_data[18],
-                'school_id': sticky_data[19],
-                'author_camp_id': sticky_data[20]
-            }
-            
+        if sticky_info:
             # 同校の全ユーザーに新しい付箋を送信
-            room_name = f"school_{sticky_data[19]}"
-            print(f"DEBUG: Sending sticky_created event to room: {room_name}")
-            print(f"DEBUG: Sticky data: {sticky_info}")
-            socketio.emit('sticky_created', sticky_info, to=room_name)
-            print(f"DEBUG: sticky_created event sent successfully")
+            seq = emit_board_event('sticky_created', sticky_info, sticky_info['school_id'])
+            socket_log.debug("Sent sticky_created", extra={'fields': {
+                'school_id': sticky_info['school_id'], 'sticky_id': sticky_id, 'seq': seq}})
+        
+        # AI要約を依頼（完了すると sticky_updated で送信される）
+        if llm and cached_summary is None:
+            submit_summary(sticky_id, sticky_content, school_id)
         
         return jsonify({
             'status': 'success',
@@ -264,81 +441,104 @@ def create_sticky():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def query_sticky_notes(school_id, theme_id, student_id, fields, cursor, limit):
+    """付箋一覧を SQLite から読み、(ボードの版数, JSON の本文, 次のページのカーソル) を返す"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    # 差分同期（/api/sticky/changes）の since に使う版数も取得より前に読む
+    board_version = sticky_changes.board_version(c, school_id, theme_id)[0] if school_id and theme_id else None
+    sticky_list.query_stickies(c, fields, school_id=school_id, theme_id=theme_id, student_id=student_id,
+                               cursor=cursor, limit=limit + 1 if limit else None)
+    next_cursor = None
+    if limit:
+        # 1ページ分は件数が限られるので先に読み出し、続きがあるかを判定する
+        rows = c.fetchall()
+        conn.close()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = sticky_list.encode_cursor(rows[-1][1], rows[-1][0])
+        return board_version, sticky_list.iter_json_array(rows, fields), next_cursor
+
+    def stream_all():
+        # 全件の場合は少しずつ読み出して書き出し、送り終えたら接続を返す
+        try:
+            yield from sticky_list.iter_json_array(sticky_list.fetch_rows(c), fields)
+        finally:
+            conn.close()
+    return board_version, stream_all(), next_cursor
+
 @app.route('/api/sticky', methods=['GET'])
+@resource_version.conditional(lambda: resource_version.board_keys(
+    request.args['school_id'], request.args.get('theme_id')) if request.args.get('school_id') else None)
 def get_sticky_notes():
+    """付箋一覧（school_id / theme_id / student_id で絞り込む）
+
+    limit・cursor でキーセットページング、fields で返す項目の絞り込みができる（components.sticky_list）。
+    続きがある場合は X-Next-Cursor に次のページのカーソルを返す。
+    学校・テーマのボードはプロセス内のキャッシュから返す（components.hot_board）。
+    """
+    student_id = request.args.get('student_id')
+    school_id = request.args.get('school_id')
+    theme_id = request.args.get('theme_id')
     try:
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
-        
-        student_id = request.args.get('student_id')
-        school_id = request.args.get('school_id')
-        theme_id = request.args.get('theme_id')
-        
-        # 付箋取得（camp_idも含める）
-        if school_id and theme_id:
-            # school_id と theme_id の両方で絞り込む
-            c.execute('''SELECT s.sticky_id, s.student_id, s.sticky_content, s.sticky_color, s.x_axis, s.y_axis, s.display_index,
-                                s.feedback_A, s.feedback_B, s.feedback_C, s.ai_summary_content, s.ai_teammate_avg_prediction,
-                                s.ai_enemy_avg_prediction, s.ai_overall_avg_prediction, s.teammate_avg_score, s.enemy_avg_score,
-                                s.overall_avg_score, s.created_at, st.name, st.camp_id
-                         FROM sticky s
-                         JOIN students st ON s.student_id = st.student_id
-                         WHERE st.school_id = ? AND s.theme_id = ? ORDER BY s.display_index, s.created_at DESC''', (school_id, theme_id))
-        elif  school_id:
-            # 同校の全学生の付箋を取得
-            c.execute('''SELECT s.sticky_id, s.student_id, s.sticky_content, s.sticky_color, s.x_axis, s.y_axis, s.display_index,
-                                s.feedback_A, s.feedback_B, s.feedback_C, s.ai_summary_content, s.ai_teammate_avg_prediction,
-                                s.ai_enemy_avg_prediction, s.ai_overall_avg_prediction, s.teammate_avg_score, s.enemy_avg_score,
-                                s.overall_avg_score, s.created_at, st.name, st.camp_id
-                         FROM sticky s
-                         JOIN students st ON s.student_id = st.student_id
-                         WHERE st.school_id = ? ORDER BY s.display_index, s.created_at DESC''', (school_id,))
-        elif student_id:
-            c.execute('''SELECT s.sticky_id, s.student_id, s.sticky_content, s.sticky_color, s.x_axis, s.y_axis, s.display_index,
-                                s.feedback_A, s.feedback_B, s.feedback_C, s.ai_summary_content, s.ai_teammate_avg_prediction,
-                                s.ai_enemy_avg_prediction, s.ai_overall_avg_prediction, s.teammate_avg_score, s.enemy_avg_score,
-                                s.overall_avg_score, s.created_at, st.name, st.camp_id
-                         FROM sticky s
-                         JOIN students st ON s.student_id = st.student_id
-                         WHERE s.student_id = ?
-                         ORDER BY s.display_index, s.created_at DESC''', (student_id,))
+        fields = sticky_list.parse_fields(request.args.get('fields'))
+        limit = sticky_list.parse_limit(request.args.get('limit'))
+        cursor = sticky_list.parse_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # 取得より前の seq を返す（取得中に起きたイベントは再接続時の再送に含まれる）
+        board_seq = board_events.latest(school_id) if school_id else None
+
+        if hot_boards and school_id and theme_id and theme_id.isdigit():
+            board_version, board_rows = hot_boards.rows(school_id, int(theme_id))
+            rows, next_cursor = hot_board.page(board_rows, fields, cursor, limit)
+            body = sticky_list.iter_json_array(rows, fields)
         else:
-            c.execute('''SELECT s.sticky_id, s.student_id, s.sticky_content, s.sticky_color, s.x_axis, s.y_axis, s.display_index,
-                                s.feedback_A, s.feedback_B, s.feedback_C, s.ai_summary_content, s.ai_teammate_avg_prediction,
-                                s.ai_enemy_avg_prediction, s.ai_overall_avg_prediction, s.teammate_avg_score, s.enemy_avg_score,
-                                s.overall_avg_score, s.created_at, st.name, st.camp_id
-                         FROM sticky s
-                         JOIN students st ON s.student_id = st.student_id
-                         ORDER BY s.display_index, s.created_at DESC''')
-        
-        sticky_notes = []
-        for row in c.fetchall():
-            sticky_notes.append({
-                'sticky_id': row[0],
-                'student_id': row[1],
-                'sticky_content': row[2],
-                'sticky_color': row[3],
-                'x_axis': row[4],
-                'y_axis': row[5],
-                'display_index': row[6],
-                'feedback_A': row[7],
-                'feedback_B': row[8],
-                'feedback_C': row[9],
-                'ai_summary_content': row[10],
-                'ai_teammate_avg_prediction': row[11],
-                'ai_enemy_avg_prediction': row[12],
-                'ai_overall_avg_prediction': row[13],
-                'teammate_avg_score': row[14],
-                'enemy_avg_score': row[15],
-                'overall_avg_score': row[16],
-                'created_at': row[17],
-                'student_name': row[18],
-                'author_camp_id': row[19]
-            })
-        
-        conn.close()
-        return jsonify(sticky_notes)
-        
+            board_version, body, next_cursor = query_sticky_notes(
+                school_id, theme_id, student_id, fields, cursor, limit)
+
+        response = app.response_class(body, mimetype='application/json')
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        if board_version is not None:
+            response.headers['X-Board-Version'] = str(board_version)
+        if board_seq is not None:
+            # クライアントはこの seq から再接続時の再送を受け取る
+            response.headers['X-Board-Seq'] = str(board_seq)
+            response.headers['X-Board-Epoch'] = board_events.epoch
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sticky/changes', methods=['GET'])
+@resource_version.conditional(lambda: resource_version.board_keys(
+    request.args['school_id'], request.args['theme_id'])
+    if request.args.get('school_id') and request.args.get('theme_id') else None)
+def get_sticky_changes():
+    """since（前回の version）より後に作成・更新された付箋と、削除された付箋の ID を返す
+
+    {version, stickies, deleted}。削除の記録が残っていない古い since には
+    {version, snapshot_required: true} を返すので、GET /api/sticky で全件を取得し直す（X-Board-Version が次の since）。
+    """
+    school_id = request.args.get('school_id')
+    if not school_id or not request.args.get('theme_id'):
+        return jsonify({'error': 'school_id と theme_id が必要です'}), 400
+    try:
+        theme_id = int(request.args['theme_id'])
+        since = int(request.args.get('since', 0))
+        fields = sticky_list.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        conn = get_db_connection()
+        try:
+            changes = sticky_changes.fetch_changes(conn.cursor(), school_id, theme_id, since, fields)
+        finally:
+            conn.close()
+        return jsonify(changes)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -348,7 +548,7 @@ def update_sticky(sticky_id):
         return jsonify({'error': 'リクエストボディが必要です'}), 400
     
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         update_fields = []
@@ -363,60 +563,40 @@ def update_sticky(sticky_id):
                 values.append(request.json[field])
         
         if not update_fields:
+            conn.close()
             return jsonify({'error': '更新するフィールドがありません'}), 400
         
+        # PATCH で位置を変えた場合は、まとめて保存する予定の古い位置を捨てる
+        if 'x_axis' in request.json or 'y_axis' in request.json:
+            sticky_positions.discard(sticky_id)
+        
         values.append(sticky_id)
-        query = f"UPDATE sticky SET {', '.join(update_fields)} WHERE sticky_id = ?"
+        # 更新のたびに版数を上げる（クライアントは版数の順に差分を適用する）
+        query = f"UPDATE sticky SET {', '.join(update_fields)}, version = version + 1 WHERE sticky_id = ?"
         
         c.execute(query, values)
-        conn.commit()
         
         if c.rowcount == 0:
             conn.close()
             return jsonify({'error': '付箋が見つかりません'}), 404
+        board_version = sticky_changes.mark_sticky_changed(c, sticky_id)
         
-        # 更新後の付箋情報を取得してSocketで送信
-        c.execute('''SELECT s.sticky_id, s.student_id, s.sticky_content, s.sticky_color, s.x_axis, s.y_axis, s.display_index,
-                            s.feedback_A, s.feedback_B, s.feedback_C, s.ai_summary_content, s.ai_teammate_avg_prediction,
-                            s.ai_enemy_avg_prediction, s.ai_overall_avg_prediction, s.teammate_avg_score, s.enemy_avg_score,
-                            s.overall_avg_score, s.created_at, st.name, st.school_id, st.camp_id
-                     FROM sticky s
-                     JOIN students st ON s.student_id = st.student_id
-                     WHERE s.sticky_id = ?''', (sticky_id,))
+        # 更新した項目を版数と同じトランザクションで読み直す（保存された値をそのまま送る）
+        changed_fields = [field for field in allowed_fields if field in request.json]
+        c.execute(f"SELECT school_id, version, theme_id, {', '.join(changed_fields)} FROM sticky WHERE sticky_id = ?",
+                  (sticky_id,))
+        row = c.fetchone()
+        conn.commit()
+        resource_version.bump_board(row[0], row[2])
+        changes = dict(zip(changed_fields, row[3:]))
+        if hot_boards:
+            hot_boards.apply(row[0], row[2], board_version, dict(changes, sticky_id=sticky_id, version=row[1]))
         
-        sticky_data = c.fetchone()
+        # 同校の全ユーザーに更新された項目を送信
+        emit_sticky_updated(c, sticky_id, row[0], row[1], changes)
         conn.close()
         
-        if sticky_data:
-            # 更新された付箋のデータを全クライアントに送信
-            sticky_info = {
-                'sticky_id': sticky_data[0],
-                'student_id': sticky_data[1],
-                'sticky_content': sticky_data[2],
-                'sticky_color': sticky_data[3],
-                'x_axis': sticky_data[4],
-                'y_axis': sticky_data[5],
-                'display_index': sticky_data[6],
-                'feedback_A': sticky_data[7],
-                'feedback_B': sticky_data[8],
-                'feedback_C': sticky_data[9],
-                'ai_summary_content': sticky_data[10],
-                'ai_teammate_avg_prediction': sticky_data[11],
-                'ai_enemy_avg_prediction': sticky_data[12],
-                'ai_overall_avg_prediction': sticky_data[13],
-                'teammate_avg_score': sticky_data[14],
-                'enemy_avg_score': sticky_data[15],
-                'overall_avg_score': sticky_data[16],
-                'created_at': sticky_data[17],
-                'student_name': sticky_data[18],
-                'school_id': sticky_data[19],
-                'author_camp_id': sticky_data[20]
-            }
-            
-            # 同校の全ユーザーに更新された付箋を送信
-            socketio.emit('sticky_updated', sticky_info, to=f"school_{sticky_data[19]}")
-        
-        return jsonify({'status': 'success', 'message': '付箋が更新されました'})
+        return jsonify({'status': 'success', 'message': '付箋が更新されました', 'version': row[1]})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -424,14 +604,11 @@ def update_sticky(sticky_id):
 @app.route('/api/sticky/<int:sticky_id>', methods=['DELETE'])
 def delete_sticky(sticky_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # 削除前に付箋情報を取得
-        c.execute('''SELECT s.sticky_id, s.student_id, st.school_id
-                     FROM sticky s
-                     JOIN students st ON s.student_id = st.student_id
-                     WHERE s.sticky_id = ?''', (sticky_id,))
+        c.execute('SELECT sticky_id, student_id, school_id, theme_id FROM sticky WHERE sticky_id = ?', (sticky_id,))
         
         sticky_data = c.fetchone()
         
@@ -439,12 +616,20 @@ def delete_sticky(sticky_id):
             conn.close()
             return jsonify({'error': '付箋が見つかりません'}), 404
         
+        # 付箋への投票分の陣営別得点を取り消してから削除
+        remove_sticky_votes(c, sticky_id)
+        board_version = sticky_changes.record_tombstone(c, sticky_id, sticky_data[2], sticky_data[3])
+        c.execute('DELETE FROM conversation_digest WHERE sticky_id = ?', (sticky_id,))
         c.execute('DELETE FROM sticky WHERE sticky_id = ?', (sticky_id,))
-        conn.commit()
-        
         if c.rowcount == 0:
+            # 確認の後に他のリクエストが削除していた（close で取り消しと削除の記録を巻き戻す）
             conn.close()
             return jsonify({'error': '付箋が見つかりません'}), 404
+        conn.commit()
+        sticky_positions.discard(sticky_id)
+        resource_version.bump_board(sticky_data[2], sticky_data[3])
+        if hot_boards:
+            hot_boards.remove(sticky_data[2], sticky_data[3], board_version, sticky_id)
         
         # 削除された付箋のIDを全クライアントに送信
         delete_info = {
@@ -454,7 +639,7 @@ def delete_sticky(sticky_id):
         }
         
         # 同校の全ユーザーに削除された付箋を送信
-        socketio.emit('sticky_deleted', delete_info, to=f"school_{sticky_data[2]}")
+        emit_board_event('sticky_deleted', delete_info, sticky_data[2])
         
         conn.close()
         return jsonify({'status': 'success', 'message': '付箋が削除されました'})
@@ -466,414 +651,63 @@ def delete_sticky(sticky_id):
 @app.route('/api/camps/scores/<school_id>/<int:theme_id>', methods=['GET'])
 def get_camp_scores(school_id, theme_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
-        # 各陣営の得点を計算
+        # 陣営の無いテーマは得点を読む前に 404 を返す
+        c.execute('SELECT 1 FROM camps WHERE theme_id = ? LIMIT 1', (theme_id,))
+        if not c.fetchone():
+            conn.close()
+            return jsonify({'error': 'テーマに対する陣営が見つかりません'}), 404
+        
+        # 各陣営の得点は投票時に camp_score へ加算済み（components/camp_score.py）
         # 同陣営の投票: A(+2), B(+1), C(-1)
         # 敵陣営の投票: A(+6), B(+3), C(-1)
+        camp_rows = fetch_camp_scores(c, school_id, theme_id)
         
-        print(f"\n=== Calculating scores for school_id: {school_id}, theme_id: {theme_id} ===")
-        
-        # デバッグ: 基本的な投票データを確認
-        c.execute('''
-            SELECT 
-                COUNT(*) as total_votes,
-                sv.vote_type,
-                COUNT(DISTINCT sv.sticky_id) as unique_stickies,
-                COUNT(DISTINCT sv.student_id) as unique_voters
-            FROM sticky_votes sv
-            JOIN sticky s ON sv.sticky_id = s.sticky_id
-            JOIN students st ON s.student_id = st.student_id
-            WHERE st.school_id = ? AND s.theme_id = ?
-            GROUP BY sv.vote_type
-        ''', (school_id, theme_id))
-        
-        basic_vote_data = c.fetchall()
-        print("\n=== Basic Vote Summary ===")
-        for row in basic_vote_data:
-            print(f"Vote Type {row[1] if row[1] is not None else 'None'}: {row[0] if row[0] is not None else 'None'} votes on {row[2] if row[2] is not None else 'None'} stickies by {row[3] if row[3] is not None else 'None'} voters")
-        
-        # デバッグ: 陣営情報を確認
-        c.execute('''
-            SELECT 
-                s.sticky_id,
-                s.author_camp_id,
-                sv.vote_type,
-                sv.voter_camp_id,
-                st_target.name as target_student,
-                st_voter.name as voter_student
-            FROM sticky s
-            JOIN sticky_votes sv ON s.sticky_id = sv.sticky_id
-            JOIN students st_target ON s.student_id = st_target.student_id
-            JOIN students st_voter ON sv.student_id = st_voter.student_id
-            WHERE st_target.school_id = ? AND s.theme_id = ?
-            ORDER BY s.sticky_id, sv.vote_type
-        ''', (school_id, theme_id))
-        
-        detailed_vote_data = c.fetchall()
-        print("\n=== Detailed Vote Data ===")
-        print("Sticky ID | Target Camp | Vote Type | Voter Camp | Target Student | Voter Student")
-        print("-" * 90)
-        for row in detailed_vote_data:
-            print(f"{row[0] if row[0] is not None else 'None':^9}|{row[1] if row[1] is not None else 'None':^12}|{row[2] if row[2] is not None else 'None':^10}|{row[3] if row[3] is not None else 'None':^11}|{row[4] if row[4] is not None else 'None':^15}|{row[5] if row[5] is not None else 'None':^14}")
-        
-        if not detailed_vote_data:
-            print("Warning: No detailed vote data found!")
+        if not any(row['vote_count'] for row in camp_rows):
+            conn.close()
             return jsonify({'error': '投票データが見つかりません'}), 404
         
-        # まず、投票データを取得（投票者と被投票者の詳細情報を含む）
-        c.execute('''
-            WITH vote_summary AS (
-                SELECT 
-                    sticky_target.theme_id,
-                    sticky_target.author_camp_id as target_camp_id,
-                    sv.vote_type,
-                    sv.voter_camp_id,
-                    COUNT(*) as vote_count,
-                    GROUP_CONCAT(DISTINCT s.name) as target_students,
-                    GROUP_CONCAT(DISTINCT st_voter.name) as voter_students
-                FROM sticky sticky_target
-                JOIN students s ON sticky_target.student_id = s.student_id
-                JOIN sticky_votes sv ON sticky_target.sticky_id = sv.sticky_id
-                JOIN students st_voter ON sv.student_id = st_voter.student_id
-                WHERE s.school_id = ? AND sticky_target.theme_id = ?
-                  AND sticky_target.author_camp_id IS NOT NULL
-                  AND sv.voter_camp_id IS NOT NULL
-                GROUP BY sticky_target.author_camp_id, 
-                         sv.vote_type, 
-                         sv.voter_camp_id
-            )
-            SELECT 
-                target_camp_id,
-                vote_type,
-                voter_camp_id,
-                vote_count,
-                target_students,
-                voter_students,
-                c1.camp_name as target_camp_name,
-                c2.camp_name as voter_camp_name
-            FROM vote_summary
-            LEFT JOIN camps c1 ON vote_summary.target_camp_id = c1.camp_id AND vote_summary.theme_id = c1.theme_id
-            LEFT JOIN camps c2 ON vote_summary.voter_camp_id = c2.camp_id AND vote_summary.theme_id = c2.theme_id
-        ''', (school_id, theme_id))
-        
-        print("\n=== Raw Vote Data ===")
-        print("Target Camp | Vote Type | Voter Camp | Count | Target Camp Name | Voter Camp Name | Target Students | Voter Students")
-        
-        vote_data = c.fetchall()
-        for row in vote_data:
-            # Columns: 0 target_camp_id | 1 vote_type | 2 voter_camp_id | 3 count | 4 target_students | 5 voter_students | 6 target_camp_name | 7 voter_camp_name
-            target_camp_str   = row[0] if row[0] is not None else 'None'
-            vote_type_str     = row[1] if row[1] is not None else 'None'
-            voter_camp_str    = row[2] if row[2] is not None else 'None'
-            count_str         = row[3] if row[3] is not None else 'None'
-            target_camp_name  = row[6] if len(row) > 6 and row[6] is not None else 'None'
-            voter_camp_name   = row[7] if len(row) > 7 and row[7] is not None else 'None'
-            target_students   = row[4] if row[4] is not None else 'None'
-            voter_students    = row[5] if row[5] is not None else 'None'
-
-            print(f"{str(target_camp_str):^11}|{str(vote_type_str):^11}|{str(voter_camp_str):^11}|{str(count_str):^7}|{str(target_camp_name):^15}|{str(voter_camp_name):^15}|{str(target_students):^20}|{str(voter_students):^20}")
-        
-        # 陣営別得点計算
-        camp_scores = {}
-
-        # すべての陣営の得点を0に初期化
-        c.execute('SELECT camp_id FROM camps WHERE theme_id = ? ORDER BY camp_id', (theme_id,))
-        camp_rows = c.fetchall()
-        if not camp_rows:
-            print(f"Warning: No camps found for theme_id {theme_id}")
-            return jsonify({'error': 'テーマに対する陣営が見つかりません'}), 404
-
-        theme_camp_ids = [row[0] for row in camp_rows if row[0] is not None]
-        for camp_id in theme_camp_ids:
-            camp_scores[camp_id] = 0
-
-        # 学生や付箋に保存されている 1/2 の論理IDを、このテーマの実際の camp_id にマッピング
-        camp_id_map = {}
-        if len(theme_camp_ids) >= 2:
-            camp_id_map = {1: theme_camp_ids[0], 2: theme_camp_ids[1]}
-        print("\nInitialized camp scores:", camp_scores)
-        print("Camp ID map (logical -> actual):", camp_id_map)
-        
-        for row in vote_data:
-            try:
-                target_camp_id = int(row[0]) if row[0] is not None else None
-                vote_type = row[1]
-                voter_camp_id = int(row[2]) if row[2] is not None else None
-                vote_count = int(row[3]) if row[3] is not None else 0
-                
-                print(f"\nProcessing vote row:")
-                print(f"- Raw data: {row}")
-                print(f"- Converted target_camp_id: {target_camp_id} ({type(target_camp_id)})")
-                print(f"- Converted voter_camp_id: {voter_camp_id} ({type(voter_camp_id)})")
-                print(f"- Converted vote_count: {vote_count} ({type(vote_count)})")
-                
-                if target_camp_id in camp_id_map:
-                    original_target = target_camp_id
-                    target_camp_id = camp_id_map[target_camp_id]
-                    print(f"- Mapped target_camp_id: {original_target} -> {target_camp_id}")
-                if voter_camp_id in camp_id_map:
-                    original_voter = voter_camp_id
-                    voter_camp_id = camp_id_map[voter_camp_id]
-                    print(f"- Mapped voter_camp_id: {original_voter} -> {voter_camp_id}")
-                
-                if target_camp_id is None or voter_camp_id is None:
-                    print("Warning: Skipping vote due to missing camp IDs")
-                    continue
-                
-                if target_camp_id not in camp_scores:
-                    print(f"Warning: Initializing score for unknown camp_id {target_camp_id}")
-                    camp_scores[target_camp_id] = 0
-            except (TypeError, ValueError) as e:
-                print(f"Error processing vote row: {e}")
-                continue
-            
-            print(f"\n=== Processing Vote ===")
-            print(f"Target Camp ID: {target_camp_id}")
-            print(f"Voter Camp ID: {voter_camp_id}")
-            print(f"Vote Type: {vote_type}")
-            print(f"Vote Count: {vote_count}")
-            
-            # 同陣営判定はNULLを同陣営とみなさない
-            is_same_camp = False
-            try:
-                if target_camp_id is not None and voter_camp_id is not None:
-                    is_same_camp = (str(target_camp_id) == str(voter_camp_id))
-                    print(f"Comparing camp IDs: {target_camp_id} ({type(target_camp_id)}) == {voter_camp_id} ({type(voter_camp_id)})")
-            except (TypeError, ValueError) as e:
-                print(f"Error in camp comparison: {e}")
-                print(f"target_camp_id type: {type(target_camp_id)}")
-                print(f"voter_camp_id type: {type(voter_camp_id)}")
-                is_same_camp = False
-            
-            print(f"\n=== Processing Vote ===")
-            print(f"Target Camp ID: {target_camp_id}")
-            print(f"Voter Camp ID: {voter_camp_id}")
-            print(f"Vote Type: {vote_type}")
-            print(f"Vote Count: {vote_count}")
-            
-            # 得点の変化を計算する
-            score_change = 0
-            
-            # 同陣営判定の詳細をログ出力
-            print(f"\n=== Vote Processing ===")
-            print(f"Target Camp: {target_camp_id} ({row[6] if row[6] is not None else 'None'})")  # camp_name from query
-            print(f"Voter Camp: {voter_camp_id} ({row[7] if row[7] is not None else 'None'})")    # camp_name from query
-            print(f"Vote Type: {vote_type}")
-            print(f"Vote Count: {vote_count}")
-            print(f"Target Students: {row[4] if row[4] is not None else 'None'}")
-            print(f"Voter Students: {row[5] if row[5] is not None else 'None'}")
-            
-            print(f"\nSame Camp Check:")
-            print(f"- Target Camp ID exists: {target_camp_id is not None}")
-            print(f"- Voter Camp ID exists: {voter_camp_id is not None}")
-            print(f"- Camp IDs match: {target_camp_id == voter_camp_id}")
-            print(f"- Final is_same_camp: {is_same_camp}")
-            
-            # 得点計算のルール表示
-            print("\nScoring Rules:")
-            if is_same_camp:
-                print("Same Camp Rules:")
-                print("- A vote: +2 points")
-                print("- B vote: +1 point")
-                print("- C vote: -1 point")
-            else:
-                print("Enemy Camp Rules:")
-                print("- A vote: +6 points")
-                print("- B vote: +3 points")
-                print("- C vote: -1 point")
-            
-            # 実際の得点計算
-            try:
-                if target_camp_id is None or voter_camp_id is None:
-                    print(f"Warning: Skipping vote due to missing camp IDs - target: {target_camp_id}, voter: {voter_camp_id}")
-                    continue
-
-                if is_same_camp:
-                    if vote_type == 'A':
-                        score_change = int(vote_count) * 2
-                    elif vote_type == 'B':
-                        score_change = int(vote_count) * 1
-                    elif vote_type == 'C':
-                        score_change = int(vote_count) * (-1)
-                else:
-                    if vote_type == 'A':
-                        score_change = int(vote_count) * 6
-                    elif vote_type == 'B':
-                        score_change = int(vote_count) * 3
-                    elif vote_type == 'C':
-                        score_change = int(vote_count) * (-1)
-            except (TypeError, ValueError) as e:
-                print(f"Error in score calculation: {e}")
-                print(f"vote_count type: {type(vote_count)}")
-                print(f"vote_count value: {vote_count}")
-                continue
-            
-            print(f"\nScore Calculation:")
-            print(f"- Vote type: {vote_type}")
-            print(f"- Vote count: {vote_count}")
-            print(f"- Multiplier: {score_change / vote_count if vote_count else 0}")
-            print(f"- Score change: {score_change}")
-            
-            # 得点を更新し、ログを出力する
-            old_score = camp_scores[target_camp_id]
-            camp_scores[target_camp_id] += score_change
-            print(f"\nScore Update:")
-            print(f"- Old score: {old_score}")
-            print(f"- Score change: {score_change}")
-            print(f"- New score: {camp_scores[target_camp_id]}")
-            print(f"\nVote calculation:")
-            print(f"- Target Camp: {target_camp_id}")
-            print(f"- Voter Camp: {voter_camp_id}")
-            print(f"- Vote Type: {vote_type}")
-            print(f"- Count: {vote_count}")
-            print(f"- Is Same Camp: {is_same_camp}")
-            print(f"- Score Change: {score_change}")
-            print(f"- Old Score: {old_score}")
-            print(f"- New Score: {camp_scores[target_camp_id]}")
-            
-            # デバッグ用ログ出力
-            print(f"Vote calculation - Target Camp: {target_camp_id}, Voter Camp: {voter_camp_id}, Vote Type: {vote_type}, Count: {vote_count}, Is Same Camp: {is_same_camp}, Current Score: {camp_scores[target_camp_id]}")
-        
-        # 陣営一覧を取得（投票が無い陣営も0点で返す）
-        c.execute('''
-            SELECT camp_id, camp_name
-              FROM camps
-             WHERE theme_id = ?
-             ORDER BY camp_id
-        ''', (theme_id,))
-
-        camp_rows = c.fetchall()
-
         # 結果をフォーマット（全陣営を必ず返却）
+        camp_scores = {}
         result = []
-        print("\n=== Final Scores ===")
-        print("Camp ID | Camp Name | Raw Score | Percentage")
-        print("-" * 60)
-        
-        # 総得点（絶対値の合計）を計算
-        total_abs_score = sum(abs(score) for score in camp_scores.values())
-        
         for row in camp_rows:
-            camp_id = row[0]
-            camp_name = row[1]
-            score = camp_scores.get(camp_id, 0)
-            
-            # パーセンテージ計算（総得点が0の場合は50%）
-            percentage = 50
-            if total_abs_score > 0:
-                percentage = (abs(score) / total_abs_score) * 100
-            
-            print(f"{camp_id if camp_id is not None else 'None':^7}|{camp_name if camp_name is not None else 'None':^10}|{score if score is not None else 'None':^10}|{percentage:^10.1f}%")
-            
+            camp_id = row['camp_id']
+            camp_name = row['camp_name']
+            score = row['score']
+            camp_scores[camp_id] = score
             result.append({
                 'camp_id': camp_id,
                 'camp_name': camp_name or f'陣営{camp_id if camp_id is not None else "Unknown"}',
                 'score': score
             })
 
-        # debate_settings に合計点と勝者を保存
-        if len(camp_rows) >= 2:
-            camp1_id, camp1_name = camp_rows[0][0], camp_rows[0][1]
-            camp2_id, camp2_name = camp_rows[1][0], camp_rows[1][1]
-            team1_score = float(camp_scores.get(camp1_id, 0))
-            team2_score = float(camp_scores.get(camp2_id, 0))
-
-            if team1_score > team2_score:
-                winner_name = camp1_name
-            elif team2_score > team1_score:
-                winner_name = camp2_name
-            else:
-                winner_name = 'draw'
-
-            c.execute('''
-                UPDATE debate_settings
-                   SET winner = ?, team1_score = ?, team2_score = ?
-                 WHERE theme_id = ?
-            ''', (winner_name, team1_score, team2_score, theme_id))
-            conn.commit()
-
-        # === 学生ポイント集計をここで実施（自分が受けた評価のみ） ===
-        try:
-            c.execute('''
-                SELECT 
-                    s.student_id,
-                    s.name,
-                    s.sum_point as current_sum_point,
-                    s.have_point as current_have_point,
-                    s.camp_id as student_camp_id,
-                    sv.vote_type,
-                    sv.voter_camp_id,
-                    COUNT(*) as vote_count
-                FROM sticky st
-                JOIN students s ON st.student_id = s.student_id
-                JOIN sticky_votes sv ON st.sticky_id = sv.sticky_id
-                WHERE s.school_id = ? AND st.theme_id = ?
-                  AND st.author_camp_id IS NOT NULL
-                  AND sv.voter_camp_id IS NOT NULL
-                GROUP BY s.student_id, sv.vote_type, sv.voter_camp_id
-                ORDER BY s.student_id, sv.vote_type
-            ''', (school_id, theme_id))
-
-            per_student_rows = c.fetchall()
-
-            per_student_points = {}
-            for row in per_student_rows:
-                student_id = row[0]
-                current_sum = row[2] or 0
-                current_have = row[3] or 0
-                student_camp_id = row[4]
-                vote_type = row[5]
-                voter_camp_id = row[6]
-                vote_count = int(row[7] or 0)
-
-                if student_id not in per_student_points:
-                    per_student_points[student_id] = {
-                        'sum': current_sum,
-                        'have': current_have,
-                        'add': 0
-                    }
-
-                same = (student_camp_id == voter_camp_id)
-                add = 0
-                if same:
-                    if vote_type == 'A':
-                        add = vote_count * 10
-                    elif vote_type == 'B':
-                        add = vote_count * 5
-                    elif vote_type == 'C':
-                        add = vote_count * (-5)
-                else:
-                    if vote_type == 'A':
-                        add = vote_count * 30
-                    elif vote_type == 'B':
-                        add = vote_count * 15
-                    elif vote_type == 'C':
-                        add = vote_count * (-5)
-
-                per_student_points[student_id]['add'] += add
-
-            # DB更新
-            for sid, data in per_student_points.items():
-                new_sum = data['sum'] + data['add']
-                new_have = data['have'] + data['add']
-                c.execute('UPDATE students SET sum_point = ?, have_point = ? WHERE student_id = ?', (new_sum, new_have, sid))
-
-            if per_student_points:
-                conn.commit()
-        except Exception as e:
-            print(f"Warning: per-student aggregation failed: {e}")
-        
         conn.close()
-        return jsonify({
+        response = jsonify({
             'status': 'success',
             'scores': result
         })
+        # 読み取り専用なので短時間ならキャッシュしてよい
+        response.headers['Cache-Control'] = 'public, max-age=1'
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# テーマの精算API（勝敗の記録と学生ポイントの付与。テーマごとに1回だけ実行される）
+@app.route('/api/camps/settle/<school_id>/<int:theme_id>', methods=['POST'])
+def settle_camp_scores(school_id, theme_id):
+    try:
+        conn = get_db_connection()
+        result = settle_theme(conn, school_id, theme_id)
+        conn.close()
+        if result is None:
+            return jsonify({'status': 'already_settled', 'message': 'このテーマは精算済みです'})
+        return jsonify({'status': 'success', 'settlement': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # （統合済みのため削除）
 
 app.register_blueprint(message_o)
@@ -882,7 +716,7 @@ app.register_blueprint(message_o)
 # 基本的なヘルスチェック用エンドポイント
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'message': 'サーバーは正常に動作しています'}), 200
+    return jsonify({'status': 'ok', 'message': 'サーバーは正常に動作しています', 'db_pool': pool_stats()}), 200
 
 
 
@@ -918,8 +752,10 @@ def check_theme_status():
                    SET camp_id = NULL
                  WHERE school_id = ?
             ''', (school_id,))
+            log_change(conn, 'students', school_id)
             conn.commit()
             conn.close()
+            resource_version.bump(('student_camps',))
             return jsonify({'message': '討論が終了し、陣営選択がクリアされました'})
 
         conn.close()
@@ -930,15 +766,17 @@ def check_theme_status():
 
 @socketio.on('join_sticky_chat')
 def handle_join_sticky_chat(data):
-    """付箋チャットに参加"""
+    """付箋チャットに参加（student_id を渡すと自分宛てのAIアドバイスも受け取る）"""
     sticky_id = data.get('sticky_id')
     if sticky_id:
         from flask_socketio import join_room
         room_name = f"sticky_{sticky_id}"
         join_room(room_name)
-        print(f"DEBUG: Client joined sticky chat room: {room_name}")
+        if data.get('student_id'):
+            join_room(advice_room(sticky_id, data['student_id']))
+        socket_log.debug("Client joined sticky chat room: %s", room_name)
     else:
-        print(f"DEBUG: join_sticky_chat called without sticky_id: {data}")
+        socket_log.debug("join_sticky_chat called without sticky_id: %s", data)
 
 @socketio.on('leave_sticky_chat')
 def handle_leave_sticky_chat(data):
@@ -948,9 +786,27 @@ def handle_leave_sticky_chat(data):
         from flask_socketio import leave_room
         room_name = f"sticky_{sticky_id}"
         leave_room(room_name)
-        print(f"DEBUG: Client left sticky chat room: {room_name}")
+        if data.get('student_id'):
+            leave_room(advice_room(sticky_id, data['student_id']))
+        socket_log.debug("Client left sticky chat room: %s", room_name)
     else:
-        print(f"DEBUG: leave_sticky_chat called without sticky_id: {data}")
+        socket_log.debug("leave_sticky_chat called without sticky_id: %s", data)
+
+@socketio.on('request_ai_advice')
+def handle_request_ai_advice(data):
+    """AIアドバイスの生成を依頼し、生成途中の部分を ai_advice_chunk、完了を ai_advice_done で返す"""
+    sticky_id = data.get('sticky_id')
+    student_id = data.get('student_id')
+    school_id = data.get('school_id')
+    if not sticky_id or not student_id or not school_id:
+        emit('ai_advice_done', {
+            'sticky_id': sticky_id,
+            'student_id': student_id,
+            'advice': None,
+            'error': 'sticky_id、student_id、school_idが必要です'
+        })
+        return
+    advice_debouncer.request(sticky_id, student_id, school_id, sid=request.sid)
 
 @socketio.on('send_message')
 def handle_send_message(data):
@@ -958,7 +814,7 @@ def handle_send_message(data):
     required_fields = ['student_id', 'message_content', 'camp_id', 'sticky_id']
     for field in required_fields:
         if field not in data:
-            print(f"DEBUG: send_message missing field: {field}")
+            socket_log.debug("send_message missing field: %s", field)
             return
     
     
@@ -1071,11 +927,27 @@ def get_camp(camp_id):
 # Socket.IO イベント処理
 @socketio.on('connect')
 def handle_connect():
-    print('DEBUG: Client connected')
+    socket_log.debug('Client connected')
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('DEBUG: Client disconnected')
+    socket_log.debug('Client disconnected')
+
+@socketio.on('move_sticky')
+def handle_move_sticky(data):
+    """付箋のドラッグ中の位置を受け取る（drag_end: true でドラッグ終了）
+
+    位置はまとめて sticky_positions イベントで同校に送信し、データベースにもまとめて保存する。
+    """
+    position = parse_position(data) if isinstance(data, dict) else None
+    if not position:
+        socket_log.debug("move_sticky with invalid data: %s", data)
+        return
+    sticky_id, x, y = position
+    school_id = sticky_positions.school_of(sticky_id)
+    if school_id is None:
+        return
+    sticky_positions.update(sticky_id, school_id, x, y, final=bool(data.get('drag_end')))
 
 @socketio.on('join_school')
 def handle_join_school(data):
@@ -1083,11 +955,13 @@ def handle_join_school(data):
     school_id = data.get('school_id')
     if school_id:
         from flask_socketio import join_room
-        room_name = f"school_{school_id}"
+        # sticky_delta: true のクライアントには sticky_updated を差分で送る
+        room_name, delta_room, full_room = school_rooms(school_id)
         join_room(room_name)
-        print(f"DEBUG: Client joined school room: {room_name}")
+        join_room(delta_room if data.get('sticky_delta') else full_room)
+        socket_log.debug("Client joined school room: %s", room_name)
     else:
-        print(f"DEBUG: join_school called without school_id: {data}")
+        socket_log.debug("join_school called without school_id: %s", data)
 
 @socketio.on('leave_school')
 def handle_leave_school(data):
@@ -1095,23 +969,52 @@ def handle_leave_school(data):
     school_id = data.get('school_id')
     if school_id:
         from flask_socketio import leave_room
-        room_name = f"school_{school_id}"
-        leave_room(room_name)
-        print(f"DEBUG: Client left school room: {room_name}")
+        for room_name in school_rooms(school_id):
+            leave_room(room_name)
+        socket_log.debug("Client left school room: %s", f"school_{school_id}")
+    else:
+        socket_log.debug("leave_school called without school_id: %s", data)
+
+@socketio.on('resync_board')
+def handle_resync_board(data):
+    """再接続したクライアントに、最後に受け取った seq より後のボードのイベントを送り直す
+
+    data: {school_id, last_seq, epoch}
+    board_resync で {school_id, epoch, latest_seq, events: [{seq, event, data}]} を返す。
+    保持している範囲より古い・epoch が違う（サーバーが再起動した）場合は snapshot_required: true を返すので、
+    クライアントは GET /api/sticky で全件を取得し直す。
+    """
+    school_id = data.get('school_id') if isinstance(data, dict) else None
+    if not school_id:
+        socket_log.debug("resync_board called without school_id: %s", data)
+        return
+    try:
+        last_seq = int(data.get('last_seq') or 0)
+    except (TypeError, ValueError):
+        last_seq = -1
+    events = None
+    if last_seq >= 0 and data.get('epoch') == board_events.epoch:
+        events = board_events.since(school_id, last_seq)
+    response = {'school_id': school_id, 'epoch': board_events.epoch}
+    if events is None:
+        response.update(snapshot_required=True, latest_seq=board_events.latest(school_id))
     else:
-        print(f"DEBUG: leave_school called without school_id: {data}")
+        response.update(
+            latest_seq=events[-1][0] if events else last_seq,
+            events=[{'seq': seq, 'event': event, 'data': dict(payload, seq=seq)} for seq, event, payload in events])
+    socket_log.debug("Resync school %s from seq %s: %s", school_id, last_seq,
+                     'snapshot' if events is None else f"{len(events)} events")
+    emit('board_resync', response)
 
 # 投票状態API
 @app.route('/api/sticky/<int:sticky_id>/vote-status/<int:student_id>', methods=['GET'])
 def get_vote_status(sticky_id, student_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # ユーザーが投票したかどうかを確認
-        c.execute('''SELECT vote_type FROM sticky_votes 
-                     WHERE student_id = ? AND sticky_id = ?''', 
-                  (student_id, sticky_id))
+        c.execute(sticky_list.VOTE_STATUS_SQL, (student_id, sticky_id))
         
         vote_record = c.fetchone()
         
@@ -1151,23 +1054,25 @@ def submit_feedback(sticky_id):
         if feedback_type not in ['A', 'B', 'C']:
             return jsonify({'error': '無効な feedback_type です'}), 400
         
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # 自分のstickyには投票できない
-        c.execute('''SELECT student_id FROM sticky WHERE sticky_id = ?''', (sticky_id,))
+        c.execute('SELECT student_id, school_id, theme_id, author_camp_id FROM sticky WHERE sticky_id = ?', (sticky_id,))
         sticky_author = c.fetchone()
         
         if not sticky_author:
             conn.close()
             return jsonify({'error': 'Sticky not found'}), 404
         
+        school_id, theme_id, author_camp_id = sticky_author[1], sticky_author[2], sticky_author[3]
+        
         if sticky_author[0] == student_id:
             conn.close()
             return jsonify({'error': '自分の付箋には投票できません'}), 400
         
         # 既存の投票を確認
-        c.execute('''SELECT vote_type FROM sticky_votes 
+        c.execute('''SELECT vote_type, voter_camp_id FROM sticky_votes 
                      WHERE student_id = ? AND sticky_id = ?''', 
                   (student_id, sticky_id))
         
@@ -1182,7 +1087,7 @@ def submit_feedback(sticky_id):
                          WHERE sticky_id = ?''', (sticky_id,))
             
             # 新しい投票のカウントを増やす
-            c.execute(f'''UPDATE sticky SET feedback_{feedback_type} = feedback_{feedback_type} + 1 
+            c.execute(f'''UPDATE sticky SET feedback_{feedback_type} = feedback_{feedback_type} + 1, version = version + 1 
                          WHERE sticky_id = ?''', (sticky_id,))
             
             # 投票者と付箋作成者の陣営IDを取得
@@ -1203,10 +1108,9 @@ def submit_feedback(sticky_id):
             voter_camp_id = camp_info[0]
             target_camp_id = camp_info[1]
             
-            print(f"\n=== Vote Update Info ===")
-            print(f"Voter Camp ID: {voter_camp_id}")
-            print(f"Target Camp ID: {target_camp_id}")
-            print(f"Vote Type: {feedback_type}")
+            vote_log.debug("Vote updated", extra={'fields': {
+                'sticky_id': sticky_id, 'voter_camp_id': voter_camp_id,
+                'target_camp_id': target_camp_id, 'vote_type': feedback_type}})
             
             # 投票記録を更新（投票時の陣営IDも更新）
             c.execute('''UPDATE sticky_votes 
@@ -1215,6 +1119,11 @@ def submit_feedback(sticky_id):
                             created_at = datetime('now', '+9 hours')
                         WHERE student_id = ? AND sticky_id = ?''', 
                       (feedback_type, voter_camp_id, student_id, sticky_id))
+            
+            # 陣営別得点を差し替え（古い投票分を引いて新しい投票分を足す）
+            camp_map = camp_id_map(c, theme_id)
+            apply_vote(c, school_id, theme_id, author_camp_id, existing_vote[1], old_vote_type, -1, camp_map)
+            apply_vote(c, school_id, theme_id, author_camp_id, voter_camp_id, feedback_type, 1, camp_map)
         else:
             # 投票者と付箋作成者の陣営IDを取得
             c.execute('''
@@ -1234,42 +1143,50 @@ def submit_feedback(sticky_id):
             voter_camp_id = camp_info[0]
             target_camp_id = camp_info[1]
             
-            print(f"\n=== Vote Info ===")
-            print(f"Voter Camp ID: {voter_camp_id}")
-            print(f"Target Camp ID: {target_camp_id}")
-            print(f"Vote Type: {feedback_type}")
+            vote_log.debug("Vote added", extra={'fields': {
+                'sticky_id': sticky_id, 'voter_camp_id': voter_camp_id,
+                'target_camp_id': target_camp_id, 'vote_type': feedback_type}})
             
             # 新しい投票を追加
-            c.execute(f'''UPDATE sticky SET feedback_{feedback_type} = feedback_{feedback_type} + 1 
+            c.execute(f'''UPDATE sticky SET feedback_{feedback_type} = feedback_{feedback_type} + 1, version = version + 1 
                          WHERE sticky_id = ?''', (sticky_id,))
             
             # 投票記録を追加（投票時の陣営IDを保存）
             c.execute('''INSERT INTO sticky_votes (student_id, sticky_id, vote_type, voter_camp_id) 
                          VALUES (?, ?, ?, ?)''', (student_id, sticky_id, feedback_type, voter_camp_id))
+            
+            # 陣営別得点に加算
+            apply_vote(c, school_id, theme_id, author_camp_id, voter_camp_id, feedback_type)
+        
+        board_version = sticky_changes.mark_sticky_changed(c, sticky_id)
         
         # 更新後のフィードバック数を取得
-        c.execute('''SELECT feedback_A, feedback_B, feedback_C FROM sticky 
+        c.execute('''SELECT feedback_A, feedback_B, feedback_C, version FROM sticky 
                      WHERE sticky_id = ?''', (sticky_id,))
         
         feedback_counts = c.fetchone()
         
-        # 同校の全ユーザーに更新情報を送信
-        c.execute('''SELECT st.school_id FROM sticky s
-                     JOIN students st ON s.student_id = st.student_id
-                     WHERE s.sticky_id = ?''', (sticky_id,))
-        school_result = c.fetchone()
-        
         conn.commit()
         conn.close()
+        resource_version.bump_board(school_id, theme_id)
+        if hot_boards:
+            hot_boards.apply(school_id, theme_id, board_version, {
+                'sticky_id': sticky_id,
+                'feedback_A': feedback_counts[0],
+                'feedback_B': feedback_counts[1],
+                'feedback_C': feedback_counts[2],
+                'version': feedback_counts[3]
+            })
         
-        # Socket.IOでフィードバック更新を通知
-        if school_result:
-            socketio.emit('feedback_updated', {
+        # Socket.IOで同校の全ユーザーにフィードバック更新を通知
+        if school_id is not None:
+            emit_board_event('feedback_updated', {
                 'sticky_id': sticky_id,
                 'feedback_A': feedback_counts[0],
                 'feedback_B': feedback_counts[1],
-                'feedback_C': feedback_counts[2]
-            }, to=f"school_{school_result[0]}")
+                'feedback_C': feedback_counts[2],
+                'version': feedback_counts[3]
+            }, school_id)
         
         return jsonify({
             'status': 'success',
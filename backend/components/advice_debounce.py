@@ -0,0 +1,163 @@
+"""AIアドバイスの再生成を (sticky_id, student_id) ごとにまとめる
+
+メッセージが続けて送られたときは、最後の依頼から ADVICE_QUIET_SECONDS 経つまで待ってから
+1回だけ生成する（最初の依頼から ADVICE_MAX_WAIT_SECONDS を超えては待たない）。
+待っている間の依頼はすべて同じ生成結果を受け取る（single-flight）。
+生成中に来た依頼は、生成後にもう1回だけまとめて生成する。
+依頼に Socket.IO の sid を付けると、生成途中の部分（on_chunk）と完了（on_done）をその sid に送る。
+"""
+import os
+import threading
+import time
+
+from components.logger import get_logger
+from components.metrics import counter, histogram
+
+log = get_logger('advice')
+
+# 最後の依頼からこの時間だけ新しい依頼が無ければ生成する（秒）
+ADVICE_QUIET_SECONDS = float(os.getenv('ADVICE_QUIET_SECONDS', '1.5'))
+# 最初の依頼からこの時間を超えては待たない（秒）
+ADVICE_MAX_WAIT_SECONDS = float(os.getenv('ADVICE_MAX_WAIT_SECONDS', '5'))
+
+ADVICE_REQUESTS = counter(
+    'ai_advice_requests_total', 'AI advice regeneration requests', ('result',))
+ADVICE_BATCH_SIZE = histogram(
+    'ai_advice_coalesced_requests', 'Requests served by one advice generation',
+    buckets=(1, 2, 3, 5, 8, 13, 21))
+
+
+class AdviceFlight:
+    """1回の生成の結果を待つ依頼者で共有する"""
+
+    def __init__(self, first_requested_at, school_id):
+        self.first_requested_at = first_requested_at
+        self.school_id = school_id
+        self.requests = 0
+        # 生成途中の部分を受け取る Socket.IO の sid
+        self.sids = set()
+        self.timer = None
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """生成を待って結果を返す。時間切れなら None、生成に失敗していれば例外を投げる"""
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class AdviceDebouncer:
+    def __init__(self, generate, on_ready=None, quiet=ADVICE_QUIET_SECONDS, max_wait=ADVICE_MAX_WAIT_SECONDS):
+        # generate(sticky_id, student_id, school_id, on_chunk=None) -> アドバイス
+        # on_ready(sticky_id, student_id, advice) -> 生成後の通知（Socket.IO の送信など）
+        # on_chunk(sids, sticky_id, student_id, chunk) -> 生成途中の部分の送信
+        # on_done(sids, sticky_id, student_id, advice, error) -> sid 付きの依頼への完了の送信
+        self.generate = generate
+        self.on_ready = on_ready
+        self.on_chunk = None
+        self.on_done = None
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._pending = {}   # key -> まだ生成を始めていない AdviceFlight
+        self._running = {}   # key -> 生成中の AdviceFlight
+
+    def request(self, sticky_id, student_id, school_id, sid=None):
+        """生成を依頼して、結果を待つための AdviceFlight を返す（sid を渡すと途中経過をその sid に送る）"""
+        key = (sticky_id, student_id)
+        now = time.monotonic()
+        with self._lock:
+            flight = self._pending.get(key)
+            if flight is None:
+                flight = self._pending[key] = AdviceFlight(now, school_id)
+                ADVICE_REQUESTS.inc(result='scheduled')
+            else:
+                flight.timer.cancel()
+                ADVICE_REQUESTS.inc(result='coalesced')
+            flight.requests += 1
+            if sid:
+                flight.sids.add(sid)
+
+            # 生成中なら、その生成が終わってから次を始める（_finish で再設定する）
+            if key in self._running:
+                flight.timer = _NoTimer()
+                return flight
+            self._schedule(key, flight, now)
+            return flight
+
+    def _schedule(self, key, flight, now):
+        delay = min(self.quiet, max(0.0, flight.first_requested_at + self.max_wait - now))
+        flight.timer = threading.Timer(delay, self._run, args=(key,))
+        flight.timer.daemon = True
+        flight.timer.start()
+
+    def _run(self, key):
+        with self._lock:
+            flight = self._pending.get(key)
+            # 取り消した後に動き出したタイマーは何もしない
+            if flight is None or flight.timer is not threading.current_thread():
+                return
+            del self._pending[key]
+            self._running[key] = flight
+        ADVICE_BATCH_SIZE.observe(flight.requests)
+
+        sticky_id, student_id = key
+        sids = frozenset(flight.sids)
+        try:
+            if sids and self.on_chunk:
+                advice = self.generate(sticky_id, student_id, flight.school_id,
+                                       on_chunk=lambda chunk: self._push_chunk(sids, key, chunk))
+            else:
+                advice = self.generate(sticky_id, student_id, flight.school_id)
+        except Exception as e:
+            log.warning("Advice generation failed for %s: %s", key, e)
+            flight.finish(error=e)
+            self._push_done(sids, key, None, e)
+        else:
+            flight.finish(result=advice)
+            self._push_done(sids, key, advice, None)
+            if self.on_ready:
+                try:
+                    self.on_ready(sticky_id, student_id, advice)
+                except Exception as e:
+                    log.warning("Failed to push advice for %s: %s", key, e)
+        finally:
+            self._finish(key)
+
+    def _push_chunk(self, sids, key, chunk):
+        try:
+            self.on_chunk(sids, key[0], key[1], chunk)
+        except Exception as e:
+            log.warning("Failed to push advice chunk for %s: %s", key, e)
+
+    def _push_done(self, sids, key, advice, error):
+        if not sids or not self.on_done:
+            return
+        try:
+            self.on_done(sids, key[0], key[1], advice, error)
+        except Exception as e:
+            log.warning("Failed to push advice completion for %s: %s", key, e)
+
+    def _finish(self, key):
+        with self._lock:
+            self._running.pop(key, None)
+            # 生成中に依頼が来ていれば、続けて生成を予約する
+            waiting = self._pending.get(key)
+            if waiting is not None and isinstance(waiting.timer, _NoTimer):
+                self._schedule(key, waiting, time.monotonic())
+
+
+class _NoTimer:
+    """生成中のため、まだタイマーを設定していない状態"""
+
+    def cancel(self):
+        pass
@@ -1,14 +1,13 @@
 from flask import jsonify, request
-import sqlite3
 from flask import Blueprint
-from components.init import get_db_connection
+from components.db import get_db_connection
 
 ai_advice_o = Blueprint('ai_advice_o', __name__, url_prefix='/api')
 
 @ai_advice_o.route('/students/<int:student_id>/ai-advice', methods=['GET'])
 def get_student_ai_advice(student_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # Get the ai_advice status for the student
@@ -43,7 +42,7 @@ def update_student_ai_advice(student_id):
         # Convert boolean to integer for database storage
         ai_advice_value = 1 if ai_advice else 0
         
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         c.execute('''UPDATE students SET ai_advice = ? WHERE student_id = ?''', 
@@ -0,0 +1,165 @@
+"""Gemini の応答（付箋の要約・AIアドバイス）のキャッシュ
+
+プロセス内の LRU と SQLite の ai_cache テーブルの2段構成。
+キーは「プロンプトのテンプレートのバージョン・モデル名・正規化した入力」のハッシュなので、
+プロンプトを変えたときはテンプレートのバージョンを上げれば古いキャッシュは使われなくなる。
+"""
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from components.db import get_db_connection
+from components.logger import get_logger
+from components.metrics import counter
+
+log = get_logger('ai_cache')
+
+# キャッシュの有効期間（秒）
+AI_CACHE_TTL_SECONDS = int(os.getenv('AI_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+# プロセス内 LRU の最大件数
+AI_CACHE_MEMORY_SIZE = int(os.getenv('AI_CACHE_MEMORY_SIZE', '1024'))
+# ai_cache テーブルの最大行数
+AI_CACHE_MAX_ROWS = int(os.getenv('AI_CACHE_MAX_ROWS', '20000'))
+# 何回書き込むごとにテーブルの掃除（期限切れ・上限超過の削除）をするか
+AI_CACHE_PRUNE_EVERY = 100
+# キャッシュを引くクエリ（components.query_plan でも確認する）
+CACHE_GET_SQL = 'SELECT value FROM ai_cache WHERE cache_key = ? AND expires_at > ?'
+
+AI_CACHE_REQUESTS = counter(
+    'ai_cache_requests_total', 'AI response cache lookups', ('kind', 'result'))
+
+
+def normalize(text):
+    """全角/半角・空白の違いだけの入力が同じキーになるように正規化"""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').split())
+
+
+def make_key(kind, template_version, model, text):
+    raw = '\x1f'.join([kind, str(template_version), model, normalize(text)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _LRU:
+    """有効期限付きの LRU（スレッドセーフ）"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_memory = _LRU(AI_CACHE_MEMORY_SIZE)
+_write_count = 0
+_write_lock = threading.Lock()
+
+
+def _db_get(key, now):
+    conn = get_db_connection()
+    try:
+        row = conn.execute(CACHE_GET_SQL, (key, now)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def _db_put(kind, key, value, now, expires_at):
+    global _write_count
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            INSERT INTO ai_cache (cache_key, kind, value, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(cache_key) DO UPDATE
+               SET value = excluded.value, created_at = excluded.created_at, expires_at = excluded.expires_at
+        ''', (key, kind, value, now, expires_at))
+        with _write_lock:
+            _write_count += 1
+            prune = _write_count % AI_CACHE_PRUNE_EVERY == 0
+        if prune:
+            _prune(conn, now)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _prune(conn, now):
+    """期限切れの行と、上限を超えた古い行を削除"""
+    conn.execute('DELETE FROM ai_cache WHERE expires_at <= ?', (now,))
+    conn.execute('''
+        DELETE FROM ai_cache WHERE cache_key IN (
+            SELECT cache_key FROM ai_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+        )
+    ''', (AI_CACHE_MAX_ROWS,))
+
+
+def lookup(kind, template_version, model, text):
+    """キャッシュだけを引く（無ければ None）。モデルは呼ばない"""
+    key = make_key(kind, template_version, model, text)
+    now = time.time()
+    value = _memory.get(key, now)
+    if value is not None:
+        AI_CACHE_REQUESTS.inc(kind=kind, result='hit_memory')
+        return value
+    try:
+        value = _db_get(key, now)
+    except Exception as e:
+        log.warning("Failed to read ai_cache: %s", e)
+        value = None
+    if value is not None:
+        AI_CACHE_REQUESTS.inc(kind=kind, result='hit_db')
+        # テーブルの期限までは使えるが、簡単のためメモリには TTL 分で載せる
+        _memory.put(key, value, now + AI_CACHE_TTL_SECONDS)
+        return value
+    AI_CACHE_REQUESTS.inc(kind=kind, result='miss')
+    return None
+
+
+def store(kind, template_version, model, text, value):
+    key = make_key(kind, template_version, model, text)
+    now = time.time()
+    expires_at = now + AI_CACHE_TTL_SECONDS
+    _memory.put(key, value, expires_at)
+    try:
+        _db_put(kind, key, value, now, expires_at)
+    except Exception as e:
+        log.warning("Failed to write ai_cache: %s", e)
+
+
+def cached_generate(kind, template_version, model, text, generate):
+    """キャッシュにあればそれを返し、無ければ generate() を呼んで保存する
+
+    generate() が None を返した場合（失敗・フォールバック）は保存しない。
+    """
+    value = lookup(kind, template_version, model, text)
+    if value is not None:
+        return value
+    value = generate()
+    if value is not None:
+        store(kind, template_version, model, text, value)
+    return value
@@ -1,31 +1,23 @@
 from flask import Blueprint, request, jsonify
-import sqlite3
-import os
-try:
-    from dotenv import load_dotenv  # type: ignore
-except Exception:
-    # 開発/検証環境で dotenv が未インストールでも動作させる
-    def load_dotenv(*args, **kwargs):
-        return None
-import google.generativeai as genai
+from components.db import get_db_connection
+from components.logger import get_logger
+from components import ai_cache
+from components.ai_cache import cached_generate
+from components.llm import LLMError, get_provider
+from components.conversation_digest import DIGEST_SUMMARY_MAX_CHARS, update_digest
+from components.advice_debounce import AdviceDebouncer
+
+log = get_logger('ai')
 
 ai_help_bp = Blueprint('ai_help', __name__)
 
-# Gemini API設定
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    _configure = getattr(genai, "configure", None)
-    if callable(_configure):
-        _configure(api_key=GEMINI_API_KEY)
-else:
-    print("Warning: GEMINI_API_KEY not found in environment variables")
-
-def get_db_connection():
-    """データベース接続を取得"""
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+# アドバイスのプロンプトのバージョン（プロンプトを変えたらバージョンを上げてキャッシュを無効にする）
+ADVICE_PROMPT_VERSION = 2
+# 保存済みのアドバイスのクエリ（components.query_plan でも確認する）
+AI_HELP_SQL = '''
+            SELECT ai_help FROM ai_help 
+            WHERE sticky_id = ? AND student_id = ?
+        '''
 
 @ai_help_bp.route('/api/ai-help', methods=['GET'])
 def fetch_ai_advice():
@@ -39,10 +31,7 @@ def fetch_ai_advice():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT ai_help FROM ai_help 
-            WHERE sticky_id = ? AND student_id = ?
-        ''', (sticky_id, student_id))
+        cursor.execute(AI_HELP_SQL, (sticky_id, student_id))
 
         row = cursor.fetchone()
         conn.close()
@@ -58,43 +47,20 @@ def fetch_ai_advice():
         return jsonify({'error': f'AIアドバイスの取得に失敗しました: {str(e)}'}), 500
 
 
-@ai_help_bp.route('/api/ai-help/generate', methods=['POST'])
-def generate_ai_advice():
-    """AIアドバイスを生成して保存（メッセージ送信時にのみ呼ぶ）"""
-    try:
-        data = request.get_json()
-        sticky_id = data.get('sticky_id')
-        student_id = data.get('student_id')
-        school_id = data.get('school_id')
+class StudentNotFound(Exception):
+    pass
 
-        if not sticky_id or not student_id or not school_id:
-            return jsonify({'error': 'sticky_id、student_id、school_idが必要です'}), 400
 
-        # データベースから最新のメッセージを取得
-        conn = get_db_connection()
+def regenerate_advice(sticky_id, student_id, school_id, on_chunk=None):
+    """最新のメッセージからアドバイスを生成して保存し、アドバイスを返す
+
+    on_chunk を渡すと LLM の応答をストリーミングで受け取り、部分ごとに on_chunk(chunk) を呼ぶ。
+    LLM の応答を待つ間はプールの接続を返却しておき、読み取りと保存のときだけ接続を使う。
+    """
+    conn = get_db_connection()
+    try:
         cursor = conn.cursor()
         
-        # 指定されたsticky_idのメッセージ数を取得
-        cursor.execute('''
-            SELECT COUNT(*) as message_count
-            FROM message 
-            WHERE sticky_id = ?
-        ''', (sticky_id,))
-        
-        message_count_result = cursor.fetchone()
-        message_count = message_count_result['message_count'] if message_count_result else 0
-        
-        # 指定されたsticky_idの最新メッセージを取得（最大10件）
-        cursor.execute('''
-            SELECT message_content, student_id, created_at
-            FROM message 
-            WHERE sticky_id = ? 
-            ORDER BY created_at ASC
-            LIMIT 10
-        ''', (sticky_id,))
-        
-        messages = cursor.fetchall()
-        print(messages)
         # ユーザーのランクを取得
         cursor.execute('''
             SELECT sum_point FROM students 
@@ -103,46 +69,131 @@ def generate_ai_advice():
         
         user_result = cursor.fetchone()
         if not user_result:
-            conn.close()
-            return jsonify({'error': 'ユーザーが見つかりません'}), 404
+            raise StudentNotFound(student_id)
         
         sum_point = user_result['sum_point']
+    finally:
+        conn.close()
         
-        # ランクを計算
-        rank_name = compute_rank_name(sum_point)
-        
-        # 既存のアドバイスを確認
+    # ランクを計算
+    rank_name = compute_rank_name(sum_point)
+    
+    # 前回以降のメッセージだけを会話ダイジェスト（これまでの要約 + 直近の発言）に取り込む
+    digest = update_digest(get_db_connection, sticky_id,
+                           fold=lambda summary, messages: fold_with_llm(summary, messages, school_id))
+    
+    # メッセージの内容を分析してアドバイスを生成（発言者: 自分/他者 を考慮）
+    advice = generate_advice(digest, rank_name, student_id, school_id, on_chunk)
+    
+    # データベースに保存または更新
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
         cursor.execute('''
-            SELECT ai_help FROM ai_help 
+            UPDATE ai_help 
+            SET ai_help = ? 
             WHERE sticky_id = ? AND student_id = ?
-        ''', (sticky_id, student_id))
-        
-        existing_advice = cursor.fetchone()
-        
-        # メッセージの内容を分析してアドバイスを生成（発言者: 自分/他者 を考慮）
-        advice = generate_advice(messages, rank_name, student_id)
-        
-        # データベースに保存または更新
-        if existing_advice:
-            cursor.execute('''
-                UPDATE ai_help 
-                SET ai_help = ? 
-                WHERE sticky_id = ? AND student_id = ?
-            ''', (advice, sticky_id, student_id))
-        else:
+        ''', (advice, sticky_id, student_id))
+        if cursor.rowcount == 0:
             cursor.execute('''
                 INSERT INTO ai_help (sticky_id, student_id, school_id, ai_help)
                 VALUES (?, ?, ?, ?)
             ''', (sticky_id, student_id, school_id, advice))
         
         conn.commit()
-        final_advice = advice
+        return advice
+    finally:
         conn.close()
-        return jsonify({'advice': final_advice}), 200
+
+
+# 連続したメッセージ送信による生成依頼を (sticky_id, student_id) ごとにまとめる
+# 生成したアドバイスは app.py で設定する on_ready で Socket.IO から送信する
+advice_debouncer = AdviceDebouncer(regenerate_advice)
+
+
+@ai_help_bp.route('/api/ai-help/generate', methods=['POST'])
+def generate_ai_advice():
+    """AIアドバイスの生成を依頼（メッセージ送信時にのみ呼ぶ）
+
+    生成は待たずに、保存済みのアドバイスを付けて 202 を返す。短時間の依頼はまとめて1回だけ生成し、
+    結果は ai_advice_updated イベントで依頼した学生のルーム（sticky_{id}:student_{id}）に送信する。
+    "stream": true と "sid"（Socket.IO の sid）を渡すと、生成途中の部分を ai_advice_chunk、
+    完成したアドバイスを ai_advice_done でその sid にも送る。
+    """
+    try:
+        data = request.get_json()
+        sticky_id = data.get('sticky_id')
+        student_id = data.get('student_id')
+        school_id = data.get('school_id')
+
+        if not sticky_id or not student_id or not school_id:
+            return jsonify({'error': 'sticky_id、student_id、school_idが必要です'}), 400
+
+        stream_sid = data.get('sid') if data.get('stream') else None
+        if data.get('stream') and not stream_sid:
+            return jsonify({'error': 'stream には sid が必要です'}), 400
+
+        conn = get_db_connection()
+        try:
+            if not conn.execute('SELECT 1 FROM students WHERE student_id = ?', (student_id,)).fetchone():
+                return jsonify({'error': 'ユーザーが見つかりません'}), 404
+            row = conn.execute(AI_HELP_SQL, (sticky_id, student_id)).fetchone()
+        finally:
+            conn.close()
+
+        # 生成を待たずに返し、新しいアドバイスは Socket.IO で届ける
+        advice_debouncer.request(sticky_id, student_id, school_id, sid=stream_sid)
+        return jsonify({'status': 'scheduled', 'advice': (row[0] if row else '') or ''}), 202
         
     except Exception as e:
         return jsonify({'error': f'AIアドバイスの取得に失敗しました: {str(e)}'}), 500
 
+def fold_with_llm(summary, messages, school_id=None):
+    """直近の枠から押し出された発言をこれまでの要約に畳み込む（LLM が使えなければ None）"""
+    llm = get_provider()
+    if not llm:
+        return None
+    new_lines = chr(10).join(f"・student_id:{m['student_id']}: {m['message_content']}" for m in messages)
+    prompt = f"""
+        以下は小学生のディスカッションの「これまでの要約」と、その後の発言です。
+        発言の内容を要約に取り込み、{DIGEST_SUMMARY_MAX_CHARS}文字以内の新しい要約だけを出力してください。
+        誰がどの立場で何を主張したか（student_id）と、まだ決着していない論点を残してください。
+
+        【これまでの要約】
+        {summary or 'なし'}
+
+        【その後の発言】
+        {new_lines}
+        """
+    try:
+        return llm.generate(prompt, operation='digest', school_id=school_id).strip() or None
+    except LLMError as e:
+        log.warning("Failed to fold conversation with LLM: %s", e)
+        return None
+
+def stream_advice(llm, prompt, school_id, on_chunk):
+    """アドバイスをストリーミングで生成する（キャッシュにあれば全体を1回で送る）。失敗・短すぎる場合は None"""
+    cached = ai_cache.lookup('advice', ADVICE_PROMPT_VERSION, llm.model, prompt)
+    if cached is not None:
+        on_chunk(cached)
+        return cached
+
+    parts = []
+    try:
+        for chunk in llm.stream(prompt, operation='advice', school_id=school_id):
+            parts.append(chunk)
+            on_chunk(chunk)
+    except LLMError as e:
+        log.warning("Advice streaming failed: %s", e)
+        return None
+    ai_advice = ''.join(parts).strip()
+    log.debug("LLM advice (stream): %s", ai_advice)
+    # 空や短すぎる応答はキャッシュしない
+    if len(ai_advice) < 10:
+        return None
+    ai_cache.store('advice', ADVICE_PROMPT_VERSION, llm.model, prompt, ai_advice)
+    return ai_advice
+
 def compute_rank_name(sum_point):
     """合計ポイントからランク名を計算"""
     if sum_point >= 2000:
@@ -154,9 +205,14 @@ def compute_rank_name(sum_point):
     else:
         return "ブロンズ"
 
-def generate_advice(messages, rank_name, current_student_id):
-    """メッセージの内容を基にGemini APIを使用してランク別の高度なアドバイスを生成"""
-    # メッセージの内容（統計用: 生テキスト）と表示用（発言者ラベル+student_id）を分離
+def generate_advice(digest, rank_name, current_student_id, school_id=None, on_chunk=None):
+    """会話ダイジェストを基にGemini APIを使用してランク別の高度なアドバイスを生成
+
+    on_chunk を渡すとストリーミングで生成し、届いた部分ごとに on_chunk(chunk) を呼ぶ。
+    途中で失敗した場合や短すぎる場合はフォールバックを返すので、呼び出し側は戻り値で置き換える。
+    """
+    # 直近の発言（統計用: 生テキスト）と表示用（発言者ラベル+student_id）を分離
+    messages = digest['recent']
     raw_messages = [msg['message_content'] for msg in messages]
     labeled_messages = [
         ("自分" if msg['student_id'] == current_student_id else "他者")
@@ -165,12 +221,13 @@ def generate_advice(messages, rank_name, current_student_id):
         for msg in messages
     ]
     
-    # 基本的な分析
-    total_messages = len(raw_messages)
-    avg_length = sum(len(text) for text in raw_messages) / total_messages if total_messages > 0 else 0
-    my_count = sum(1 for msg in messages if msg['student_id'] == current_student_id)
+    # 基本的な分析（スレッド全体の統計はダイジェストに保存されている）
+    total_messages = digest['message_count']
+    avg_length = digest['total_length'] / total_messages if total_messages > 0 else 0
+    my_count = digest['speaker_counts'].get(str(current_student_id), 0)
     other_count = total_messages - my_count
-    last_speaker_is_self = bool(messages and messages[0]['student_id'] == current_student_id)
+    # 直近の発言者は最後に取り込んだメッセージの発言者
+    last_speaker_is_self = digest['last_student_id'] is not None and str(digest['last_student_id']) == str(current_student_id)
     last_speaker_label = "自分" if last_speaker_is_self else "他者"
     
     # ランクに応じたプロンプトを生成
@@ -213,24 +270,17 @@ def generate_advice(messages, rank_name, current_student_id):
         max_chars = 150
         detail_policy = "噛み砕いた説明、ミニ手順、例を含める。箇条書きは最大3項目。"
     
-    # Gemini APIを使用した高度なアドバイス生成
+    # LLM（Gemini など）を使用した高度なアドバイス生成
     try:
-        if GEMINI_API_KEY:
-            print(f"DEBUG: Attempting Gemini API call for AI advice with key: {GEMINI_API_KEY[:10]}...")
-            _ModelClass = getattr(genai, "GenerativeModel", None)
-            if not callable(_ModelClass):
-                # SDK 仕様の差異などで利用できない場合はフォールバック
-                return generate_advanced_advice(
-                    rank_name,
-                    raw_messages,
-                    total_messages,
-                    avg_length,
-                    my_count,
-                    other_count,
-                    last_speaker_is_self,
-                )
-            gemini = _ModelClass("gemini-2.5-flash")
-            
+        llm = get_provider()
+        if llm:
+            # 直近の枠より前の発言は要約として渡す
+            summary_section = ''
+            if digest['summary']:
+                summary_section = f"""【これまでの議論の要約】
+                {digest['summary']}
+
+                """
             # プロンプトの構築
             prompt = f"""
                 {rank_info['context']}
@@ -239,7 +289,7 @@ def generate_advice(messages, rank_name, current_student_id):
                 高ランクほど控えめに、低ランクほど手厚く具体的に。余分な言葉（あなたの挨拶、）は要りません。アスタリスクは使わないでください
             
 
-                【分析対象の議論】
+                {summary_section}【分析対象の議論（直近の発言）】
                 {chr(10).join([f"・{msg}" for msg in labeled_messages])}
 
                 【学生のランク情報】
@@ -269,12 +319,22 @@ def generate_advice(messages, rank_name, current_student_id):
                 アドバイス：
                 """
             
-            response = gemini.generate_content(prompt)
-            ai_advice = response.text if hasattr(response, "text") else str(response)
-            print(f"DEBUG: Gemini API response for AI advice: {ai_advice}")
+            def generate():
+                ai_advice = llm.generate(prompt, operation='advice', school_id=school_id)
+                log.debug("LLM advice: %s", ai_advice)
+                # 空や短すぎる応答はキャッシュしない
+                if not ai_advice or len(ai_advice.strip()) < 10:
+                    return None
+                return ai_advice.strip()
+
+            # 同じ会話・ランク・発言者構成ならプロンプトも同じになるのでキャッシュを使う
+            if on_chunk:
+                ai_advice = stream_advice(llm, prompt, school_id, on_chunk)
+            else:
+                ai_advice = cached_generate('advice', ADVICE_PROMPT_VERSION, llm.model, prompt, generate)
             
             # AIアドバイスが空またはエラーの場合のフォールバック
-            if not ai_advice or len(ai_advice.strip()) < 10:
+            if ai_advice is None:
                 return generate_advanced_advice(
                     rank_name,
                     raw_messages,
@@ -285,10 +345,10 @@ def generate_advice(messages, rank_name, current_student_id):
                     last_speaker_is_self,
                 )
             
-            return ai_advice.strip()
+            return ai_advice
             
         else:
-            print("DEBUG: No GEMINI_API_KEY found, using fallback")
+            log.debug("No LLM provider configured, using fallback")
             return generate_advanced_advice(
                 rank_name,
                 raw_messages,
@@ -300,7 +360,7 @@ def generate_advice(messages, rank_name, current_student_id):
             )
             
     except Exception as e:
-        print(f"DEBUG: Gemini API call failed: {e}")
+        log.warning("LLM call failed: %s", e)
         return generate_advanced_advice(
             rank_name,
             raw_messages,
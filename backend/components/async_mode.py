@@ -0,0 +1,35 @@
+"""Socket.IO サーバーの実行モードと、ブロッキング処理の逃がし先
+
+SOCKETIO_ASYNC_MODE でサーバーの実行モードを選ぶ（server.py が monkey patch の前に設定する）。
+
+    threading  Werkzeug の開発サーバー（python app.py。既定）
+    eventlet   協調的なグリーンスレッド（python server.py。既定で eventlet）
+    gevent     同上（gevent を使う場合）
+
+eventlet / gevent では SQLite や Gemini の呼び出しのようにイベントループを止める処理を
+run_blocking() で OS スレッドのプールに逃がす（eventlet は EVENTLET_THREADPOOL_SIZE、既定 20 スレッド）。
+threading ではその場で呼び出すだけなので、どのモードでも同じコードで動く。
+"""
+import os
+
+COOPERATIVE_MODES = ('eventlet', 'gevent')
+
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+if ASYNC_MODE not in COOPERATIVE_MODES + ('threading',):
+    raise ValueError(f"SOCKETIO_ASYNC_MODE が不正です: {ASYNC_MODE}")
+
+
+def is_cooperative():
+    """グリーンスレッドで動いているか（ブロッキング処理を逃がす必要があるか）"""
+    return ASYNC_MODE in COOPERATIVE_MODES
+
+
+def run_blocking(fn, *args, **kwargs):
+    """fn をイベントループを止めずに実行して結果を返す（例外もそのまま投げる）"""
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+    return fn(*args, **kwargs)
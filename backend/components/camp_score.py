@@ -0,0 +1,80 @@
+"""陣営別得点（camp_score テーブル）の差分更新
+
+投票のたびに得点の差分を camp_score に加算しておき、
+得点の取得はテーブルを1回引くだけで済むようにする。
+"""
+
+# 同陣営の投票: A(+2), B(+1), C(-1)
+SAME_CAMP_POINTS = {'A': 2, 'B': 1, 'C': -1}
+# 敵陣営の投票: A(+6), B(+3), C(-1)
+ENEMY_CAMP_POINTS = {'A': 6, 'B': 3, 'C': -1}
+
+# 得点の取得で使うクエリ（components.query_plan でも確認する）
+CAMP_IDS_SQL = 'SELECT camp_id FROM camps WHERE theme_id = ? ORDER BY camp_id'
+CAMP_SCORES_SQL = '''
+        SELECT cp.camp_id, cp.camp_name,
+               COALESCE(cs.score, 0) AS score,
+               COALESCE(cs.vote_count, 0) AS vote_count
+          FROM camps cp
+          LEFT JOIN camp_score cs
+            ON cs.school_id = ? AND cs.theme_id = cp.theme_id AND cs.camp_id = cp.camp_id
+         WHERE cp.theme_id = ?
+         ORDER BY cp.camp_id
+    '''
+
+
+def camp_id_map(c, theme_id):
+    """学生や付箋に保存されている 1/2 の論理IDを、このテーマの実際の camp_id に対応させる"""
+    c.execute(CAMP_IDS_SQL, (theme_id,))
+    theme_camp_ids = [row[0] for row in c.fetchall() if row[0] is not None]
+    if len(theme_camp_ids) >= 2:
+        return {1: theme_camp_ids[0], 2: theme_camp_ids[1]}
+    return {}
+
+
+def vote_points(target_camp_id, voter_camp_id, vote_type, camp_map):
+    """(得点が入る陣営の camp_id, 点数) を返す。陣営が分からない投票は (None, 0)"""
+    if target_camp_id is None or voter_camp_id is None:
+        return None, 0
+    target_camp_id = camp_map.get(int(target_camp_id), int(target_camp_id))
+    voter_camp_id = camp_map.get(int(voter_camp_id), int(voter_camp_id))
+    # 同陣営判定はNULLを同陣営とみなさない
+    points = SAME_CAMP_POINTS if target_camp_id == voter_camp_id else ENEMY_CAMP_POINTS
+    return target_camp_id, points.get(vote_type, 0)
+
+
+def apply_vote(c, school_id, theme_id, author_camp_id, voter_camp_id, vote_type, count=1, camp_map=None):
+    """投票 count 件分の得点を camp_score に加算する（取り消しは count を負にする）"""
+    if camp_map is None:
+        camp_map = camp_id_map(c, theme_id)
+    camp_id, points = vote_points(author_camp_id, voter_camp_id, vote_type, camp_map)
+    if camp_id is None:
+        return
+    c.execute('''
+        INSERT INTO camp_score (school_id, theme_id, camp_id, score, vote_count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(school_id, theme_id, camp_id) DO UPDATE
+           SET score = score + excluded.score,
+               vote_count = vote_count + excluded.vote_count
+    ''', (school_id, theme_id, camp_id, points * count, count))
+
+
+def remove_sticky_votes(c, sticky_id):
+    """付箋を削除する前に、その付箋への投票分の得点を取り消す"""
+    c.execute('''
+        SELECT s.school_id, s.theme_id, s.author_camp_id, sv.voter_camp_id, sv.vote_type, COUNT(*)
+          FROM sticky_votes sv
+          JOIN sticky s ON sv.sticky_id = s.sticky_id
+         WHERE sv.sticky_id = ?
+         GROUP BY sv.voter_camp_id, sv.vote_type
+    ''', (sticky_id,))
+    rows = c.fetchall()
+    camp_map = camp_id_map(c, rows[0][1]) if rows else {}
+    for school_id, theme_id, author_camp_id, voter_camp_id, vote_type, count in rows:
+        apply_vote(c, school_id, theme_id, author_camp_id, voter_camp_id, vote_type, -count, camp_map)
+
+
+def fetch_camp_scores(c, school_id, theme_id):
+    """テーマの全陣営の (camp_id, camp_name, score, vote_count) を camp_id 順に返す（投票が無い陣営は0点）"""
+    c.execute(CAMP_SCORES_SQL, (school_id, theme_id))
+    return c.fetchall()
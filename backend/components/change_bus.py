@@ -0,0 +1,138 @@
+"""SQLite の change_log を使ったプロセス間のキャッシュ無効化
+
+書き込みの処理は log_change() で change_log に (テーブル, キー) を追記する（書き込みと同じトランザクションで）。
+各プロセスは専用の接続で PRAGMA data_version を定期的に確認し（eventlet などではその読み込みを OS スレッドで行う）、他の接続がコミットしていたときだけ
+change_log の続きを読み、subscribe() で登録したキャッシュに通知する。外部のブローカーは使わない。
+
+自分のプロセスの変更は書き込みの処理がその場でキャッシュを更新するので、origin で読み飛ばす。
+
+    CHANGE_BUS                  0 で無効（既定 1）
+    CHANGE_BUS_POLL_SECONDS     data_version を確認する間隔（既定 0.2 秒）
+    CHANGE_LOG_MAX_ROWS         change_log に残す行数（既定 10000）。読み遅れて消された範囲があれば全体を無効にする
+"""
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from components.db import _call, connect
+from components.logger import get_logger
+from components.metrics import counter
+
+log = get_logger('change_bus')
+
+CHANGE_BUS = os.getenv('CHANGE_BUS', '1') == '1'
+CHANGE_BUS_POLL_SECONDS = float(os.getenv('CHANGE_BUS_POLL_SECONDS', '0.2'))
+CHANGE_LOG_MAX_ROWS = int(os.getenv('CHANGE_LOG_MAX_ROWS', '10000'))
+# 何回読み込むごとに change_log の古い行を消すか
+CHANGE_LOG_PRUNE_EVERY = 100
+
+ORIGIN = uuid.uuid4().hex
+
+CHANGE_NOTIFICATIONS = counter(
+    'change_bus_notifications_total', 'Changes from other processes delivered to cache subscribers', ('table',))
+
+
+def log_change(c, table, key=None):
+    """変更を change_log に追記する（書き込みのトランザクション内で呼ぶ）"""
+    if not CHANGE_BUS:
+        return
+    c.execute('INSERT INTO change_log (tbl, key, origin, created_at) VALUES (?, ?, ?, ?)',
+              (table, None if key is None else str(key), ORIGIN, time.time()))
+
+
+class ChangeBus:
+    def __init__(self, poll_seconds=CHANGE_BUS_POLL_SECONDS, db_path=None):
+        self.poll_seconds = poll_seconds
+        self.db_path = db_path
+        self._subscribers = defaultdict(list)   # テーブル -> [(key, callback)]
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._last_id = None
+        self._polls = 0
+        self._thread = None
+
+    def subscribe(self, table, callback, key=None):
+        """テーブルの変更を callback(table, key) で受け取る
+
+        key を指定するとそのキーの変更（とテーブル全体の変更）だけを受け取る。
+        テーブル全体の変更や、読み遅れて分からなくなった変更は key=None で通知する。
+        """
+        with self._lock:
+            self._subscribers[table].append((None if key is None else str(key), callback))
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+            self._last_id = self._conn.execute('SELECT COALESCE(MAX(change_id), 0) FROM change_log').fetchone()[0]
+        return self._conn
+
+    def _read_changes(self):
+        """前回から増えた change_log の行を (読み飛ばしがあったか, 他のプロセスの行) で返す（変更がなければ None）"""
+        conn = self._connection()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return None
+        self._data_version = data_version
+        rows = conn.execute('''
+            SELECT change_id, tbl, key, origin FROM change_log
+             WHERE change_id > ?
+             ORDER BY change_id
+        ''', (self._last_id,)).fetchall()
+        # 続きの最初の行が飛んでいれば、読む前に消された変更がある
+        missed = bool(rows) and rows[0][0] > self._last_id + 1
+        if rows:
+            self._last_id = rows[-1][0]
+        self._polls += 1
+        if self._polls % CHANGE_LOG_PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM change_log WHERE change_id <= ?', (self._last_id - CHANGE_LOG_MAX_ROWS,))
+            conn.commit()
+        return missed, [row for row in rows if row[3] != ORIGIN]
+
+    def poll(self):
+        """他のプロセスの変更があれば通知し、通知した件数を返す"""
+        with self._lock:
+            # グリーンスレッドではイベントループを止めないよう、DB の読み書きは _call で OS スレッドから行う
+            changes = _call(self._read_changes)
+            if changes is None:
+                return 0
+            missed, rows = changes
+            subscribers = {table: list(items) for table, items in self._subscribers.items()}
+
+        if missed:
+            # 読む前に消された変更があるので、全てのキャッシュを無効にする
+            log.warning("Change log was pruned past this process; invalidating all caches")
+            changes = [(table, None) for table in subscribers]
+        else:
+            # 同じ (テーブル, キー) の変更は1回だけ通知する
+            changes = list(dict.fromkeys((row[1], row[2]) for row in rows))
+        for table, key in changes:
+            for subscribed_key, callback in subscribers.get(table, ()):
+                if subscribed_key is not None and key is not None and subscribed_key != key:
+                    continue
+                try:
+                    callback(table, key)
+                except Exception as e:
+                    log.exception("Change subscriber for %s failed: %s", table, e)
+            CHANGE_NOTIFICATIONS.inc(table=table)
+        return len(changes)
+
+    def start(self):
+        if CHANGE_BUS and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='change-bus', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                log.exception("Failed to poll change log: %s", e)
+            time.sleep(self.poll_seconds)
+
+
+bus = ChangeBus()
+subscribe = bus.subscribe
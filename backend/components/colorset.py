@@ -1,18 +1,19 @@
 from flask import json, jsonify
-import sqlite3
 from flask import Blueprint
-from components.init import get_db_connection
+from components.db import get_db_connection
+from components import resource_version
 
 colorset_o = Blueprint('colorset_o', __name__, url_prefix='/api')
 
 # colorset
 @colorset_o.route('/colorsets/<camp>', methods=['GET'])
+@resource_version.conditional(lambda camp: [('colorsets',)])
 def get_colorsets(camp):
     try:
         # camp1 = camp_type 1, camp2 = camp_type 2
         camp_type = 1 if camp == 'camp1' else 2
         
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('SELECT group_number, colors FROM colorsets WHERE camp_type = ? ORDER BY group_number', (camp_type,))
         rows = c.fetchall()
@@ -32,6 +33,7 @@ def get_colorsets(camp):
 
 # theme_idに基づいて、そのテーマのカラーセットを取得する
 @colorset_o.route('/colorsets/theme/<int:theme_id>', methods=['GET'])
+@resource_version.conditional(lambda theme_id: [('colorsets',), ('themes',)])
 def get_theme_colorsets(theme_id):
     try:
         conn = get_db_connection()
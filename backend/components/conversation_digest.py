@@ -0,0 +1,179 @@
+"""付箋チャットの会話ダイジェスト（AIアドバイス用）
+
+付箋ごとに「これまでの要約」と「直近の発言（最大 DIGEST_RECENT_MESSAGES 件）」、
+発言数などの統計を conversation_digest テーブルに保存しておく。
+更新時は前回から増えたメッセージだけを読み、直近の枠から押し出された発言を要約に畳み込む。
+これにより、スレッドが長くなってもプロンプトの大きさと生成時間は一定に保たれる。
+"""
+import json
+import os
+import threading
+
+from components.logger import get_logger
+
+log = get_logger('digest')
+
+# プロンプトにそのまま含める直近の発言数
+DIGEST_RECENT_MESSAGES = int(os.getenv('DIGEST_RECENT_MESSAGES', '10'))
+# これまでの要約の最大文字数
+DIGEST_SUMMARY_MAX_CHARS = int(os.getenv('DIGEST_SUMMARY_MAX_CHARS', '400'))
+# 要約に畳み込むときの1発言あたりの最大文字数（LLM が使えないとき）
+_FOLD_MESSAGE_CHARS = 40
+# 1回に LLM で畳み込む発言数の上限（古いスレッドを初めて取り込むときなど、超えた分は LLM を使わずに畳み込む）
+DIGEST_FOLD_BATCH = 30
+
+# ダイジェストと、その後に増えたメッセージのクエリ（components.query_plan でも確認する）
+DIGEST_SQL = '''
+        SELECT summary, recent_messages, last_message_id, message_count, total_length,
+               speaker_counts, last_student_id
+          FROM conversation_digest WHERE sticky_id = ?
+    '''
+NEW_MESSAGES_SQL = '''
+                SELECT message_id, student_id, message_content
+                  FROM message
+                 WHERE sticky_id = ? AND message_id > ?
+                 ORDER BY message_id
+            '''
+
+# 同じプロセス内で同じ付箋のダイジェストを同時に更新しない
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _sticky_lock(sticky_id):
+    with _locks_lock:
+        lock = _locks.get(sticky_id)
+        if lock is None:
+            lock = _locks[sticky_id] = threading.Lock()
+        return lock
+
+
+def _empty_digest(sticky_id):
+    return {
+        'sticky_id': sticky_id,
+        'summary': '',
+        'recent': [],
+        'last_message_id': 0,
+        'message_count': 0,
+        'total_length': 0,
+        'speaker_counts': {},
+        'last_student_id': None,
+    }
+
+
+def load_digest(c, sticky_id):
+    c.execute(DIGEST_SQL, (sticky_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    return {
+        'sticky_id': sticky_id,
+        'summary': row[0] or '',
+        'recent': json.loads(row[1] or '[]'),
+        'last_message_id': row[2],
+        'message_count': row[3],
+        'total_length': row[4],
+        'speaker_counts': json.loads(row[5] or '{}'),
+        'last_student_id': row[6],
+    }
+
+
+def fold_without_llm(summary, messages):
+    """LLM を使わずに、押し出された発言の先頭部分を要約の末尾に追加する（古い部分から切り捨てる）"""
+    lines = [summary] if summary else []
+    lines += [f"・{m['student_id']}: {m['message_content'][:_FOLD_MESSAGE_CHARS]}" for m in messages]
+    folded = '\n'.join(lines)
+    return folded[-DIGEST_SUMMARY_MAX_CHARS:]
+
+
+def _save_digest(c, digest, previous_last_message_id, exists):
+    values = (
+        digest['summary'],
+        json.dumps(digest['recent'], ensure_ascii=False),
+        digest['last_message_id'],
+        digest['message_count'],
+        digest['total_length'],
+        json.dumps(digest['speaker_counts']),
+        digest['last_student_id'],
+    )
+    if exists:
+        # 別のプロセスが先に更新していたら保存しない（rowcount 0）
+        c.execute('''
+            UPDATE conversation_digest
+               SET summary = ?, recent_messages = ?, last_message_id = ?, message_count = ?,
+                   total_length = ?, speaker_counts = ?, last_student_id = ?,
+                   updated_at = datetime('now', '+9 hours')
+             WHERE sticky_id = ? AND last_message_id = ?
+        ''', values + (digest['sticky_id'], previous_last_message_id))
+    else:
+        c.execute('''
+            INSERT OR IGNORE INTO conversation_digest (
+                summary, recent_messages, last_message_id, message_count,
+                total_length, speaker_counts, last_student_id, sticky_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', values + (digest['sticky_id'],))
+    return c.rowcount > 0
+
+
+def update_digest(connect, sticky_id, fold=None):
+    """前回から増えたメッセージをダイジェストに取り込んで返す
+
+    connect() は接続を返す関数（get_db_connection）。LLM で要約を作る間は接続を返却しておき、
+    読み取りと保存のときだけ接続を使う。
+    fold(summary, messages) は押し出された発言を要約に畳み込んだ文字列を返す（失敗時は None）。
+    None や未指定の場合は fold_without_llm を使う。
+    """
+    with _sticky_lock(sticky_id):
+        conn = connect()
+        try:
+            c = conn.cursor()
+            stored = load_digest(c, sticky_id)
+            digest = stored or _empty_digest(sticky_id)
+            previous_last_message_id = digest['last_message_id']
+
+            c.execute(NEW_MESSAGES_SQL, (sticky_id, previous_last_message_id))
+            new_messages = [
+                {'message_id': row[0], 'student_id': row[1], 'message_content': row[2]}
+                for row in c.fetchall()
+            ]
+        finally:
+            conn.close()
+        if not new_messages:
+            return digest
+
+        for m in new_messages:
+            digest['message_count'] += 1
+            digest['total_length'] += len(m['message_content'])
+            key = str(m['student_id'])
+            digest['speaker_counts'][key] = digest['speaker_counts'].get(key, 0) + 1
+        digest['last_message_id'] = new_messages[-1]['message_id']
+        digest['last_student_id'] = new_messages[-1]['student_id']
+
+        window = digest['recent'] + new_messages
+        evicted = window[:-DIGEST_RECENT_MESSAGES] if len(window) > DIGEST_RECENT_MESSAGES else []
+        digest['recent'] = window[-DIGEST_RECENT_MESSAGES:]
+        if evicted:
+            if len(evicted) > DIGEST_FOLD_BATCH:
+                digest['summary'] = fold_without_llm(digest['summary'], evicted[:-DIGEST_FOLD_BATCH])
+                evicted = evicted[-DIGEST_FOLD_BATCH:]
+            summary = None
+            if fold:
+                try:
+                    summary = fold(digest['summary'], evicted)
+                except Exception as e:
+                    log.warning("Failed to fold messages into digest %s: %s", sticky_id, e)
+            digest['summary'] = (summary or fold_without_llm(digest['summary'], evicted))[:DIGEST_SUMMARY_MAX_CHARS]
+
+        conn = connect()
+        try:
+            c = conn.cursor()
+            if _save_digest(c, digest, previous_last_message_id, stored is not None):
+                conn.commit()
+                return digest
+
+            # 他のプロセスが先に更新していた場合はそちらを使う
+            conn.rollback()
+            return load_digest(c, sticky_id) or digest
+        finally:
+            conn.close()
+
@@ -0,0 +1,249 @@
+import os
+import sqlite3
+import threading
+import time
+
+from components.async_mode import is_cooperative, run_blocking
+from components.metrics import add_sql_time, carry_sql_state, trace_sql
+
+# データベースファイルのパス（環境変数で上書き可能）
+DB_PATH = os.getenv('DATABASE_PATH', 'database.db')
+
+# ロック待ちの最大時間（ミリ秒）
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+# 1スレッドあたりに保持しておく待機中の接続数の上限
+MAX_IDLE_PER_THREAD = int(os.getenv('SQLITE_MAX_IDLE_PER_THREAD', '2'))
+# グリーンスレッド（eventlet / gevent）で全体で共有する待機中の接続数の上限
+MAX_IDLE_SHARED = int(os.getenv('SQLITE_MAX_IDLE_SHARED', '16'))
+
+
+def _call(method, *args):
+    # グリーンスレッドではイベントループを止めないよう OS スレッドで実行する
+    if is_cooperative():
+        return run_blocking(carry_sql_state(method), *args)
+    return method(*args)
+
+
+def connect(db_path=None):
+    """PRAGMA を設定済みの新しい接続を作成（プールを経由しない）"""
+    # 接続はスレッドローカルに管理するので、スレッドを跨いだ返却（GC 時など）を許可しておく
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    # WAL にすると読み込みが書き込みをブロックしなくなる（設定はファイルに永続化される）
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    # WAL では NORMAL でもクラッシュ時にDBが壊れることはない
+    conn.execute('PRAGMA synchronous = NORMAL')
+    # 配列を辞書にしてくれる（インデックスでのアクセスもそのまま使える）
+    conn.row_factory = sqlite3.Row
+    # 実行された SQL 文をメトリクスとして数える
+    conn.set_trace_callback(trace_sql)
+    return conn
+
+
+class _TimedCursor:
+    """execute / fetch にかかった時間をメトリクスに加算するカーソル"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return _call(method, *args)
+        finally:
+            add_sql_time(time.perf_counter() - start)
+
+    def execute(self, *args):
+        self._timed(self._cursor.execute, *args)
+        return self
+
+    def executemany(self, *args):
+        self._timed(self._cursor.executemany, *args)
+        return self
+
+    def executescript(self, *args):
+        self._timed(self._cursor.executescript, *args)
+        return self
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+
+class _PoolStats:
+    """プールのヒット/ミスを数えるカウンタ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.released = 0
+        self.discarded = 0
+        self.in_use = 0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / total) if total else 0.0,
+                'released': self.released,
+                'discarded': self.discarded,
+                'in_use': self.in_use,
+            }
+
+
+class PooledConnection:
+    """プールから貸し出された接続。close() で実際には閉じずにプールへ返却する"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def cursor(self, *args):
+        return _TimedCursor(self._conn.cursor(*args))
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            _call(self._conn.commit)
+        finally:
+            add_sql_time(time.perf_counter() - start)
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._conn)
+
+    def __del__(self):
+        # close() されずに捨てられた場合もプールに戻す
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """スレッドローカルに接続を使い回すプール
+
+    sqlite3 の接続は作成したスレッドでしか使えないため、スレッドごとに
+    待機中の接続を保持して次のリクエストで再利用する。
+    グリーンスレッドではリクエストごとにスレッドローカルが変わるので、全体で1つのリストを共有する
+    （実行は run_blocking でどの OS スレッドからも行われる）。
+    """
+
+    def __init__(self, db_path=None, max_idle_per_thread=MAX_IDLE_PER_THREAD, max_idle_shared=MAX_IDLE_SHARED):
+        self.db_path = db_path or DB_PATH
+        self.max_idle_per_thread = max_idle_per_thread
+        self.max_idle_shared = max_idle_shared
+        self.stats = _PoolStats()
+        self._local = threading.local()
+        self._shared_idle = []
+        self._shared_lock = threading.Lock()
+
+    def _idle(self):
+        if is_cooperative():
+            return self._shared_idle
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = []
+        return idle
+
+    def _max_idle(self):
+        return self.max_idle_shared if is_cooperative() else self.max_idle_per_thread
+
+    def acquire(self):
+        idle = self._idle()
+        with self._shared_lock:
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            self.stats.incr('hits')
+        else:
+            if not os.path.exists(self.db_path):
+                raise FileNotFoundError(f"データベースファイルが見つかりません: {self.db_path}")
+            conn = _call(connect, self.db_path)
+            self.stats.incr('misses')
+        self.stats.incr('in_use')
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        self.stats.incr('in_use', -1)
+        try:
+            # commit されなかった変更は次の利用者に持ち越さない
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            self.stats.incr('discarded')
+            conn.close()
+            return
+
+        idle = self._idle()
+        with self._shared_lock:
+            keep = len(idle) < self._max_idle()
+            if keep:
+                idle.append(conn)
+        if keep:
+            self.stats.incr('released')
+        else:
+            self.stats.incr('discarded')
+            conn.close()
+
+
+_pool = ConnectionPool()
+
+
+def get_db_connection():
+    """プールからデータベース接続を取得（close() でプールに返却される）"""
+    return _pool.acquire()
+
+
+def pool_stats():
+    """プールのヒット/ミス数を返す"""
+    return _pool.stats.snapshot()
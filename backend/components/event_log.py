@@ -0,0 +1,137 @@
+"""学校ごとのボードのイベントの連番とリングバッファ
+
+sticky_created / sticky_updated / sticky_deleted / feedback_updated / sticky_positions（保存した位置）に
+学校ごとの連番 seq を付けて、直近 EVENT_LOG_SIZE 件を保持する。
+再接続したクライアントは最後に受け取った seq を送り、それ以降のイベントだけを受け取り直す。
+保持している範囲より古い場合は None を返すので、呼び出し側は全件の取得を促す。
+
+    EVENT_LOG_SIZE     学校ごとに保持するイベント数（既定 1000）
+    EVENT_LOG_PERSIST  1 にすると SQLite の board_event テーブルに保存する
+                       （再起動後も続きから再送でき、複数ワーカーでも連番が共有される）。
+                       SOCKETIO_MESSAGE_QUEUE を設定した場合は既定で 1 で、0 にすると起動しない
+                       （メモリの連番はワーカーごとなので、別のワーカーのイベントと seq が重なり再送で取りこぼす）
+
+epoch は連番の系列を表す。メモリに保持する場合は起動ごとに変わるので、
+クライアントは epoch が変わっていたら seq に関係なく全件を取得し直す。
+"""
+import json
+import os
+import threading
+import uuid
+from collections import deque
+
+from components.db import get_db_connection
+from components.logger import get_logger
+
+log = get_logger('event_log')
+
+EVENT_LOG_SIZE = int(os.getenv('EVENT_LOG_SIZE', '1000'))
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+EVENT_LOG_PERSIST = os.getenv('EVENT_LOG_PERSIST', '1' if SOCKETIO_MESSAGE_QUEUE else '0') == '1'
+
+
+class MemoryEventLog:
+    """プロセス内のリングバッファ（1プロセスで動かす場合）"""
+
+    def __init__(self, size=EVENT_LOG_SIZE):
+        self.size = size
+        self.epoch = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._seq = {}      # school_id -> 最後に付けた seq
+        self._events = {}   # school_id -> deque[(seq, event, payload)]
+
+    def record(self, school_id, event, payload):
+        """イベントを記録して seq を返す"""
+        school_id = str(school_id)
+        with self._lock:
+            seq = self._seq.get(school_id, 0) + 1
+            self._seq[school_id] = seq
+            events = self._events.get(school_id)
+            if events is None:
+                events = self._events[school_id] = deque(maxlen=self.size)
+            events.append((seq, event, payload))
+        return seq
+
+    def latest(self, school_id):
+        with self._lock:
+            return self._seq.get(str(school_id), 0)
+
+    def since(self, school_id, last_seq):
+        """last_seq より後のイベントを [(seq, event, payload)] で返す（保持していない範囲があれば None）"""
+        school_id = str(school_id)
+        with self._lock:
+            latest = self._seq.get(school_id, 0)
+            if last_seq > latest:
+                return None
+            if last_seq == latest:
+                return []
+            events = self._events.get(school_id) or ()
+            if not events or events[0][0] > last_seq + 1:
+                return None
+            return [item for item in events if item[0] > last_seq]
+
+
+class SqliteEventLog:
+    """board_event テーブルに保存するリングバッファ（複数ワーカー・再起動後も連番が続く）"""
+    epoch = 'db'
+
+    def __init__(self, size=EVENT_LOG_SIZE):
+        self.size = size
+
+    def record(self, school_id, event, payload):
+        school_id = str(school_id)
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            # 連番の採番と古いイベントの削除を1つの書き込みトランザクションで行う
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM board_event WHERE school_id = ?', (school_id,))
+            seq = c.fetchone()[0]
+            c.execute('INSERT INTO board_event (school_id, seq, event, payload) VALUES (?, ?, ?, ?)',
+                      (school_id, seq, event, json.dumps(payload, ensure_ascii=False, default=str)))
+            c.execute('DELETE FROM board_event WHERE school_id = ? AND seq <= ?', (school_id, seq - self.size))
+            conn.commit()
+            return seq
+        finally:
+            conn.close()
+
+    def latest(self, school_id):
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT COALESCE(MAX(seq), 0) FROM board_event WHERE school_id = ?', (str(school_id),))
+            return c.fetchone()[0]
+        finally:
+            conn.close()
+
+    def since(self, school_id, last_seq):
+        school_id = str(school_id)
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT MIN(seq), MAX(seq) FROM board_event WHERE school_id = ?', (school_id,))
+            oldest, latest = c.fetchone()
+            latest = latest or 0
+            if last_seq > latest:
+                return None
+            if last_seq == latest:
+                return []
+            if oldest > last_seq + 1:
+                return None
+            c.execute('''
+                SELECT seq, event, payload FROM board_event
+                 WHERE school_id = ? AND seq > ?
+                 ORDER BY seq
+            ''', (school_id, last_seq))
+            return [(row[0], row[1], json.loads(row[2])) for row in c.fetchall()]
+        finally:
+            conn.close()
+
+
+def create_event_log():
+    if SOCKETIO_MESSAGE_QUEUE and not EVENT_LOG_PERSIST:
+        raise RuntimeError('SOCKETIO_MESSAGE_QUEUE を使う場合は EVENT_LOG_PERSIST=1 が必要です（ワーカー間で連番を共有するため）')
+    if EVENT_LOG_PERSIST:
+        log.info("Board events are persisted to SQLite (%d per school)", EVENT_LOG_SIZE)
+        return SqliteEventLog()
+    return MemoryEventLog()
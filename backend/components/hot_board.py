@@ -0,0 +1,253 @@
+"""学校・テーマごとの付箋一覧のプロセス内キャッシュ（GET /api/sticky をメモリから返す）
+
+討論中は全員が同じボードを読むので、使われているボードの付箋を sticky_list.FIELDS の順のタプルで保持する。
+書き込みの処理（作成・更新・削除・投票）はコミット後に apply() / remove() でキャッシュを直接更新する。
+
+読み取りのたびに専用の接続で PRAGMA data_version を確認し、前回から変わっていなければ（どの接続・プロセスも
+コミットしていなければ）SQLite を読まずにそのまま返す。変わっていれば board_version（components.sticky_changes）を
+読み、版数が同じならそのまま、進んでいれば updated_version で変わった付箋だけを読み直す。
+
+    HOT_BOARD_CACHE         0 で無効（既定 1）
+    HOT_BOARD_CACHE_BOARDS  保持するボード数の上限（既定 50、古く使われたものから捨てる）
+    HOT_BOARD_CACHE_MB      保持する付箋の大きさの上限（既定 64MB、概算）
+
+学生の陣営（author_camp_id）の変更は resource_version の ('student_camps',) で検知する。
+別のプロセスでの陣営の変更も components.change_bus から resource_version に届く（CHANGE_BUS_POLL_SECONDS 以内）。
+"""
+import bisect
+import os
+import threading
+from collections import OrderedDict
+
+from components import resource_version, sticky_changes, sticky_list
+from components.db import _call, connect, get_db_connection
+from components.metrics import counter
+
+HOT_BOARD_CACHE = os.getenv('HOT_BOARD_CACHE', '1') == '1'
+HOT_BOARD_CACHE_BOARDS = int(os.getenv('HOT_BOARD_CACHE_BOARDS', '50'))
+HOT_BOARD_CACHE_MB = float(os.getenv('HOT_BOARD_CACHE_MB', '64'))
+
+HOT_BOARD_REQUESTS = counter(
+    'hot_board_cache_requests_total', 'Board reads served by the in-process board cache', ('result',))
+
+FIELD_INDEX = {name: i for i, name in enumerate(sticky_list.FIELDS)}
+_ID = FIELD_INDEX['sticky_id']
+_DISPLAY_INDEX = FIELD_INDEX['display_index']
+_UPDATED_VERSION = FIELD_INDEX['updated_version']
+# 1件あたりのタプル・辞書のおおよその大きさ（バイト）
+_ROW_OVERHEAD = 400
+
+
+def _row_size(row):
+    return _ROW_OVERHEAD + sum(len(value) * 2 for value in row if isinstance(value, str))
+
+
+def _sort_key(row):
+    # SQLite と同じく display_index が NULL の付箋を先頭にする
+    display_index = row[_DISPLAY_INDEX]
+    return (display_index is not None, display_index or 0, row[_ID])
+
+
+class _SortedRows(list):
+    """display_index 順の付箋のタプルと、その並びのキー（page() の二分探索に使う）"""
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.sort_keys = [_sort_key(row) for row in self]
+
+
+class _Board:
+    def __init__(self, version, data_version, camps_version):
+        self.version = version              # board_version.version（ここまでの変更を反映済み）
+        self.data_version = data_version    # 最後に SQLite と照合したときの PRAGMA data_version
+        self.camps_version = camps_version
+        self.rows = {}                      # sticky_id -> タプル
+        self.size = 0
+        self._sorted = None
+
+    def put(self, row):
+        """付箋を追加・置き換える（保持しているものより古い付箋は無視する）"""
+        old = self.rows.get(row[_ID])
+        if old is not None:
+            if (old[_UPDATED_VERSION] or 0) > (row[_UPDATED_VERSION] or 0):
+                return
+            self.size -= _row_size(old)
+        self.rows[row[_ID]] = row
+        self.size += _row_size(row)
+        self._sorted = None
+
+    def pop(self, sticky_id):
+        old = self.rows.pop(sticky_id, None)
+        if old is not None:
+            self.size -= _row_size(old)
+            self._sorted = None
+
+    def sorted_rows(self):
+        if self._sorted is None:
+            self._sorted = _SortedRows(sorted(self.rows.values(), key=_sort_key))
+        return self._sorted
+
+
+class HotBoardCache:
+    def __init__(self, max_boards=HOT_BOARD_CACHE_BOARDS, max_bytes=HOT_BOARD_CACHE_MB * 1024 * 1024):
+        self.max_boards = max_boards
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._boards = OrderedDict()   # (school_id, theme_id) -> _Board
+        self._size = 0
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def _data_version(self):
+        # data_version は接続ごとの値なので、照合には常に同じ接続を使う
+        # （グリーンスレッドではイベントループを止めないよう _call で OS スレッドから読む）
+        with self._conn_lock:
+            if self._conn is None:
+                self._conn = _call(connect)
+            return _call(self._read_data_version)
+
+    def _read_data_version(self):
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def rows(self, school_id, theme_id):
+        """ボードの (版数, display_index 順の付箋のタプルのリスト) を返す"""
+        key = (str(school_id), int(theme_id))
+        data_version = self._data_version()
+        camps_version = resource_version.version(('student_camps',))
+        with self._lock:
+            board = self._boards.get(key)
+            if board and board.camps_version != camps_version:
+                self._discard(key)
+                board = None
+            if board and board.data_version == data_version:
+                self._boards.move_to_end(key)
+                HOT_BOARD_REQUESTS.inc(result='hit')
+                return board.version, board.sorted_rows()
+            base_version = board.version if board else None
+
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            version, floor = sticky_changes.board_version(c, key[0], key[1])
+            if base_version is not None and base_version == version:
+                result, changes = 'validated', None
+            elif base_version is not None and floor <= base_version < version:
+                result = 'refreshed'
+                changes = sticky_changes.fetch_changes(c, key[0], key[1], base_version, list(sticky_list.FIELDS))
+            else:
+                result = 'loaded'
+                sticky_list.query_stickies(c, list(sticky_list.FIELDS), school_id=key[0], theme_id=key[1])
+                loaded = [tuple(row) for row in c.fetchall()]
+        finally:
+            conn.close()
+        HOT_BOARD_REQUESTS.inc(result=result)
+
+        with self._lock:
+            board = self._boards.get(key)
+            if result == 'loaded':
+                board = _Board(version, data_version, camps_version)
+                for row in loaded:
+                    board.put(row)
+                self._store(key, board)
+                return version, board.sorted_rows()
+            if board is not None and not (changes and changes.get('snapshot_required')):
+                self._size -= board.size
+                if changes:
+                    for item in changes['stickies']:
+                        board.put(tuple(item[name] for name in sticky_list.FIELDS))
+                    for sticky_id in changes['deleted']:
+                        board.pop(sticky_id)
+                board.version = max(board.version, version)
+                board.data_version = data_version
+                self._size += board.size
+                self._boards.move_to_end(key)
+                self._evict()
+                return board.version, board.sorted_rows()
+            # 照合中に捨てられた・差分を作れなくなった場合は読み込み直す
+            self._discard(key)
+        return self.rows(school_id, theme_id)
+
+    def apply(self, school_id, theme_id, version, changes):
+        """書き込みの処理から付箋の変更を反映する（changes は項目名 -> 値。新しい付箋は全項目）
+
+        version は sticky_changes で上げたボードの版数。キャッシュの版数の直後でなければ
+        （他の書き込みを反映していなければ）何もせず、次の読み取りで SQLite から読み直す。
+        """
+        if school_id is None or theme_id is None:
+            return
+        key = (str(school_id), int(theme_id))
+        with self._lock:
+            board = self._boards.get(key)
+            if board is None or version != board.version + 1:
+                return
+            old = board.rows.get(changes['sticky_id'])
+            if old is None:
+                if any(name not in changes for name in sticky_list.FIELDS if name != 'updated_version'):
+                    return
+                row = [changes.get(name) for name in sticky_list.FIELDS]
+            else:
+                row = list(old)
+                for name, value in changes.items():
+                    if name in FIELD_INDEX:
+                        row[FIELD_INDEX[name]] = value
+            row[_UPDATED_VERSION] = version
+            self._size -= board.size
+            board.put(tuple(row))
+            board.version = version
+            self._size += board.size
+            self._evict()
+
+    def remove(self, school_id, theme_id, version, sticky_id):
+        """書き込みの処理から付箋の削除を反映する"""
+        if school_id is None or theme_id is None:
+            return
+        key = (str(school_id), int(theme_id))
+        with self._lock:
+            board = self._boards.get(key)
+            if board is None or version != board.version + 1:
+                return
+            self._size -= board.size
+            board.pop(sticky_id)
+            board.version = version
+            self._size += board.size
+
+    def _store(self, key, board):
+        if board.size > self.max_bytes:
+            return
+        self._discard(key)
+        self._boards[key] = board
+        self._size += board.size
+        self._evict()
+
+    def _discard(self, key):
+        board = self._boards.pop(key, None)
+        if board is not None:
+            self._size -= board.size
+
+    def _evict(self):
+        # 最も長く読まれていないボードから捨てる
+        while self._boards and (len(self._boards) > self.max_boards or self._size > self.max_bytes):
+            _, board = self._boards.popitem(last=False)
+            self._size -= board.size
+
+    def stats(self):
+        with self._lock:
+            return {'boards': len(self._boards), 'bytes': self._size}
+
+
+def page(rows, fields, cursor=None, limit=None):
+    """キャッシュの付箋から (項目を絞ったタプルのリスト, 次のページのカーソル) を返す
+
+    並びのキーはボードが変わったときに1回だけ作る（_SortedRows）ので、1ページは二分探索とページ分の切り出しで済む。
+    """
+    start = 0
+    if cursor:
+        keys = getattr(rows, 'sort_keys', None) or [_sort_key(row) for row in rows]
+        start = bisect.bisect_right(keys, (True,) + tuple(cursor))
+    end = len(rows) if not limit else min(len(rows), start + limit)
+    next_cursor = None
+    if end < len(rows):
+        next_cursor = sticky_list.encode_cursor(rows[end - 1][_DISPLAY_INDEX], rows[end - 1][_ID])
+    rows = rows[start:end]
+    indexes = [FIELD_INDEX[name] for name in fields]
+    return [tuple(row[i] for i in indexes) for row in rows], next_cursor
@@ -1,307 +1,5 @@
-import sqlite3
-from flask import current_app
-import os
+from components.migrations import migrate
 
 def init_db():
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    
-    # 外部キー制約を有効にする
-    c.execute('PRAGMA foreign_keys = ON')
-    
-    # students tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS students(
-        student_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        school_id TEXT NOT NULL,
-        name TEXT,
-        number TEXT NOT NULL,
-        class_id TEXT NOT NULL,
-        password TEXT NOT NULL,
-        user_type TEXT NOT NULL CHECK(user_type IN ('student', 'teacher')),
-        sum_point INTEGER DEFAULT 0,
-        have_point INTEGER DEFAULT 0,
-        camp_id INTEGER,
-        theme_color TEXT,
-        user_color TEXT,
-        ai_advice INTEGER DEFAULT 1,
-        blacklist_point INTEGER DEFAULT 0,
-        ex_flag INTEGER DEFAULT 0,
-        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-        UNIQUE(school_id, class_id, number, user_type)
-    )''')
-    
-    # students.ex_flag のマイグレーション（既存テーブルにカラム追加）
-    try:
-        c.execute('ALTER TABLE students ADD COLUMN ex_flag INTEGER DEFAULT 0')
-    except sqlite3.OperationalError:
-        # 既に存在する場合はスキップ
-        pass
-    
-    # sticky tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS sticky(
-        sticky_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        sticky_content TEXT NOT NULL,
-        sticky_color TEXT NOT NULL,
-        x_axis INTEGER DEFAULT 0,
-        y_axis INTEGER DEFAULT 0,
-        display_index INTEGER DEFAULT 0,
-        feedback_A INTEGER DEFAULT 0,
-        feedback_B INTEGER DEFAULT 0,
-        feedback_C INTEGER DEFAULT 0,
-        ai_summary_content TEXT,
-        ai_teammate_avg_prediction REAL DEFAULT 0,
-        ai_enemy_avg_prediction REAL DEFAULT 0,
-        ai_overall_avg_prediction REAL DEFAULT 0,
-        teammate_avg_score REAL DEFAULT 0,
-        enemy_avg_score REAL DEFAULT 0,
-        overall_avg_score REAL DEFAULT 0,
-        theme_id INTEGER NOT NULL,
-        author_camp_id INTEGER,
-        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-        FOREIGN KEY (student_id) REFERENCES students(student_id)
-        )''')
-    
-    # author_camp_id字段のマイグレーション
-    try:
-        c.execute('ALTER TABLE sticky ADD COLUMN author_camp_id INTEGER')
-        print("Added author_camp_id column to sticky table")
-    except sqlite3.OperationalError:
-        pass
-    
-    # display_index字段のマイグレーション（既存のテーブルに字段を追加）
-    try:
-        c.execute('ALTER TABLE sticky ADD COLUMN display_index INTEGER DEFAULT 0')
-        print("Added display_index column to sticky table")
-    except sqlite3.OperationalError:
-        # カラムが既に存在する場合はスキップする
-        pass
-    
-    # message tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS message(
-        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        message_content TEXT NOT NULL,
-        camp_id INTEGER NOT NULL,
-        sticky_id INTEGER NOT NULL,
-        feedback_A INTEGER DEFAULT 0,
-        feedback_B INTEGER DEFAULT 0,
-        feedback_C INTEGER DEFAULT 0,
-        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-        FOREIGN KEY (student_id) REFERENCES students(student_id),
-        FOREIGN KEY (sticky_id) REFERENCES sticky(sticky_id)
-        )''')
-    
-    # ai_help tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS ai_help(
-        ai_help_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sticky_id INTEGER NOT NULL,
-        student_id INTEGER NOT NULL,
-        school_id INTEGER NOT NULL,
-        ai_help TEXT NOT NULL,
-        FOREIGN KEY (sticky_id) REFERENCES sticky,
-        FOREIGN KEY (student_id) REFERENCES students,
-        FOREIGN KEY (school_id) REFERENCES teachers 
-    )''')
-    # colorsets tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS colorsets(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        group_number INTEGER NOT NULL,
-        camp_type INTEGER NOT NULL,
-        colors TEXT NOT NULL,
-        UNIQUE(group_number, camp_type)
-    )''')
-    
-    # teachers tableを作成
-    # numberは教員番号
-    c.execute('''CREATE TABLE IF NOT EXISTS teachers(
-        teacher_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        school_id TEXT NOT NULL,
-        class_id TEXT NOT NULL,
-        password TEXT NOT NULL,
-        number TEXT NOT NULL,
-        name TEXT,
-        user_type TEXT NOT NULL CHECK(user_type IN ('student', 'teacher')),
-        UNIQUE(school_id,class_id,number,user_type)
-    )''')
-    
-    # nameフィールドのマイグレーション（既存のテーブルにフィールドを追加）
-    try:
-        c.execute('ALTER TABLE teachers ADD COLUMN name TEXT')
-        print("Added name column to teachers table")
-    except sqlite3.OperationalError:
-        # カラムが既に存在する場合はスキップする
-        pass
-    
-    # reward tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS reward(
-        reward_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        reward_content TEXT NOT NULL UNIQUE,
-        need_point INTEGER NOT NULL,
-        need_rank INTEGER NOT NULL,
-        creater INTEGER NOT NULL,
-        FOREIGN KEY(creater) REFERENCES teachers(teacher_id)
-    )''')
-    
-    # holdReward tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS holdReward(
-        hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        reward_id INTEGER NOT NULL,
-        is_holding BOOLEAN NOT NULL,
-        used_at TIMESTAMP NULL,
-        FOREIGN KEY(student_id) REFERENCES students(id),
-        FOREIGN KEY(reward_id) REFERENCES reward(reward_id)
-    )''')
-    
-    # debate_settingsを作成(討論設定)
-    c.execute('''CREATE TABLE IF NOT EXISTS debate_settings (
-        theme_id     INTEGER PRIMARY KEY AUTOINCREMENT,
-        title        TEXT    NOT NULL,     -- テーマタイトル
-        description  TEXT,                  -- テーマの説明
-        colorset_id   INTEGER NOT NULL,          -- colorsets.id を参照
-        start_date   TIMESTAMP NOT NULL,   -- 開始日
-        end_date     TIMESTAMP NOT NULL,    -- 終了日
-        team1        TEXT    NOT NULL,
-        team2        TEXT    NOT NULL,
-        school_id    INTEGER NOT NULL,
-        winner       TEXT,                  -- 勝者
-        team1_score  REAL DEFAULT 0,        -- 陣営1の総得点
-        team2_score  REAL DEFAULT 0,        -- 陣営2の総得点
-        FOREIGN KEY(colorset_id) REFERENCES colorsets(id)
-    )''')
-    
-    # debate_settings表に新しいカラムを追加する
-    try:
-        c.execute('ALTER TABLE debate_settings ADD COLUMN winner TEXT')
-        print("Added winner column to debate_settings table")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        c.execute('ALTER TABLE debate_settings ADD COLUMN team1_score REAL DEFAULT 0')
-        print("Added team1_score column to debate_settings table")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        c.execute('ALTER TABLE debate_settings ADD COLUMN team2_score REAL DEFAULT 0')
-        print("Added team2_score column to debate_settings table")
-    except sqlite3.OperationalError:
-        pass
-
-    # campsを作成(陣営)
-    c.execute('''CREATE TABLE IF NOT EXISTS camps (
-        camp_id     INTEGER PRIMARY KEY AUTOINCREMENT,
-        theme_id    INTEGER NOT NULL,      -- どのテーマに属するか
-        camp_name   TEXT    NOT NULL,      -- 陣営名
-        is_winner   BOOLEAN NOT NULL DEFAULT 0,  -- 勝敗フラグ：勝者なら1
-        FOREIGN KEY(theme_id) REFERENCES debate_settings(theme_id)
-    )''')
-    
-    # sticky_votes tableを作成（投票記録）
-    c.execute('''CREATE TABLE IF NOT EXISTS sticky_votes(
-        vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,
-        sticky_id INTEGER NOT NULL,
-        vote_type TEXT NOT NULL CHECK(vote_type IN ('A', 'B', 'C')),
-        voter_camp_id INTEGER,
-        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-        FOREIGN KEY (student_id) REFERENCES students(student_id),
-        FOREIGN KEY (sticky_id) REFERENCES sticky(sticky_id),
-        UNIQUE(student_id, sticky_id)
-    )''')
-    
-    # sticky_room_votes tableを作成
-    c.execute('''CREATE TABLE IF NOT EXISTS sticky_room_votes(
-        room_vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sticky_id INTEGER NOT NULL,
-        message_id INTEGER NOT NULL,
-        voter_id integer NOT NULL,
-        school_id INTEGER NOT NULL,
-        vote_type TEXT NOT NULL CHECK(vote_type IN ('A', 'B', 'C')),
-        FOREIGN KEY (sticky_id) REFERENCES sticky(sticky_id),
-        FOREIGN KEY (message_id) REFERENCES messages(message_id),
-        FOREIGN KEY (voter_id) REFERENCES students(student_id),
-        FOREIGN KEY (school_id) REFERENCES students(school_id)
-    )''')
-    # voter_camp_id字段のマイグレーション
-    try:
-        c.execute('ALTER TABLE sticky_votes ADD COLUMN voter_camp_id INTEGER')
-        print("Added voter_camp_id column to sticky_votes table")
-    except sqlite3.OperationalError:
-        pass
-    
-    # rank_history tableを作成（ランク履歴）
-    c.execute('''CREATE TABLE IF NOT EXISTS rank_history(
-        history_id   INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id   INTEGER NOT NULL,        -- どのユーザーか
-        theme_id     INTEGER NOT NULL,        -- どのテーマか
-        sum_point    INTEGER NOT NULL,        -- その時点の合計ポイント
-        created_at   TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-        FOREIGN KEY(student_id) REFERENCES students(student_id),
-        FOREIGN KEY(theme_id)   REFERENCES debate_settings(theme_id)
-    )''')
-    
-    # notification tableを作成（通知）
-    c.execute('''CREATE TABLE IF NOT EXISTS notification(
-        notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER NOT NULL,          -- 報酬を使用した生徒
-        teacher_id INTEGER NOT NULL,          -- 通知を受け取る先生
-        reward_id INTEGER NOT NULL,           -- 使用された報酬
-        notification_content TEXT NOT NULL,   -- 通知内容
-        is_read BOOLEAN DEFAULT 0,            -- 既読フラグ
-        saved_time TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
-        FOREIGN KEY(student_id) REFERENCES students(student_id),
-        FOREIGN KEY(teacher_id) REFERENCES teachers(teacher_id),
-        FOREIGN KEY(reward_id) REFERENCES reward(reward_id),
-        UNIQUE(student_id, teacher_id, reward_id)  -- 重複防止のためのユニーク制約
-    )''')
-    
-    # colorsetsデータの挿入
-    colorsets_data = [
-        (1, 1, '["#8097f9", "#6273f2", "#343be4", "#373acb", "#2f33a4"]'),  # 1 陣営1
-        (1, 2, '["#faeada", "#f5d2b3", "#eeb483", "#e68c51", "#df6624"]'),  # 1 陣営2
-        (2, 1, '["#6c84ff", "#4959ff", "#2929ff", "#211ee4", "#1a1aaf"]'),  # 2 陣営1
-        (2, 2, '["#faeccb", "#f4d893", "#eec05b", "#eaa935", "#e38d24"]'),  # 2 陣営2
-        (3, 1, '["#8b7bff", "#6646ff", "#5321ff", "#450ff2", "#3a0ccd"]'),  # 3 陣営1
-        (3, 2, '["#effc8c", "#ecfa4a", "#eef619", "#e6e50c", "#d0bf08"]'),  # 3 陣営2
-        (4, 1, '["#c3b5fd", "#a58bfa", "#885df5", "#783bec", "#6325cd"]'),  # 4 陣営1
-        (4, 2, '["#fbfbea", "#f4f6d1", "#e8eda9", "#d7e076", "#bfcd41"]'),  # 4 陣営2
-        (5, 1, '["#c76bff", "#b333ff", "#a10cff", "#8d00f3", "#6e04b6"]'),  # 5 陣営1
-        (5, 2, '["#ffc472", "#fea039", "#fc8313", "#ed6809", "#cd510a"]'),  # 5 陣営2
-        (6, 1, '["#ead5ff", "#dab5fd", "#c485fb", "#ad57f5", "#9025e6"]'),  # 6 陣営1
-        (6, 2, '["#fdf9e9", "#fbf2c6", "#f8e290", "#f4ca50", "#efb121"]'),  # 6 陣営2
-        (7, 1, '["#fad3fb", "#f6b1f3", "#ef83e9", "#e253da", "#ba30b0"]'),  # 7 陣営1
-        (7, 2, '["#f8fbea", "#eef6d1", "#dceda9", "#c3df77", "#a0c937"]'),  # 7 陣営2
-        (8, 1, '["#f8d2e9", "#f4add7", "#ec7aba", "#e1539e", "#c12d74"]'),  # 8 陣営1
-        (8, 2, '["#dffcdc", "#c0f7bb", "#8fee87", "#56dd4b", "#2cb721"]'),  # 8 陣営2
-        (9, 1, '["#f6d4e5", "#efb2cf", "#e482ae", "#d85c91", "#c43a6e"]'),  # 9 陣営1
-        (9, 2, '["#cef9ef", "#9cf3e1", "#62e6cf", "#32cfb9", "#1bbfab"]'),  # 9 陣営2
-        (10, 1, '["#fcd4cc", "#f9b5a8", "#f48975", "#e9634a", "#d74b31"]'), # 10 陣営1
-        (10, 2, '["#cef9f0", "#9df2e0", "#64e4cf", "#35ccb8", "#1ec0ad"]'), # 10 陣営2
-    ]
-    
-    # データが存在しない場合は挿入
-    for group_num, camp_type, colors in colorsets_data:
-        c.execute('INSERT OR IGNORE INTO colorsets (group_number, camp_type, colors) VALUES (?, ?, ?)',
-                 (group_num, camp_type, colors))
-    
-    conn.commit()
-    conn.close()
-    
-#データベース接続関数を追加
-def get_db_connection():
-    # データベースファイルのパスを設定
-    db_path = 'database.db'  # 実際のデータベースファイル名に変更してください
-    
-    if not os.path.exists(db_path):
-        raise FileNotFoundError(f"データベースファイルが見つかりません: {db_path}")
-    
-    try:
-        conn = sqlite3.connect(db_path)
-        # 配列を辞書にしてくれる(本当は辞書だけど配列になっているから)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        raise
\ No newline at end of file
+    """データベースを最新のスキーマにする（最新なら user_version を読むだけ）"""
+    return migrate()
@@ -0,0 +1,463 @@
+"""LLM プロバイダーの切り替え
+
+付箋の要約・AIアドバイスはこのモジュールの get_provider() を通してモデルを呼ぶ。
+プロバイダーは環境変数で起動時に1回だけ設定する。
+
+    LLM_PROVIDER        gemini / fake / http / none（既定: GEMINI_API_KEY があれば gemini、無ければ none）
+    LLM_MODEL           モデル名（既定: gemini-2.5-flash）
+    LLM_TIMEOUT_SECONDS 1回の呼び出しのタイムアウト（既定 20 秒）
+
+fake（ローカルの決定的なモデル。負荷試験・ベンチマーク用）:
+    LLM_FAKE_LATENCY_MS   応答までの時間（既定 800）
+    LLM_FAKE_JITTER_MS    応答時間のゆらぎ（既定 200）
+    LLM_FAKE_FAILURE_RATE 失敗させる割合 0.0〜1.0（既定 0）
+    LLM_FAKE_SEED         ゆらぎ・失敗の乱数のシード
+
+http（components.llm_server などの HTTP サーバーに問い合わせる）:
+    LLM_HTTP_URL          既定 http://127.0.0.1:8765/generate
+
+get_provider() が返すプロバイダーは GuardedProvider で包まれていて、
+期限・同時実行数・学校ごとの呼び出し頻度・サーキットブレーカーで保護される。
+呼び出しが拒否・失敗した場合は LLMError になるので、呼び出し側は既存のフォールバックを使う。
+stream() は応答を部分ごとに返す（ストリーミングに対応していないプロバイダーは全体を1回で返す）。
+ストリーミングでは最初の部分と、部分どうしの間隔がそれぞれ LLM_DEADLINE_SECONDS 以内である必要がある。
+
+    LLM_DEADLINE_SECONDS          1回の呼び出しの期限（既定 8 秒）
+    LLM_MAX_CONCURRENCY           同時に実行する呼び出しの上限（既定 8）
+    LLM_RATE_PER_SCHOOL           学校ごとの呼び出し回数/秒（既定 2）
+    LLM_BURST_PER_SCHOOL          学校ごとに連続で呼び出せる回数（既定 10）
+    LLM_BREAKER_FAILURES          連続で何回失敗したらブレーカーを開くか（既定 5）
+    LLM_BREAKER_COOLDOWN_SECONDS  ブレーカーを開いておく時間（既定 30 秒）
+"""
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+import unicodedata
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from components.async_mode import run_blocking
+from components.logger import get_logger
+from components.metrics import LLM_FIRST_CHUNK, counter, gauge_func, observe_llm
+
+log = get_logger('llm')
+
+DEFAULT_MODEL = 'gemini-2.5-flash'
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '20'))
+
+
+class LLMError(Exception):
+    """モデルの呼び出しに失敗した（タイムアウトを含む）"""
+
+
+class LLMUnavailable(LLMError):
+    """ブレーカー・同時実行数・呼び出し頻度の制限で呼び出さなかった"""
+
+    def __init__(self, reason):
+        super().__init__(f"LLM call rejected: {reason}")
+        self.reason = reason
+
+
+class LLMProvider:
+    """プロバイダーの共通インターフェース"""
+    name = 'base'
+
+    def __init__(self, model, timeout=LLM_TIMEOUT_SECONDS):
+        self.model = model
+        self.timeout = timeout
+
+    def generate(self, prompt, operation='generate', timeout=None, school_id=None):
+        """prompt に対する応答の文字列を返す。失敗時は LLMError"""
+        with observe_llm(self.name, operation):
+            try:
+                # eventlet / gevent では SDK の呼び出しを OS スレッドで行う
+                return run_blocking(self._generate, prompt, timeout or self.timeout)
+            except LLMError:
+                raise
+            except Exception as e:
+                raise LLMError(f"{self.name}: {e}") from e
+
+    def stream(self, prompt, operation='generate', timeout=None, school_id=None):
+        """応答を部分ごとに返すジェネレーター。失敗時は LLMError"""
+        with observe_llm(self.name, operation):
+            start = time.perf_counter()
+            first = True
+            chunks = self._stream(prompt, timeout or self.timeout)
+            try:
+                while True:
+                    chunk = run_blocking(next, chunks, None)
+                    if chunk is None:
+                        break
+                    if not chunk:
+                        continue
+                    if first:
+                        LLM_FIRST_CHUNK.observe(time.perf_counter() - start, provider=self.name, operation=operation)
+                        first = False
+                    yield chunk
+            except LLMError:
+                raise
+            except Exception as e:
+                raise LLMError(f"{self.name}: {e}") from e
+
+    def _generate(self, prompt, timeout):
+        raise NotImplementedError
+
+    def _stream(self, prompt, timeout):
+        # ストリーミングに対応していないプロバイダーは全体を1回で返す
+        yield self._generate(prompt, timeout)
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, timeout=LLM_TIMEOUT_SECONDS):
+        super().__init__(model, timeout)
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model)
+
+    def _generate(self, prompt, timeout):
+        response = self._model.generate_content(prompt, request_options={'timeout': timeout})
+        return response.text if hasattr(response, "text") else str(response)
+
+    def _stream(self, prompt, timeout):
+        response = self._model.generate_content(prompt, stream=True, request_options={'timeout': timeout})
+        for chunk in response:
+            yield chunk.text if hasattr(chunk, "text") else str(chunk)
+
+
+def fake_response(prompt):
+    """プロンプトから決まる応答を返す（同じプロンプトには常に同じ応答）"""
+    text = ' '.join(unicodedata.normalize('NFKC', prompt).split())
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]
+    # 要約のプロンプトは「###内容###」の後ろが本文
+    if '###内容###' in text:
+        return text.split('###内容###', 1)[1][:30]
+    return f"（ローカルモデル {digest}）{text[-60:]}"
+
+
+class FakeProvider(LLMProvider):
+    """ローカルで決定的な応答を返すモデル。遅延・ゆらぎ・失敗を設定できる"""
+    name = 'fake'
+
+    def __init__(self, model='fake', timeout=LLM_TIMEOUT_SECONDS,
+                 latency_ms=800, jitter_ms=200, failure_rate=0.0, seed=None):
+        super().__init__(model, timeout)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # ストリーミング時の1回あたりの文字数と、最初の部分までにかかる時間の割合
+    STREAM_CHUNK_CHARS = 8
+    FIRST_CHUNK_RATIO = 0.25
+
+    def _draw(self):
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.failure_rate
+        return delay, fail
+
+    def _generate(self, prompt, timeout):
+        delay, fail = self._draw()
+        if delay > timeout:
+            time.sleep(timeout)
+            raise LLMError(f"fake: timed out after {timeout}s")
+        time.sleep(delay)
+        if fail:
+            raise LLMError("fake: injected failure")
+        return fake_response(prompt)
+
+    def _stream(self, prompt, timeout):
+        # 全体の時間は _generate と同じで、その一部で最初の部分を返し、残りを等間隔で返す
+        delay, fail = self._draw()
+        if delay > timeout:
+            time.sleep(timeout)
+            raise LLMError(f"fake: timed out after {timeout}s")
+        text = fake_response(prompt)
+        size = self.STREAM_CHUNK_CHARS
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+        time.sleep(delay * self.FIRST_CHUNK_RATIO)
+        if fail:
+            raise LLMError("fake: injected failure")
+        interval = delay * (1 - self.FIRST_CHUNK_RATIO) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(interval)
+            yield chunk
+
+
+class HttpProvider(LLMProvider):
+    """{"prompt": ...} を POST して {"text": ...} を受け取る HTTP のモデル"""
+    name = 'http'
+
+    def __init__(self, url, model='http', timeout=LLM_TIMEOUT_SECONDS):
+        super().__init__(model, timeout)
+        self.url = url
+
+    def _generate(self, prompt, timeout):
+        body = json.dumps({'prompt': prompt, 'model': self.model}).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as res:
+                return json.loads(res.read().decode('utf-8'))['text']
+        except urllib.error.HTTPError as e:
+            raise LLMError(f"http: status {e.code}") from e
+
+
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '8'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_RATE_PER_SCHOOL = float(os.getenv('LLM_RATE_PER_SCHOOL', '2'))
+LLM_BURST_PER_SCHOOL = float(os.getenv('LLM_BURST_PER_SCHOOL', '10'))
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv('LLM_BREAKER_COOLDOWN_SECONDS', '30'))
+
+LLM_REJECTIONS = counter(
+    'llm_guard_rejections_total', 'LLM calls not made because of a guard', ('reason',))
+LLM_BREAKER_TRANSITIONS = counter(
+    'llm_circuit_transitions_total', 'Circuit breaker state changes', ('state',))
+
+
+class TokenBucket:
+    """学校ごとのトークンバケット（rate 回/秒、最大 burst 回）"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            return True
+
+
+class CircuitBreaker:
+    """連続失敗で開き、一定時間後に1回だけ試行（half_open）して閉じるかを決める"""
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+    STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+
+    def _set_state(self, state):
+        if self.state != state:
+            self.state = state
+            LLM_BREAKER_TRANSITIONS.inc(state=state)
+            log.warning("LLM circuit breaker %s", state)
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(self.CLOSED)
+
+    def record_skipped(self):
+        """allow() の後、別の制限で呼び出さなかった（half_open の試行枠を戻す）"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def state_value(self):
+        with self._lock:
+            return self.STATE_VALUES[self.state]
+
+
+class GuardedProvider:
+    """プロバイダーを期限・同時実行数・呼び出し頻度・ブレーカーで保護する"""
+
+    def __init__(self, provider, deadline=LLM_DEADLINE_SECONDS, max_concurrency=LLM_MAX_CONCURRENCY,
+                 rate_per_school=LLM_RATE_PER_SCHOOL, burst_per_school=LLM_BURST_PER_SCHOOL,
+                 breaker_failures=LLM_BREAKER_FAILURES, breaker_cooldown=LLM_BREAKER_COOLDOWN_SECONDS):
+        self.provider = provider
+        self.name = provider.name
+        self.model = provider.model
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(breaker_failures, breaker_cooldown)
+        self.rate_limit = TokenBucket(rate_per_school, burst_per_school)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # 期限を過ぎた呼び出しを待たずに戻れるよう、呼び出しは専用スレッドで行う
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm-call')
+
+    def _admit(self, school_id):
+        """ブレーカー・呼び出し頻度・同時実行数を確認し、呼び出せなければ LLMUnavailable"""
+        if not self.breaker.allow():
+            self._reject('circuit_open')
+        if school_id is not None and not self.rate_limit.allow(str(school_id)):
+            self.breaker.record_skipped()
+            self._reject('rate_limited')
+        # 上限に達しているときは待たずにフォールバックさせる
+        if not self._semaphore.acquire(blocking=False):
+            self.breaker.record_skipped()
+            self._reject('concurrency')
+
+    def _submit(self, fn, *args):
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._semaphore.release()
+            self.breaker.record_skipped()
+            raise
+        # 期限切れで戻った後も、呼び出しが終わるまで同時実行数に数える
+        future.add_done_callback(lambda _: self._semaphore.release())
+        return future
+
+    def generate(self, prompt, operation='generate', timeout=None, school_id=None):
+        deadline = min(timeout or self.deadline, self.deadline)
+        self._admit(school_id)
+        future = self._submit(self.provider.generate, prompt, operation, deadline)
+        try:
+            result = future.result(timeout=deadline)
+        except FutureTimeoutError:
+            self.breaker.record_failure()
+            raise LLMError(f"{self.name}: deadline of {deadline}s exceeded")
+        except LLMError:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stream(self, prompt, operation='generate', timeout=None, school_id=None):
+        """応答を部分ごとに返すジェネレーターを返す（制限で呼び出せない場合はこの時点で LLMUnavailable）"""
+        deadline = min(timeout or self.deadline, self.deadline)
+        self._admit(school_id)
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                # 全体の時間はプロバイダーのタイムアウトで制限する
+                for chunk in self.provider.stream(prompt, operation):
+                    if cancelled.is_set():
+                        return
+                    chunks.put(('chunk', chunk))
+                chunks.put(('done', None))
+            except Exception as e:
+                chunks.put(('error', e))
+
+        self._submit(produce)
+        return self._consume(chunks, cancelled, deadline)
+
+    def _consume(self, chunks, cancelled, deadline):
+        recorded = False
+        try:
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=deadline)
+                except queue.Empty:
+                    recorded = True
+                    self.breaker.record_failure()
+                    raise LLMError(f"{self.name}: no chunk within {deadline}s")
+                if kind == 'chunk':
+                    yield value
+                elif kind == 'done':
+                    recorded = True
+                    self.breaker.record_success()
+                    return
+                else:
+                    recorded = True
+                    self.breaker.record_failure()
+                    raise value if isinstance(value, LLMError) else LLMError(f"{self.name}: {value}")
+        finally:
+            # 途中で読むのをやめた場合は、残りの部分を捨てさせる
+            cancelled.set()
+            if not recorded:
+                self.breaker.record_skipped()
+
+    def _reject(self, reason):
+        LLM_REJECTIONS.inc(reason=reason)
+        raise LLMUnavailable(reason)
+
+
+def create_provider():
+    """環境変数からプロバイダーを作成（使えるものが無ければ None）"""
+    api_key = os.getenv('GEMINI_API_KEY')
+    kind = os.getenv('LLM_PROVIDER') or ('gemini' if api_key else 'none')
+    model = os.getenv('LLM_MODEL')
+
+    if kind == 'gemini':
+        if not api_key:
+            log.warning("GEMINI_API_KEY not found in environment variables")
+            return None
+        return GeminiProvider(api_key, model or DEFAULT_MODEL)
+    if kind == 'fake':
+        seed = os.getenv('LLM_FAKE_SEED')
+        return FakeProvider(
+            model=model or 'fake',
+            latency_ms=float(os.getenv('LLM_FAKE_LATENCY_MS', '800')),
+            jitter_ms=float(os.getenv('LLM_FAKE_JITTER_MS', '200')),
+            failure_rate=float(os.getenv('LLM_FAKE_FAILURE_RATE', '0')),
+            seed=int(seed) if seed else None,
+        )
+    if kind == 'http':
+        return HttpProvider(os.getenv('LLM_HTTP_URL', 'http://127.0.0.1:8765/generate'), model or 'http')
+    if kind != 'none':
+        log.warning("Unknown LLM_PROVIDER: %s", kind)
+    return None
+
+
+_provider = None
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def get_provider():
+    """設定済みのプロバイダーを返す（初回に環境変数から作成。無効なら None）"""
+    global _provider, _configured
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                provider = create_provider()
+                if provider:
+                    _provider = GuardedProvider(provider)
+                    gauge_func('llm_circuit_state', 'LLM circuit breaker state (0=closed, 1=open, 2=half_open)',
+                               _provider.breaker.state_value)
+                    log.info("LLM provider: %s (%s)", provider.name, provider.model)
+                _configured = True
+    return _provider
+
+
+def set_provider(provider):
+    """プロバイダーを差し替える（ベンチマーク・検証用。保護が必要なら GuardedProvider で包んで渡す）"""
+    global _provider, _configured
+    with _configure_lock:
+        _provider = provider
+        _configured = True
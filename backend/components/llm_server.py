@@ -0,0 +1,74 @@
+"""ローカルの LLM 代替サーバー（負荷試験・ベンチマーク用）
+
+FakeProvider と同じ決定的な応答を HTTP で返す。LLM_PROVIDER=http と組み合わせると、
+アプリは実際のネットワーク呼び出しを含む経路でモデルを呼ぶ。
+
+使い方（backend ディレクトリで実行）:
+    python -m components.llm_server --port 8765 --latency-ms 800 --jitter-ms 200 --failure-rate 0.05
+
+    POST /generate  {"prompt": "..."}  ->  {"text": "..."}（失敗時は 503）
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from components.llm import FakeProvider, LLMError
+
+
+def make_handler(provider):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/generate':
+                self._send(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(length) or b'{}')
+                prompt = data['prompt']
+            except (ValueError, KeyError):
+                self._send(400, {'error': 'prompt が必要です'})
+                return
+            try:
+                self._send(200, {'text': provider.generate(prompt, operation='server')})
+            except LLMError as e:
+                self._send(503, {'error': str(e)})
+
+        def _send(self, status, body):
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            # アクセスログは出さない
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ローカルの LLM 代替サーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--jitter-ms', type=float, default=200)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    provider = FakeProvider(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            failure_rate=args.failure_rate, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(provider))
+    print(f"LLM stand-in server listening on http://{args.host}:{args.port}/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""サブシステムごとにレベルを設定できる非同期ロガー
+
+ログの出力はキュー経由で専用スレッドが行うので、リクエスト処理中のスレッドが
+標準出力への書き込みで待たされることはない。
+
+環境変数:
+    LOG_LEVEL   全体のレベル（既定 INFO）
+    LOG_LEVELS  サブシステムごとのレベル（例: "sticky=DEBUG,ai=WARNING"）
+    LOG_FORMAT  "json" にすると1行1JSONで出力（既定はテキスト）
+
+使い方（起動時に1回 setup_logging() を呼んでおく）:
+    from components.logger import get_logger
+    log = get_logger('sticky')
+    log.debug('付箋を作成', extra={'fields': {'sticky_id': sticky_id}})
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+ROOT_LOGGER_NAME = 'skproject'
+
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """extra={'fields': {...}} で渡された値を key=value（または JSON）で付け加える"""
+
+    def __init__(self, as_json=False):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = getattr(record, 'fields', None) or {}
+        if self.as_json:
+            entry = {
+                'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry['exc_info'] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        line = super().format(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+def _parse_levels(spec):
+    """"sticky=DEBUG,ai=WARNING" を {'sticky': 'DEBUG', 'ai': 'WARNING'} にする"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """ルートロガーにキューのハンドラを設定し、出力用のスレッドを開始する（2回目以降は何もしない）"""
+    global _listener
+    if _listener is not None:
+        return
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    root.propagate = False
+    for name, level in _parse_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(f'{ROOT_LOGGER_NAME}.{name}').setLevel(level)
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(StructuredFormatter(as_json=os.getenv('LOG_FORMAT') == 'json'))
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    # 終了時にキューに残ったログを書き出す
+    atexit.register(_listener.stop)
+
+
+def get_logger(subsystem):
+    """サブシステム用のロガーを取得（setup_logging() より前に取得しておいてもよい）"""
+    return logging.getLogger(f'{ROOT_LOGGER_NAME}.{subsystem}')
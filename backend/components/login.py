@@ -1,6 +1,6 @@
 from flask import jsonify, request
-import sqlite3
 from flask import Blueprint
+from components.db import get_db_connection
 
 login_o = Blueprint('login_o', __name__, url_prefix='/api')
 
@@ -22,7 +22,7 @@ def login():
         user_type = request.json['userType']
 
         try:
-            conn = sqlite3.connect('database.db')
+            conn = get_db_connection()
             c = conn.cursor()
 
             # ユーザーを調べる
@@ -73,7 +73,7 @@ def login():
         user_type = request.json['userType']
 
         try:
-            conn = sqlite3.connect('database.db')
+            conn = get_db_connection()
             c = conn.cursor()
 
             # ユーザーを調べる
@@ -1,6 +1,17 @@
 from flask import jsonify, request
-import sqlite3
 from flask import Blueprint
+from components.db import get_db_connection
+
+# 付箋のメッセージ一覧のクエリ（components.query_plan でも確認する）
+MESSAGES_SQL = '''SELECT m.message_id, m.student_id, m.message_content, m.camp_id, m.sticky_id, 
+                          m.feedback_A, m.feedback_B, m.feedback_C, m.created_at, s.name, s.number, s.user_color,
+                          v.vote_type
+                   FROM message m
+                   JOIN students s ON m.student_id = s.student_id
+                   LEFT JOIN sticky_room_votes v ON m.message_id = v.message_id 
+                        AND v.school_id = ? AND v.voter_id = ?
+                   WHERE m.sticky_id = ? ORDER BY m.created_at ASC'''
+MESSAGE_COUNT_SQL = 'SELECT COUNT(*) FROM message WHERE sticky_id = ?'
 
 message_o = Blueprint('message_o', __name__, url_prefix='/api')
 
@@ -16,7 +27,7 @@ def create_message():
             return jsonify({'error': f'{field}が必要です'}), 400
     
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         c.execute('''INSERT INTO message (student_id, message_content, camp_id, sticky_id, feedback_A, feedback_B, feedback_C) 
@@ -49,20 +60,11 @@ def get_messages_by_sticky(sticky_id):
         school_id = request.args.get('school_id')
         voter_id = request.args.get('voter_id')
         
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # 投票情報も含めてメッセージを取得
-        query = '''SELECT m.message_id, m.student_id, m.message_content, m.camp_id, m.sticky_id, 
-                          m.feedback_A, m.feedback_B, m.feedback_C, m.created_at, s.name, s.number, s.user_color,
-                          v.vote_type
-                   FROM message m
-                   JOIN students s ON m.student_id = s.student_id
-                   LEFT JOIN sticky_room_votes v ON m.message_id = v.message_id 
-                        AND v.school_id = ? AND v.voter_id = ?
-                   WHERE m.sticky_id = ? ORDER BY m.created_at ASC'''
-        
-        c.execute(query, (school_id, voter_id, sticky_id))
+        c.execute(MESSAGES_SQL, (school_id, voter_id, sticky_id))
         
         messages = []
         for row in c.fetchall():
@@ -83,7 +85,7 @@ def get_messages_by_sticky(sticky_id):
             })
         
         # メッセージ数を取得
-        c.execute('SELECT COUNT(*) FROM message WHERE sticky_id = ?', (sticky_id,))
+        c.execute(MESSAGE_COUNT_SQL, (sticky_id,))
         message_count = c.fetchone()[0]
         
         conn.close()
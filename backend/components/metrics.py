@@ -0,0 +1,331 @@
+"""リクエストのレイテンシ・SQL・LLM（Gemini）呼び出しのメトリクス
+
+Prometheus のテキスト形式で /metrics から取得できる。
+外部ライブラリは使わず、必要な Counter / Gauge / Histogram だけを実装している。
+
+    from components.metrics import init_app
+    init_app(app)   # 全ルート（Blueprint を含む）の計測と /metrics を登録
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# レイテンシ用のバケット（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1リクエストあたりの SQL 文の数のバケット
+SQL_COUNT_BUCKETS = (1, 2, 3, 5, 7, 10, 15, 25, 50, 100)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルが一致しません: {sorted(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class GaugeFunc(_Metric):
+    """取得時に関数を呼んで値を返すゲージ（関数は {ラベル値のタプル: 値} か数値を返す）"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, fn, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def render(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._render_samples(sorted(values.items())))
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス名が重複しています: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def gauge_func(name, documentation, fn, labelnames=()):
+    return REGISTRY.register(GaugeFunc(name, documentation, fn, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render():
+    """全メトリクスを Prometheus のテキスト形式で返す"""
+    return REGISTRY.render()
+
+
+# --- HTTP リクエスト ---
+REQUEST_LATENCY = histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method'))
+REQUEST_COUNT = counter(
+    'http_requests_total', 'HTTP requests by status code', ('endpoint', 'method', 'status'))
+REQUESTS_IN_FLIGHT = gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled')
+
+# --- SQL ---
+SQL_STATEMENTS = counter(
+    'sqlite_statements_total', 'SQL statements executed', ('endpoint',))
+SQL_STATEMENTS_PER_REQUEST = histogram(
+    'sqlite_statements_per_request', 'SQL statements executed per HTTP request', ('endpoint',),
+    buckets=SQL_COUNT_BUCKETS)
+SQL_TIME_PER_REQUEST = histogram(
+    'sqlite_time_per_request_seconds', 'Time spent in SQL per HTTP request', ('endpoint',))
+
+# --- LLM（Gemini・ローカルの代替モデル） ---
+LLM_LATENCY = histogram(
+    'llm_request_duration_seconds', 'LLM call latency', ('provider', 'operation', 'outcome'),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0))
+LLM_FIRST_CHUNK = histogram(
+    'llm_time_to_first_chunk_seconds', 'Time until a streaming LLM call returns its first chunk',
+    ('provider', 'operation'),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0))
+
+
+# --- リクエスト単位の SQL 計測 ---
+# 現在のスレッドで処理中のリクエストの SQL 文の数と時間を持つ
+_sql_local = threading.local()
+
+
+def _sql_state():
+    state = getattr(_sql_local, 'state', None)
+    if state is None:
+        state = _sql_local.state = {'endpoint': None, 'count': 0, 'seconds': 0.0}
+    return state
+
+
+def trace_sql(statement):
+    """sqlite3 の set_trace_callback に渡すコールバック（実行された SQL 文を数える）"""
+    state = _sql_state()
+    state['count'] += 1
+    SQL_STATEMENTS.inc(endpoint=state['endpoint'] or 'background')
+
+
+def add_sql_time(seconds):
+    """SQL の実行にかかった時間を現在のリクエストに加算する"""
+    _sql_state()['seconds'] += seconds
+
+
+def carry_sql_state(fn):
+    """別のスレッドで実行する fn の SQL を、呼び出し元のリクエストの計測に数える"""
+    state = _sql_state()
+
+    def call(*args, **kwargs):
+        previous = getattr(_sql_local, 'state', None)
+        _sql_local.state = state
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _sql_local.state = previous
+    return call
+
+
+@contextmanager
+def observe_llm(provider, operation):
+    """LLM 呼び出しの所要時間を outcome（ok / error）別に記録する"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        LLM_LATENCY.observe(time.perf_counter() - start, provider=provider, operation=operation, outcome=outcome)
+
+
+def _begin_request(endpoint):
+    state = _sql_state()
+    state['endpoint'] = endpoint
+    state['count'] = 0
+    state['seconds'] = 0.0
+
+
+def _end_request():
+    state = _sql_state()
+    result = state['count'], state['seconds']
+    state['endpoint'] = None
+    state['count'] = 0
+    state['seconds'] = 0.0
+    return result
+
+
+def init_app(app):
+    """全リクエストの計測フックと /metrics エンドポイントを登録する"""
+    from flask import Response, g, request
+
+    def endpoint_label():
+        # URL ではなくエンドポイント名を使い、ラベルの種類が増えすぎないようにする
+        return request.endpoint or 'unmatched'
+
+    @app.before_request
+    def _metrics_before_request():
+        g._metrics_start = time.perf_counter()
+        g._metrics_done = False
+        REQUESTS_IN_FLIGHT.inc()
+        _begin_request(endpoint_label())
+
+    def record(status):
+        if getattr(g, '_metrics_done', True):
+            return
+        g._metrics_done = True
+        endpoint = endpoint_label()
+        elapsed = time.perf_counter() - g._metrics_start
+        sql_count, sql_seconds = _end_request()
+        REQUESTS_IN_FLIGHT.dec()
+        REQUEST_LATENCY.observe(elapsed, endpoint=endpoint, method=request.method)
+        REQUEST_COUNT.inc(endpoint=endpoint, method=request.method, status=str(status))
+        SQL_STATEMENTS_PER_REQUEST.observe(sql_count, endpoint=endpoint)
+        SQL_TIME_PER_REQUEST.observe(sql_seconds, endpoint=endpoint)
+
+    @app.after_request
+    def _metrics_after_request(response):
+        record(response.status_code)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown_request(exc):
+        # 例外で after_request が呼ばれなかった場合
+        record(500)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    return app
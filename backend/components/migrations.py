@@ -0,0 +1,543 @@
+"""スキーマのマイグレーション
+
+適用済みのバージョンは PRAGMA user_version に記録し、未適用の番号付き
+マイグレーションだけをそれぞれ1トランザクションで適用する。
+スキーマを変更するときは既存のマイグレーションを書き換えず、末尾に追加すること。
+"""
+from components.db import connect
+from components.logger import get_logger
+
+log = get_logger('db')
+
+# (バージョン, 説明, 関数) のリスト。バージョン順に並べる
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """マイグレーションを登録するデコレータ"""
+    def register(fn):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"マイグレーションのバージョンが昇順ではありません: {version}")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    """登録されている最新のバージョン"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    """データベースに記録されているバージョン"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def add_column(c, table, column, decl):
+    """カラムが無ければ追加する（古いデータベース向け）"""
+    columns = [row[1] for row in c.execute(f'PRAGMA table_info({table})').fetchall()]
+    if column not in columns:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+        log.info("Added %s column to %s table", column, table)
+
+
+# よく使われる検索条件のためのインデックス（名前, テーブル, カラム）
+# 新しいインデックスはここに追加し、create_indexes() を呼ぶマイグレーションを足すこと
+# 追加・変更した場合は components/query_plan.py の HOT_QUERIES も確認すること
+INDEXES = [
+    # 学校単位での学生の絞り込み（付箋一覧・陣営リセット）
+    ('idx_students_school', 'students', ('school_id',)),
+    # 学校・テーマ単位の付箋一覧（display_index 順）。students を JOIN せずに絞り込める
+    ('idx_sticky_school_theme_display', 'sticky', ('school_id', 'theme_id', 'display_index')),
+    # テーマ単位の付箋一覧（display_index 順）
+    ('idx_sticky_theme_display', 'sticky', ('theme_id', 'display_index')),
+    # 学生ごとの付箋一覧
+    ('idx_sticky_student', 'sticky', ('student_id', 'display_index')),
+    # 付箋ごとの投票集計（得点計算）
+    # (student_id, sticky_id) での検索は UNIQUE 制約の自動インデックスが使われる
+    ('idx_sticky_votes_sticky', 'sticky_votes', ('sticky_id', 'vote_type')),
+    # 付箋ごとのチャットメッセージ（作成日時順）
+    ('idx_message_sticky_created', 'message', ('sticky_id', 'created_at')),
+    # メッセージへの投票（4カラムのキー検索とメッセージ一覧の LEFT JOIN の両方に使う）
+    ('idx_room_votes_key', 'sticky_room_votes', ('message_id', 'school_id', 'voter_id', 'sticky_id')),
+    # AIアドバイスの取得・更新
+    ('idx_ai_help_sticky_student', 'ai_help', ('sticky_id', 'student_id')),
+    # テーマごとの陣営一覧
+    ('idx_camps_theme', 'camps', ('theme_id',)),
+    # 学校ごとの最新テーマ
+    ('idx_debate_settings_school', 'debate_settings', ('school_id', 'end_date')),
+    # AI応答キャッシュの期限切れ削除
+    ('idx_ai_cache_expires', 'ai_cache', ('expires_at',)),
+    # 会話ダイジェストの差分取得（前回以降のメッセージを message_id 順に読む）
+    ('idx_message_sticky_id', 'message', ('sticky_id', 'message_id')),
+    # 付箋の差分同期（前回以降に変わった付箋を読む）
+    ('idx_sticky_updated_version', 'sticky', ('school_id', 'theme_id', 'updated_version')),
+    # 削除した付箋の差分同期
+    ('idx_sticky_tombstone_board', 'sticky_tombstone', ('school_id', 'theme_id', 'deleted_version')),
+]
+
+
+def create_indexes(c, names):
+    """INDEXES に定義したインデックスのうち names のものを作成（既にあればスキップ）"""
+    definitions = {name: (table, columns) for name, table, columns in INDEXES}
+    for name in names:
+        table, columns = definitions[name]
+        c.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table}({", ".join(columns)})')
+
+
+def migrate(db_path=None):
+    """未適用のマイグレーションを適用し、適用後のバージョンを返す"""
+    conn = connect(db_path)
+    # トランザクションは自分で管理する
+    conn.isolation_level = None
+    try:
+        version = current_version(conn)
+        if version >= latest_version():
+            return version
+
+        for target, description, fn in MIGRATIONS:
+            if target <= version:
+                continue
+            # 書き込みロックを取ってから再確認し、他のプロセスと同時に適用しないようにする
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = current_version(conn)
+                if target <= version:
+                    conn.execute('COMMIT')
+                    continue
+                fn(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {target}')
+                conn.execute('COMMIT')
+                version = target
+                log.info("Applied migration %s: %s", target, description)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return version
+    finally:
+        conn.close()
+
+
+@migration(1, 'initial schema')
+def _initial_schema(c):
+    # students tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS students(
+        student_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        school_id TEXT NOT NULL,
+        name TEXT,
+        number TEXT NOT NULL,
+        class_id TEXT NOT NULL,
+        password TEXT NOT NULL,
+        user_type TEXT NOT NULL CHECK(user_type IN ('student', 'teacher')),
+        sum_point INTEGER DEFAULT 0,
+        have_point INTEGER DEFAULT 0,
+        camp_id INTEGER,
+        theme_color TEXT,
+        user_color TEXT,
+        ai_advice INTEGER DEFAULT 1,
+        blacklist_point INTEGER DEFAULT 0,
+        ex_flag INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+        UNIQUE(school_id, class_id, number, user_type)
+    )''')
+
+    # students.ex_flag のマイグレーション（既存テーブルにカラム追加）
+    add_column(c, 'students', 'ex_flag', 'INTEGER DEFAULT 0')
+
+    # sticky tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS sticky(
+        sticky_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        sticky_content TEXT NOT NULL,
+        sticky_color TEXT NOT NULL,
+        x_axis INTEGER DEFAULT 0,
+        y_axis INTEGER DEFAULT 0,
+        display_index INTEGER DEFAULT 0,
+        feedback_A INTEGER DEFAULT 0,
+        feedback_B INTEGER DEFAULT 0,
+        feedback_C INTEGER DEFAULT 0,
+        ai_summary_content TEXT,
+        ai_teammate_avg_prediction REAL DEFAULT 0,
+        ai_enemy_avg_prediction REAL DEFAULT 0,
+        ai_overall_avg_prediction REAL DEFAULT 0,
+        teammate_avg_score REAL DEFAULT 0,
+        enemy_avg_score REAL DEFAULT 0,
+        overall_avg_score REAL DEFAULT 0,
+        theme_id INTEGER NOT NULL,
+        author_camp_id INTEGER,
+        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+        FOREIGN KEY (student_id) REFERENCES students(student_id)
+        )''')
+
+    # author_camp_id字段のマイグレーション
+    add_column(c, 'sticky', 'author_camp_id', 'INTEGER')
+
+    # display_index字段のマイグレーション（既存のテーブルに字段を追加）
+    add_column(c, 'sticky', 'display_index', 'INTEGER DEFAULT 0')
+
+    # message tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS message(
+        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        message_content TEXT NOT NULL,
+        camp_id INTEGER NOT NULL,
+        sticky_id INTEGER NOT NULL,
+        feedback_A INTEGER DEFAULT 0,
+        feedback_B INTEGER DEFAULT 0,
+        feedback_C INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+        FOREIGN KEY (student_id) REFERENCES students(student_id),
+        FOREIGN KEY (sticky_id) REFERENCES sticky(sticky_id)
+        )''')
+
+    # ai_help tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS ai_help(
+        ai_help_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sticky_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        school_id INTEGER NOT NULL,
+        ai_help TEXT NOT NULL,
+        FOREIGN KEY (sticky_id) REFERENCES sticky,
+        FOREIGN KEY (student_id) REFERENCES students,
+        FOREIGN KEY (school_id) REFERENCES teachers 
+    )''')
+    # colorsets tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS colorsets(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_number INTEGER NOT NULL,
+        camp_type INTEGER NOT NULL,
+        colors TEXT NOT NULL,
+        UNIQUE(group_number, camp_type)
+    )''')
+
+    # teachers tableを作成
+    # numberは教員番号
+    c.execute('''CREATE TABLE IF NOT EXISTS teachers(
+        teacher_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        school_id TEXT NOT NULL,
+        class_id TEXT NOT NULL,
+        password TEXT NOT NULL,
+        number TEXT NOT NULL,
+        name TEXT,
+        user_type TEXT NOT NULL CHECK(user_type IN ('student', 'teacher')),
+        UNIQUE(school_id,class_id,number,user_type)
+    )''')
+
+    # nameフィールドのマイグレーション（既存のテーブルにフィールドを追加）
+    add_column(c, 'teachers', 'name', 'TEXT')
+
+    # reward tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS reward(
+        reward_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reward_content TEXT NOT NULL UNIQUE,
+        need_point INTEGER NOT NULL,
+        need_rank INTEGER NOT NULL,
+        creater INTEGER NOT NULL,
+        FOREIGN KEY(creater) REFERENCES teachers(teacher_id)
+    )''')
+
+    # holdReward tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS holdReward(
+        hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        reward_id INTEGER NOT NULL,
+        is_holding BOOLEAN NOT NULL,
+        used_at TIMESTAMP NULL,
+        FOREIGN KEY(student_id) REFERENCES students(id),
+        FOREIGN KEY(reward_id) REFERENCES reward(reward_id)
+    )''')
+
+    # debate_settingsを作成(討論設定)
+    c.execute('''CREATE TABLE IF NOT EXISTS debate_settings (
+        theme_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+        title        TEXT    NOT NULL,     -- テーマタイトル
+        description  TEXT,                  -- テーマの説明
+        colorset_id   INTEGER NOT NULL,          -- colorsets.id を参照
+        start_date   TIMESTAMP NOT NULL,   -- 開始日
+        end_date     TIMESTAMP NOT NULL,    -- 終了日
+        team1        TEXT    NOT NULL,
+        team2        TEXT    NOT NULL,
+        school_id    INTEGER NOT NULL,
+        winner       TEXT,                  -- 勝者
+        team1_score  REAL DEFAULT 0,        -- 陣営1の総得点
+        team2_score  REAL DEFAULT 0,        -- 陣営2の総得点
+        FOREIGN KEY(colorset_id) REFERENCES colorsets(id)
+    )''')
+
+    # debate_settings表に新しいカラムを追加する
+    add_column(c, 'debate_settings', 'winner', 'TEXT')
+
+    add_column(c, 'debate_settings', 'team1_score', 'REAL DEFAULT 0')
+
+    add_column(c, 'debate_settings', 'team2_score', 'REAL DEFAULT 0')
+
+    # campsを作成(陣営)
+    c.execute('''CREATE TABLE IF NOT EXISTS camps (
+        camp_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+        theme_id    INTEGER NOT NULL,      -- どのテーマに属するか
+        camp_name   TEXT    NOT NULL,      -- 陣営名
+        is_winner   BOOLEAN NOT NULL DEFAULT 0,  -- 勝敗フラグ：勝者なら1
+        FOREIGN KEY(theme_id) REFERENCES debate_settings(theme_id)
+    )''')
+
+    # sticky_votes tableを作成（投票記録）
+    c.execute('''CREATE TABLE IF NOT EXISTS sticky_votes(
+        vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        sticky_id INTEGER NOT NULL,
+        vote_type TEXT NOT NULL CHECK(vote_type IN ('A', 'B', 'C')),
+        voter_camp_id INTEGER,
+        created_at TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+        FOREIGN KEY (student_id) REFERENCES students(student_id),
+        FOREIGN KEY (sticky_id) REFERENCES sticky(sticky_id),
+        UNIQUE(student_id, sticky_id)
+    )''')
+
+    # sticky_room_votes tableを作成
+    c.execute('''CREATE TABLE IF NOT EXISTS sticky_room_votes(
+        room_vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sticky_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        voter_id integer NOT NULL,
+        school_id INTEGER NOT NULL,
+        vote_type TEXT NOT NULL CHECK(vote_type IN ('A', 'B', 'C')),
+        FOREIGN KEY (sticky_id) REFERENCES sticky(sticky_id),
+        FOREIGN KEY (message_id) REFERENCES messages(message_id),
+        FOREIGN KEY (voter_id) REFERENCES students(student_id),
+        FOREIGN KEY (school_id) REFERENCES students(school_id)
+    )''')
+    # voter_camp_id字段のマイグレーション
+    add_column(c, 'sticky_votes', 'voter_camp_id', 'INTEGER')
+
+    # rank_history tableを作成（ランク履歴）
+    c.execute('''CREATE TABLE IF NOT EXISTS rank_history(
+        history_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id   INTEGER NOT NULL,        -- どのユーザーか
+        theme_id     INTEGER NOT NULL,        -- どのテーマか
+        sum_point    INTEGER NOT NULL,        -- その時点の合計ポイント
+        created_at   TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+        FOREIGN KEY(student_id) REFERENCES students(student_id),
+        FOREIGN KEY(theme_id)   REFERENCES debate_settings(theme_id)
+    )''')
+
+    # notification tableを作成（通知）
+    c.execute('''CREATE TABLE IF NOT EXISTS notification(
+        notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,          -- 報酬を使用した生徒
+        teacher_id INTEGER NOT NULL,          -- 通知を受け取る先生
+        reward_id INTEGER NOT NULL,           -- 使用された報酬
+        notification_content TEXT NOT NULL,   -- 通知内容
+        is_read BOOLEAN DEFAULT 0,            -- 既読フラグ
+        saved_time TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+        FOREIGN KEY(student_id) REFERENCES students(student_id),
+        FOREIGN KEY(teacher_id) REFERENCES teachers(teacher_id),
+        FOREIGN KEY(reward_id) REFERENCES reward(reward_id),
+        UNIQUE(student_id, teacher_id, reward_id)  -- 重複防止のためのユニーク制約
+    )''')
+
+    # colorsetsデータの挿入
+    colorsets_data = [
+        (1, 1, '["#8097f9", "#6273f2", "#343be4", "#373acb", "#2f33a4"]'),  # 1 陣営1
+        (1, 2, '["#faeada", "#f5d2b3", "#eeb483", "#e68c51", "#df6624"]'),  # 1 陣営2
+        (2, 1, '["#6c84ff", "#4959ff", "#2929ff", "#211ee4", "#1a1aaf"]'),  # 2 陣営1
+        (2, 2, '["#faeccb", "#f4d893", "#eec05b", "#eaa935", "#e38d24"]'),  # 2 陣営2
+        (3, 1, '["#8b7bff", "#6646ff", "#5321ff", "#450ff2", "#3a0ccd"]'),  # 3 陣営1
+        (3, 2, '["#effc8c", "#ecfa4a", "#eef619", "#e6e50c", "#d0bf08"]'),  # 3 陣営2
+        (4, 1, '["#c3b5fd", "#a58bfa", "#885df5", "#783bec", "#6325cd"]'),  # 4 陣営1
+        (4, 2, '["#fbfbea", "#f4f6d1", "#e8eda9", "#d7e076", "#bfcd41"]'),  # 4 陣営2
+        (5, 1, '["#c76bff", "#b333ff", "#a10cff", "#8d00f3", "#6e04b6"]'),  # 5 陣営1
+        (5, 2, '["#ffc472", "#fea039", "#fc8313", "#ed6809", "#cd510a"]'),  # 5 陣営2
+        (6, 1, '["#ead5ff", "#dab5fd", "#c485fb", "#ad57f5", "#9025e6"]'),  # 6 陣営1
+        (6, 2, '["#fdf9e9", "#fbf2c6", "#f8e290", "#f4ca50", "#efb121"]'),  # 6 陣営2
+        (7, 1, '["#fad3fb", "#f6b1f3", "#ef83e9", "#e253da", "#ba30b0"]'),  # 7 陣営1
+        (7, 2, '["#f8fbea", "#eef6d1", "#dceda9", "#c3df77", "#a0c937"]'),  # 7 陣営2
+        (8, 1, '["#f8d2e9", "#f4add7", "#ec7aba", "#e1539e", "#c12d74"]'),  # 8 陣営1
+        (8, 2, '["#dffcdc", "#c0f7bb", "#8fee87", "#56dd4b", "#2cb721"]'),  # 8 陣営2
+        (9, 1, '["#f6d4e5", "#efb2cf", "#e482ae", "#d85c91", "#c43a6e"]'),  # 9 陣営1
+        (9, 2, '["#cef9ef", "#9cf3e1", "#62e6cf", "#32cfb9", "#1bbfab"]'),  # 9 陣営2
+        (10, 1, '["#fcd4cc", "#f9b5a8", "#f48975", "#e9634a", "#d74b31"]'), # 10 陣営1
+        (10, 2, '["#cef9f0", "#9df2e0", "#64e4cf", "#35ccb8", "#1ec0ad"]'), # 10 陣営2
+    ]
+
+    # データが存在しない場合は挿入
+    for group_num, camp_type, colors in colorsets_data:
+        c.execute('INSERT OR IGNORE INTO colorsets (group_number, camp_type, colors) VALUES (?, ?, ?)',
+                 (group_num, camp_type, colors))
+
+
+@migration(2, 'hot path indexes')
+def _hot_path_indexes(c):
+    create_indexes(c, [
+        'idx_students_school',
+        'idx_sticky_theme_display',
+        'idx_sticky_student',
+        'idx_sticky_votes_sticky',
+        'idx_message_sticky_created',
+        'idx_room_votes_key',
+        'idx_ai_help_sticky_student',
+        'idx_camps_theme',
+        'idx_debate_settings_school',
+    ])
+
+
+@migration(3, 'denormalize school_id onto sticky')
+def _sticky_school_id(c):
+    add_column(c, 'sticky', 'school_id', 'TEXT')
+    # 既存の付箋は作成者の学校で埋める
+    c.execute('''
+        UPDATE sticky
+           SET school_id = (SELECT st.school_id FROM students st WHERE st.student_id = sticky.student_id)
+         WHERE school_id IS NULL
+    ''')
+    create_indexes(c, ['idx_sticky_school_theme_display'])
+
+
+@migration(4, 'incrementally maintained camp_score')
+def _camp_score(c):
+    # 陣営別得点（投票のたびに差分で更新する）
+    c.execute('''CREATE TABLE IF NOT EXISTS camp_score(
+        school_id   TEXT    NOT NULL,
+        theme_id    INTEGER NOT NULL,
+        camp_id     INTEGER NOT NULL,
+        score       INTEGER NOT NULL DEFAULT 0,
+        vote_count  INTEGER NOT NULL DEFAULT 0,   -- 集計に含めた投票数
+        PRIMARY KEY (school_id, theme_id, camp_id)
+    )''')
+    # 既存の投票から得点を作る。components.camp_score の変更でこのマイグレーションの結果が変わらないよう、
+    # この時点の採点（1/2 の論理IDはテーマの陣営の camp_id 順に対応させ、同陣営 A+2 B+1 C-1、敵陣営 A+6 B+3 C-1）を SQL で持つ
+    c.execute('DELETE FROM camp_score')
+    c.execute('''
+        INSERT INTO camp_score (school_id, theme_id, camp_id, score, vote_count)
+        WITH theme_camps AS (
+            SELECT theme_id, camp_id,
+                   ROW_NUMBER() OVER (PARTITION BY theme_id ORDER BY camp_id) AS logical_id,
+                   COUNT(*) OVER (PARTITION BY theme_id) AS camp_count
+              FROM camps
+             WHERE camp_id IS NOT NULL
+        ),
+        votes AS (
+            SELECT s.school_id, s.theme_id, sv.vote_type,
+                   COALESCE((SELECT tc.camp_id FROM theme_camps tc
+                              WHERE tc.theme_id = s.theme_id AND tc.camp_count >= 2 AND tc.logical_id <= 2
+                                AND tc.logical_id = CAST(s.author_camp_id AS INTEGER)),
+                            CAST(s.author_camp_id AS INTEGER)) AS camp_id,
+                   COALESCE((SELECT tc.camp_id FROM theme_camps tc
+                              WHERE tc.theme_id = s.theme_id AND tc.camp_count >= 2 AND tc.logical_id <= 2
+                                AND tc.logical_id = CAST(sv.voter_camp_id AS INTEGER)),
+                            CAST(sv.voter_camp_id AS INTEGER)) AS voter_camp_id
+              FROM sticky_votes sv
+              JOIN sticky s ON sv.sticky_id = s.sticky_id
+             WHERE s.author_camp_id IS NOT NULL
+               AND sv.voter_camp_id IS NOT NULL
+        )
+        SELECT school_id, theme_id, camp_id,
+               SUM(CASE
+                   WHEN camp_id = voter_camp_id
+                   THEN CASE vote_type WHEN 'A' THEN 2 WHEN 'B' THEN 1 WHEN 'C' THEN -1 ELSE 0 END
+                   ELSE CASE vote_type WHEN 'A' THEN 6 WHEN 'B' THEN 3 WHEN 'C' THEN -1 ELSE 0 END
+                   END),
+               COUNT(*)
+          FROM votes
+         GROUP BY school_id, theme_id, camp_id
+    ''')
+
+
+@migration(5, 'theme settlement marker')
+def _theme_settlement(c):
+    add_column(c, 'debate_settings', 'settled_at', 'TIMESTAMP')
+    # 以前は得点APIを呼ぶたびに勝者とポイントを書き込んでいたので、
+    # 勝者が記録済みのテーマは精算済みとして扱う（ポイントの二重付与を防ぐ）
+    c.execute('''
+        UPDATE debate_settings
+           SET settled_at = datetime('now', '+9 hours')
+         WHERE winner IS NOT NULL AND settled_at IS NULL
+    ''')
+
+
+@migration(6, 'ai response cache')
+def _ai_cache(c):
+    # Gemini の応答キャッシュ（キーはテンプレートのバージョン・モデル・正規化した入力のハッシュ）
+    c.execute('''CREATE TABLE IF NOT EXISTS ai_cache(
+        cache_key   TEXT PRIMARY KEY,
+        kind        TEXT NOT NULL,     -- summary / advice
+        value       TEXT NOT NULL,
+        created_at  REAL NOT NULL,     -- UNIX 時刻
+        expires_at  REAL NOT NULL
+    )''')
+    create_indexes(c, ['idx_ai_cache_expires'])
+
+
+@migration(7, 'conversation digest for ai help')
+def _conversation_digest(c):
+    # 付箋チャットの要約と直近の発言（AIアドバイスのプロンプト用）
+    c.execute('''CREATE TABLE IF NOT EXISTS conversation_digest(
+        sticky_id        INTEGER PRIMARY KEY,
+        summary          TEXT NOT NULL DEFAULT '',    -- 直近の枠から押し出された発言の要約
+        recent_messages  TEXT NOT NULL DEFAULT '[]',  -- 直近の発言（JSON）
+        last_message_id  INTEGER NOT NULL DEFAULT 0,  -- ここまでのメッセージを取り込み済み
+        message_count    INTEGER NOT NULL DEFAULT 0,
+        total_length     INTEGER NOT NULL DEFAULT 0,
+        speaker_counts   TEXT NOT NULL DEFAULT '{}',  -- student_id ごとの発言数（JSON）
+        last_student_id  INTEGER,
+        updated_at       TIMESTAMP DEFAULT (datetime('now', '+9 hours'))
+    )''')
+    create_indexes(c, ['idx_message_sticky_id'])
+
+
+@migration(8, 'sticky version')
+def _sticky_version(c):
+    # 付箋を更新するたびに増やす版数（sticky_updated の差分をクライアントが順に適用するため）
+    add_column(c, 'sticky', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+@migration(9, 'board event log')
+def _board_event(c):
+    # 学校ごとのボードのイベント（EVENT_LOG_PERSIST=1 のとき、再接続したクライアントへの再送に使う）
+    c.execute('''CREATE TABLE IF NOT EXISTS board_event(
+        school_id   TEXT NOT NULL,
+        seq         INTEGER NOT NULL,   -- 学校ごとの連番
+        event       TEXT NOT NULL,
+        payload     TEXT NOT NULL,      -- JSON
+        created_at  TIMESTAMP DEFAULT (datetime('now', '+9 hours')),
+        PRIMARY KEY (school_id, seq)
+    ) WITHOUT ROWID''')
+
+
+@migration(10, 'sticky change tracking')
+def _sticky_changes(c):
+    # ボードごとの版数（付箋の作成・更新・削除のたびに上がる）と、付箋が最後に変わったときの版数
+    c.execute('''CREATE TABLE IF NOT EXISTS board_version(
+        school_id        TEXT NOT NULL,
+        theme_id         INTEGER NOT NULL,
+        version          INTEGER NOT NULL DEFAULT 0,
+        tombstone_floor  INTEGER NOT NULL DEFAULT 0,   -- これより前の削除の記録は消してある
+        PRIMARY KEY (school_id, theme_id)
+    ) WITHOUT ROWID''')
+    # 削除した付箋（差分同期で削除を伝えるため）
+    c.execute('''CREATE TABLE IF NOT EXISTS sticky_tombstone(
+        sticky_id        INTEGER PRIMARY KEY,
+        school_id        TEXT NOT NULL,
+        theme_id         INTEGER NOT NULL,
+        deleted_version  INTEGER NOT NULL,
+        deleted_at       TIMESTAMP DEFAULT (datetime('now', '+9 hours'))
+    )''')
+    add_column(c, 'sticky', 'updated_version', 'INTEGER NOT NULL DEFAULT 0')
+    # 既存の付箋は版数 1 で作られたことにする（since=0 で全件が返る）
+    c.execute('UPDATE sticky SET updated_version = 1')
+    c.execute('''
+        INSERT OR IGNORE INTO board_version (school_id, theme_id, version)
+        SELECT DISTINCT school_id, theme_id, 1 FROM sticky WHERE school_id IS NOT NULL
+    ''')
+    create_indexes(c, ['idx_sticky_updated_version', 'idx_sticky_tombstone_board'])
+
+
+@migration(11, 'change log for cross-process cache invalidation')
+def _change_log(c):
+    # 書き込みと同じトランザクションで追記し、各プロセスが読んでキャッシュを無効にする（components.change_bus）
+    c.execute('''CREATE TABLE IF NOT EXISTS change_log(
+        change_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl         TEXT NOT NULL,      -- 変更したテーブル
+        key         TEXT,               -- 変更した範囲（NULL ならテーブル全体）
+        origin      TEXT NOT NULL,      -- 書き込んだプロセス（自分の変更は読み飛ばす）
+        created_at  REAL NOT NULL       -- UNIX 時刻
+    )''')
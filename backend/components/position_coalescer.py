@@ -0,0 +1,167 @@
+"""付箋のドラッグ中の位置をまとめて配信・保存する
+
+ドラッグ中は付箋ごとに最新の位置だけをメモリに持ち、学校ごとに最大 POSITION_BROADCAST_HZ 回/秒で
+sticky_positions イベントとしてまとめて送信する。
+データベースへは POSITION_FLUSH_SECONDS ごと、またはドラッグ終了時にまとめて書き込む。
+書き込むときは付箋の版数（sticky.version）とボードの版数（components.sticky_changes）も上げるので、
+差分で同期しているクライアントにも保存した位置が届く。
+"""
+import os
+import threading
+import time
+
+from components import sticky_changes
+from components.db import get_db_connection
+from components.logger import get_logger
+from components.metrics import counter, histogram
+
+log = get_logger('position')
+
+# 学校ごとに位置を送信する最大頻度（回/秒）
+POSITION_BROADCAST_HZ = float(os.getenv('POSITION_BROADCAST_HZ', '20'))
+# 位置をデータベースに書き込む間隔（秒）
+POSITION_FLUSH_SECONDS = float(os.getenv('POSITION_FLUSH_SECONDS', '1'))
+
+POSITION_UPDATES = counter(
+    'sticky_position_updates_total', 'Sticky position updates received')
+POSITION_BROADCASTS = counter(
+    'sticky_position_broadcasts_total', 'Batched sticky_positions events sent')
+POSITION_FLUSH_ROWS = histogram(
+    'sticky_position_flush_rows', 'Sticky positions written per database flush',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+
+
+class PositionCoalescer:
+    def __init__(self, emit, broadcast_hz=POSITION_BROADCAST_HZ, flush_seconds=POSITION_FLUSH_SECONDS, on_saved=None):
+        # emit(school_id, positions) -> positions は [{sticky_id, x_axis, y_axis}] のリスト
+        # on_saved(school_id, positions) は保存が終わった位置を学校ごとに受け取る（positions には version を含む）
+        self.emit = emit
+        self.on_saved = on_saved
+        self.interval = 1.0 / broadcast_hz
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._broadcast = {}   # school_id -> {sticky_id: (x, y)} まだ送信していない位置
+        self._dirty = {}       # sticky_id -> (x, y) まだ保存していない位置
+        self._schools = {}     # sticky_id -> school_id（保存してドラッグが止まったら捨てる）
+        self._flush_now = threading.Event()
+        self._thread = None
+
+    def school_of(self, sticky_id):
+        """付箋の学校IDを返す（付箋が無ければ None）。ドラッグ中に毎回 DB を引かないようにキャッシュする"""
+        with self._lock:
+            if sticky_id in self._schools:
+                return self._schools[sticky_id]
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT school_id FROM sticky WHERE sticky_id = ?', (sticky_id,))
+            row = c.fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        with self._lock:
+            self._schools[sticky_id] = row[0]
+        return row[0]
+
+    def update(self, sticky_id, school_id, x, y, final=False):
+        """最新の位置を記録する（final=True ならすぐに保存する）"""
+        POSITION_UPDATES.inc()
+        with self._lock:
+            self._broadcast.setdefault(school_id, {})[sticky_id] = (x, y)
+            self._dirty[sticky_id] = (x, y)
+        if final:
+            self._flush_now.set()
+
+    def discard(self, sticky_id):
+        """付箋の未送信・未保存の位置を捨てる（PATCH での位置の更新や削除の後）"""
+        with self._lock:
+            self._dirty.pop(sticky_id, None)
+            self._schools.pop(sticky_id, None)
+            for positions in self._broadcast.values():
+                positions.pop(sticky_id, None)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sticky-positions', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while True:
+            flush_now = self._flush_now.wait(self.interval)
+            if flush_now:
+                self._flush_now.clear()
+            try:
+                self.broadcast()
+                if flush_now or time.monotonic() >= next_flush:
+                    self.flush()
+                    next_flush = time.monotonic() + self.flush_seconds
+            except Exception as e:
+                log.exception("Failed to process sticky positions: %s", e)
+
+    def broadcast(self):
+        """未送信の位置を学校ごとに1回のイベントで送信する"""
+        with self._lock:
+            pending, self._broadcast = self._broadcast, {}
+        for school_id, positions in pending.items():
+            if not positions:
+                continue
+            try:
+                self.emit(school_id, [
+                    {'sticky_id': sticky_id, 'x_axis': x, 'y_axis': y}
+                    for sticky_id, (x, y) in positions.items()
+                ])
+                POSITION_BROADCASTS.inc()
+            except Exception as e:
+                log.warning("Failed to send sticky positions to school %s: %s", school_id, e)
+
+    def flush(self):
+        """未保存の位置をまとめて書き込み、書き込んだ件数を返す"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            schools = {sticky_id: self._schools.get(sticky_id) for sticky_id in dirty}
+        if not dirty:
+            return 0
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.executemany('UPDATE sticky SET x_axis = ?, y_axis = ?, version = version + 1 WHERE sticky_id = ?',
+                          [(x, y, sticky_id) for sticky_id, (x, y) in dirty.items()])
+            versions = {}
+            for sticky_id in dirty:
+                sticky_changes.mark_sticky_changed(c, sticky_id)
+                c.execute('SELECT version FROM sticky WHERE sticky_id = ?', (sticky_id,))
+                row = c.fetchone()
+                if row:
+                    versions[sticky_id] = row[0]
+            conn.commit()
+        except Exception as e:
+            # 書き込めなかった位置は、その後に新しい位置が来ていなければ次回に持ち越す
+            with self._lock:
+                for sticky_id, position in dirty.items():
+                    self._dirty.setdefault(sticky_id, position)
+            log.warning("Failed to save sticky positions: %s", e)
+            return 0
+        finally:
+            conn.close()
+        POSITION_FLUSH_ROWS.observe(len(dirty))
+        with self._lock:
+            # 保存した後に動いていない付箋の学校IDは捨てる（次にドラッグされたら引き直す）
+            for sticky_id in dirty:
+                if sticky_id not in self._dirty and not any(sticky_id in p for p in self._broadcast.values()):
+                    self._schools.pop(sticky_id, None)
+        if self.on_saved:
+            saved = {}
+            for sticky_id, (x, y) in dirty.items():
+                # 削除された付箋（version が無い）は送らない
+                if schools[sticky_id] is not None and sticky_id in versions:
+                    saved.setdefault(schools[sticky_id], []).append(
+                        {'sticky_id': sticky_id, 'x_axis': x, 'y_axis': y, 'version': versions[sticky_id]})
+            for school_id, positions in saved.items():
+                try:
+                    self.on_saved(school_id, positions)
+                except Exception as e:
+                    log.warning("Failed to record saved positions for school %s: %s", school_id, e)
+        return len(dirty)
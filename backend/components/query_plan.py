@@ -0,0 +1,86 @@
+"""ホットパスのクエリが全件走査(SCAN)になっていないかを EXPLAIN QUERY PLAN で確認する
+
+使い方（backend ディレクトリで実行）:
+    python -m components.query_plan
+
+SCAN が見つかった場合は終了コード 1 で終了する。
+"""
+import sys
+
+from components import ai_cache, ai_help, camp_score, conversation_digest, message, room_vote
+from components import sticky_changes, sticky_list
+from components.db import connect
+
+
+class _CaptureCursor:
+    """execute() された SQL とパラメータを記録するだけのカーソル（クエリを組み立てる関数から SQL を取り出す）"""
+
+    def execute(self, sql, params=()):
+        self.sql, self.params = sql, tuple(params)
+
+
+def _sticky_query(name, fields=None, **kwargs):
+    """付箋一覧と同じ sticky_list.query_stickies() で組み立てたクエリを返す"""
+    c = _CaptureCursor()
+    sticky_list.query_stickies(c, fields or list(sticky_list.FIELDS), **kwargs)
+    return name, c.sql, c.params
+
+
+# 確認対象のクエリ（名前, SQL, ダミーのパラメータ）
+# SQL はハンドラが実際に使う組み立て関数・定数から取るので、ハンドラを変えればここで確認する SQL も変わる
+HOT_QUERIES = [
+    _sticky_query('sticky_board', school_id='1', theme_id=1),
+    _sticky_query('sticky_by_school', school_id='1'),
+    _sticky_query('sticky_by_student', student_id=1),
+    _sticky_query('sticky_board_page', ['sticky_id', 'display_index', 'sticky_color'],
+                  school_id='1', theme_id=1, cursor=(0, 0), limit=100),
+    _sticky_query('sticky_changes', school_id='1', theme_id=1, updated_since=0),
+    ('sticky_tombstones', sticky_changes.TOMBSTONES_SQL, ('1', 1, 0)),
+    ('sticky_max_display_index', sticky_list.MAX_DISPLAY_INDEX_SQL, ('1',)),
+    ('sticky_vote_lookup', sticky_list.VOTE_STATUS_SQL, (1, 1)),
+    ('messages_by_sticky', message.MESSAGES_SQL, (1, 1, 1)),
+    ('message_count', message.MESSAGE_COUNT_SQL, (1,)),
+    ('room_vote_lookup', room_vote.ROOM_VOTE_LOOKUP_SQL, (1, 1, 1, 1)),
+    ('room_vote_counts', room_vote.ROOM_VOTE_COUNTS_SQL, (1, 1, 1)),
+    ('ai_help_lookup', ai_help.AI_HELP_SQL, (1, 1)),
+    ('camp_scores', camp_score.CAMP_SCORES_SQL, ('1', 1)),
+    ('camps_by_theme', camp_score.CAMP_IDS_SQL, (1,)),
+    ('digest_new_messages', conversation_digest.NEW_MESSAGES_SQL, (1, 0)),
+    ('digest_lookup', conversation_digest.DIGEST_SQL, (1,)),
+    ('ai_cache_lookup', ai_cache.CACHE_GET_SQL, ('x', 0)),
+]
+
+
+def explain(conn, sql, params):
+    """EXPLAIN QUERY PLAN の detail 列を返す"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+
+def audit_query_plans(conn, queries=None):
+    """SCAN になっているクエリを (名前, detail) のリストで返す（空なら問題なし）"""
+    failures = []
+    for name, sql, params in (queries or HOT_QUERIES):
+        for detail in explain(conn, sql, params):
+            if detail.startswith('SCAN'):
+                failures.append((name, detail))
+    return failures
+
+
+def main():
+    conn = connect()
+    try:
+        failures = audit_query_plans(conn)
+    finally:
+        conn.close()
+
+    if failures:
+        for name, detail in failures:
+            print(f"NG  {name}: {detail}")
+        return 1
+
+    print(f"OK  {len(HOT_QUERIES)} queries use indexes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""読み取り API の ETag（条件付き GET）
+
+リソースごとの版数をプロセス内に持ち、書き込みのたびに bump() で上げる。
+GET のレスポンスには版数から作った強い ETag を付け、If-None-Match が一致すれば
+ビューを呼ばずに（SQLite に触れずに）304 を返す。
+
+    ('board', school_id, theme_id)   学校・テーマの付箋一覧（付箋・投票の書き込みで上がる）
+    ('board', school_id, '*')        テーマが分からない書き込み（位置の保存など）。学校の全テーマの一覧を無効にする
+    ('board', school_id)             学校の付箋一覧（テーマを問わず上がる）
+    ('student_camps',)               学生の陣営（付箋一覧の author_camp_id に影響する）
+    ('themes',)                      テーマ（debate_settings）
+    ('colorsets',)                   カラーセット
+
+ETag には版数に加えてクエリ文字列（fields・limit・cursor・since など）のハッシュを含めるので、
+同じリソースでも表現が違えば一致しない。
+
+版数はプロセスごとなので、ETag には起動ごとの epoch を含める（再起動すると全て一致しなくなる）。
+他のワーカーでの書き込みは components.change_bus から通知を受けて版数を上げる（CHANGE_BUS_POLL_SECONDS 以内）ので
+古い内容に 304 を返すことはないが、ETag が一致するのは発行したワーカーへの GET だけで、
+ロードバランサーで別のワーカーに振り分けられた条件付き GET は常に 200 になる。
+HTTP_ETAGS=0 で無効にできる。
+"""
+import functools
+import hashlib
+import os
+import threading
+import uuid
+
+from flask import current_app, request
+
+from components import change_bus
+
+HTTP_ETAGS = os.getenv('HTTP_ETAGS', '1') == '1'
+
+_epoch = uuid.uuid4().hex[:12]
+_lock = threading.Lock()
+_versions = {}
+
+
+def bump(*keys):
+    """リソースの版数を上げる（書き込みをコミットした後に呼ぶ）"""
+    with _lock:
+        for key in keys:
+            _versions[key] = _versions.get(key, 0) + 1
+
+
+def version(key):
+    """リソースの現在の版数"""
+    with _lock:
+        return _versions.get(key, 0)
+
+
+def etag(keys, args=None):
+    """リソースの現在の版数とクエリの引数から ETag（引用符なし）を作る"""
+    with _lock:
+        versions = [_versions.get(key, 0) for key in keys]
+    tag = f"{_epoch}-{'.'.join(map(str, versions))}"
+    if args:
+        # 引数の順序によらず同じ表現なら同じ ETag にする
+        normalized = '&'.join(f"{name}={value}" for name, value in sorted(args))
+        tag += '-' + hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+    return tag
+
+
+def board_keys(school_id, theme_id=None):
+    """付箋一覧の ETag に使うキー"""
+    if theme_id:
+        return [('board', str(school_id), str(theme_id)), ('board', str(school_id), '*'), ('student_camps',)]
+    return [('board', str(school_id)), ('student_camps',)]
+
+
+def bump_board(school_id, theme_id=None):
+    """付箋・投票の書き込みで学校・テーマの付箋一覧を無効にする（theme_id が不明なら学校の全テーマ）"""
+    bump(('board', str(school_id)), ('board', str(school_id), str(theme_id) if theme_id else '*'))
+
+
+def invalidate_all():
+    """全ての ETag を無効にする（他のプロセスの変更を読み遅れたとき）"""
+    global _epoch
+    with _lock:
+        _epoch = uuid.uuid4().hex[:12]
+
+
+def _on_sticky_changed(table, key):
+    # key は "school_id:theme_id"（sticky_changes.next_board_version）
+    if key is None:
+        invalidate_all()
+        return
+    school_id, _, theme_id = key.partition(':')
+    bump_board(school_id, theme_id)
+
+
+def _on_students_changed(table, key):
+    bump(('student_camps',))
+
+
+def _on_themes_changed(table, key):
+    bump(('themes',))
+
+
+change_bus.subscribe('sticky', _on_sticky_changed)
+change_bus.subscribe('students', _on_students_changed)
+change_bus.subscribe('debate_settings', _on_themes_changed)
+
+
+def conditional(keys):
+    """GET のビューに ETag を付けるデコレーター
+
+    keys(*args, **kwargs) はビューと同じ引数でリソースのキーのリストを返す（None なら ETag を付けない）。
+    版数はビューを呼ぶ前に読むので、読み取り中に書き込みがあっても次の GET では一致しない。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            resource_keys = keys(*args, **kwargs) if HTTP_ETAGS else None
+            if resource_keys is None:
+                return view(*args, **kwargs)
+            tag = etag(resource_keys, request.args.items(multi=True))
+            if request.if_none_match.contains(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            # キャッシュした場合も毎回 If-None-Match で確認させる
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
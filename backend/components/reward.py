@@ -1,7 +1,7 @@
 from flask import jsonify, request
 import sqlite3
 from flask import Blueprint
-from components.init import get_db_connection
+from components.db import get_db_connection
 
 reward_o = Blueprint('reward_o', __name__, url_prefix='/api')
 
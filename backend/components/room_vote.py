@@ -1,6 +1,21 @@
 from flask import jsonify, request
-import sqlite3
 from flask import Blueprint
+from components.db import get_db_connection
+from components.logger import get_logger
+
+# 投票の確認と集計のクエリ（components.query_plan でも確認する）
+ROOM_VOTE_LOOKUP_SQL = '''SELECT room_vote_id FROM sticky_room_votes 
+                     WHERE sticky_id = ? AND message_id = ? AND voter_id = ? AND school_id = ?'''
+ROOM_VOTE_COUNTS_SQL = '''
+            SELECT 
+                vote_type,
+                COUNT(*) as count
+            FROM sticky_room_votes 
+            WHERE sticky_id = ? AND message_id = ? AND school_id = ?
+            GROUP BY vote_type
+        '''
+
+log = get_logger('room_vote')
 
 room_vote_o = Blueprint('room_vote_o', __name__, url_prefix='/api')
 
@@ -15,7 +30,7 @@ def submit_room_vote():
             return jsonify({'error': f'{field}が必要です'}), 400
     
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         sticky_id = request.json['sticky_id']
@@ -24,11 +39,11 @@ def submit_room_vote():
         school_id = request.json['school_id']
         vote_type = request.json['vote_type']
         
-        print(sticky_id, message_id, voter_id, school_id, vote_type)
+        log.debug("Room vote", extra={'fields': {
+            'sticky_id': sticky_id, 'message_id': message_id, 'voter_id': voter_id,
+            'school_id': school_id, 'vote_type': vote_type}})
         # 既存の投票をチェック
-        c.execute('''SELECT room_vote_id FROM sticky_room_votes 
-                     WHERE sticky_id = ? AND message_id = ? AND voter_id = ? AND school_id = ?''', 
-                  (sticky_id, message_id, voter_id, school_id))
+        c.execute(ROOM_VOTE_LOOKUP_SQL, (sticky_id, message_id, voter_id, school_id))
         
         existing_vote = c.fetchone()
         
@@ -63,18 +78,11 @@ def submit_room_vote():
 def update_message_feedback_counts(sticky_id, message_id, school_id):
     """sticky_room_votesから投票数を集計してmessagesテーブルを更新"""
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # sticky_room_votesから投票数を集計
-        c.execute('''
-            SELECT 
-                vote_type,
-                COUNT(*) as count
-            FROM sticky_room_votes 
-            WHERE sticky_id = ? AND message_id = ? AND school_id = ?
-            GROUP BY vote_type
-        ''', (sticky_id, message_id, school_id))
+        c.execute(ROOM_VOTE_COUNTS_SQL, (sticky_id, message_id, school_id))
         
         vote_counts = c.fetchall()
         
@@ -102,10 +110,11 @@ def update_message_feedback_counts(sticky_id, message_id, school_id):
         conn.commit()
         conn.close()
         
-        print(f"Updated message {message_id} feedback counts: A={feedback_A}, B={feedback_B}, C={feedback_C}")
+        log.debug("Updated message %s feedback counts: A=%s, B=%s, C=%s",
+                  message_id, feedback_A, feedback_B, feedback_C)
         
     except Exception as e:
-        print(f"Error updating message feedback counts: {e}")
+        log.exception("Error updating message feedback counts: %s", e)
         if conn:
             conn.close()
 
@@ -122,7 +131,7 @@ def update_all_message_feedback():
         if not sticky_id or not school_id:
             return jsonify({'error': 'sticky_id と school_id が必要です'}), 400
         
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # 指定されたsticky_idの全メッセージを取得
@@ -140,7 +149,7 @@ def update_all_message_feedback():
                 update_message_feedback_counts(sticky_id, message_id, school_id)
                 updated_count += 1
             except Exception as e:
-                print(f"Error updating message {message_id}: {e}")
+                log.warning("Error updating message %s: %s", message_id, e)
         
         return jsonify({
             'success': True,
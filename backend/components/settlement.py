@@ -0,0 +1,146 @@
+"""テーマ終了時の精算（勝敗の記録と学生ポイントの付与）
+
+精算はテーマごとに1回だけ、1トランザクションで行う。
+debate_settings.settled_at が精算済みの印で、これを先に立てた
+プロセス（スレッド）だけがポイントを付与する。
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from components.camp_score import fetch_camp_scores
+from components.db import get_db_connection
+from components.logger import get_logger
+from components import resource_version
+from components.change_bus import log_change
+
+log = get_logger('settlement')
+
+# 自分の付箋が受けた投票1件あたりのポイント
+# 同陣営からの投票: A(+10), B(+5), C(-5)
+SAME_CAMP_STUDENT_POINTS = {'A': 10, 'B': 5, 'C': -5}
+# 敵陣営からの投票: A(+30), B(+15), C(-5)
+ENEMY_CAMP_STUDENT_POINTS = {'A': 30, 'B': 15, 'C': -5}
+
+# 終了したテーマを確認する間隔（秒）
+SETTLEMENT_INTERVAL_SECONDS = int(os.getenv('SETTLEMENT_INTERVAL_SECONDS', '60'))
+
+
+def _points_case(points):
+    return 'CASE sv.vote_type ' + ' '.join(
+        f"WHEN '{vote_type}' THEN {point}" for vote_type, point in points.items()
+    ) + ' ELSE 0 END'
+
+
+# 付箋の作成者ごとの獲得ポイントを集計して students に加算する
+_AWARD_POINTS_SQL = f'''
+    UPDATE students
+       SET sum_point = COALESCE(sum_point, 0) + awarded.points,
+           have_point = COALESCE(have_point, 0) + awarded.points
+      FROM (
+        SELECT st.student_id,
+               SUM(CASE WHEN st.author_camp_id = sv.voter_camp_id
+                        THEN {_points_case(SAME_CAMP_STUDENT_POINTS)}
+                        ELSE {_points_case(ENEMY_CAMP_STUDENT_POINTS)} END) AS points
+          FROM sticky st
+          JOIN sticky_votes sv ON st.sticky_id = sv.sticky_id
+         WHERE st.school_id = ? AND st.theme_id = ?
+           AND st.author_camp_id IS NOT NULL
+           AND sv.voter_camp_id IS NOT NULL
+         GROUP BY st.student_id
+      ) AS awarded
+     WHERE students.student_id = awarded.student_id
+'''
+
+
+def settle_theme(conn, school_id, theme_id):
+    """テーマを精算する。精算した場合は結果の dict、精算済み・テーマ無しなら None を返す"""
+    c = conn.cursor()
+    # 最初に書き込みロックを取り、精算済みの印を立てる
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute('''
+            UPDATE debate_settings
+               SET settled_at = datetime('now', '+9 hours')
+             WHERE theme_id = ? AND settled_at IS NULL
+        ''', (theme_id,))
+        if c.rowcount == 0:
+            conn.rollback()
+            return None
+
+        # debate_settings に合計点と勝者を保存
+        camp_rows = fetch_camp_scores(c, school_id, theme_id)
+        winner_name = None
+        team1_score = team2_score = 0.0
+        if len(camp_rows) >= 2:
+            team1_score = float(camp_rows[0]['score'])
+            team2_score = float(camp_rows[1]['score'])
+            if team1_score > team2_score:
+                winner_name = camp_rows[0]['camp_name']
+            elif team2_score > team1_score:
+                winner_name = camp_rows[1]['camp_name']
+            else:
+                winner_name = 'draw'
+
+            c.execute('''
+                UPDATE debate_settings
+                   SET winner = ?, team1_score = ?, team2_score = ?
+                 WHERE theme_id = ?
+            ''', (winner_name, team1_score, team2_score, theme_id))
+
+        # 学生ポイント（自分の付箋が受けた評価のみ）をまとめて加算
+        c.execute(_AWARD_POINTS_SQL, (school_id, theme_id))
+        awarded_students = c.rowcount
+        log_change(conn, 'debate_settings', theme_id)
+
+        conn.commit()
+        # 勝者・合計点が debate_settings に入るので、テーマの ETag を無効にする
+        resource_version.bump(('themes',))
+        return {
+            'theme_id': theme_id,
+            'winner': winner_name,
+            'team1_score': team1_score,
+            'team2_score': team2_score,
+            'awarded_students': awarded_students,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def settle_ended_themes():
+    """終了日時を過ぎた未精算のテーマをすべて精算し、精算結果のリストを返す"""
+    conn = get_db_connection()
+    try:
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows = conn.execute('''
+            SELECT theme_id, school_id FROM debate_settings
+             WHERE settled_at IS NULL AND end_date <= ?
+        ''', (now,)).fetchall()
+
+        results = []
+        for theme_id, school_id in rows:
+            result = settle_theme(conn, str(school_id), theme_id)
+            if result:
+                results.append(result)
+        return results
+    finally:
+        conn.close()
+
+
+def _settlement_loop():
+    while True:
+        try:
+            for result in settle_ended_themes():
+                log.info("Settled theme", extra={'fields': result})
+        except Exception as e:
+            log.exception("Error in settlement loop: %s", e)
+        time.sleep(SETTLEMENT_INTERVAL_SECONDS)
+
+
+def start_settlement_worker():
+    """終了したテーマを定期的に精算するスレッドを開始"""
+    thread = threading.Thread(target=_settlement_loop, name='theme-settlement', daemon=True)
+    thread.start()
+    return thread
@@ -1,6 +1,7 @@
 from flask import jsonify, request
 import sqlite3
 from flask import Blueprint
+from components.db import get_db_connection
 
 signup_o = Blueprint('signup_o', __name__, url_prefix='/api')
 
@@ -27,7 +28,7 @@ def signup():
             return jsonify({'error': '無効なユーザータイプです'}), 400
         
         try:
-            conn = sqlite3.connect('database.db')
+            conn = get_db_connection()
             c = conn.cursor()
             
             # ユーザーがすでに存在するか確認
@@ -76,7 +77,7 @@ def signup():
             return jsonify({'error': '無効なユーザータイプです'}), 400
         
         try:
-            conn = sqlite3.connect('database.db')
+            conn = get_db_connection()
             c = conn.cursor()
             
             # ユーザーがすでに存在するか確認
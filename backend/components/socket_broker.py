@@ -0,0 +1,123 @@
+"""ローカルのメッセージブローカー（複数ワーカーの Socket.IO 配信の検証・開発用）
+
+Redis の代わりに、受け取った1行（JSON）を受信中のすべての接続（最初に SUBSCRIBE を送った接続）にそのまま配る。
+SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:6390 を設定したワーカーはこのブローカーを経由して
+他のワーカーに接続しているクライアントにもイベントを届ける（components.socket_queue）。
+永続化や再送はしないので、本番では redis:// などを使う。
+
+使い方（backend ディレクトリで実行）:
+    python -m components.socket_broker --port 6390
+"""
+import argparse
+import queue
+import socket
+import socketserver
+import threading
+
+# 受信する接続が最初に送る1行。これを送らない接続は送信専用として扱い、配信しない
+SUBSCRIBE = b'SUBSCRIBE\n'
+# 受信側ごとに溜めておくメッセージ数。溢れた（読むのが遅い）受信側は切断する
+BROKER_QUEUE_SIZE = 10000
+# 受信側への1回の書き込みを待つ秒数
+BROKER_WRITE_TIMEOUT = 5
+
+
+class _Subscriber:
+    def __init__(self, sock):
+        self.sock = sock
+        self.queue = queue.Queue(maxsize=BROKER_QUEUE_SIZE)
+
+
+class Broker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _Handler)
+        self._lock = threading.Lock()
+        self._clients = set()
+
+    def add(self, subscriber):
+        with self._lock:
+            self._clients.add(subscriber)
+
+    def remove(self, subscriber):
+        with self._lock:
+            self._clients.discard(subscriber)
+
+    def publish(self, line):
+        # キューに入れるだけなので、遅い受信側がいても他の受信側への配信は止まらない。
+        # ロックの中で入れるので、どの受信側にも同じ順序で届く
+        with self._lock:
+            for subscriber in list(self._clients):
+                try:
+                    subscriber.queue.put_nowait(line)
+                except queue.Full:
+                    self._clients.discard(subscriber)
+                    try:
+                        subscriber.sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            first = self.rfile.readline()
+        except OSError:
+            return
+        if first == SUBSCRIBE:
+            self._send_to_subscriber()
+        else:
+            self._receive_from_publisher(first)
+
+    def _receive_from_publisher(self, first):
+        try:
+            line = first
+            while line:
+                if line.strip():
+                    self.server.publish(line)
+                line = self.rfile.readline()
+        except OSError:
+            pass
+
+    def _send_to_subscriber(self):
+        # 配信はこの接続のスレッドが自分のキューから書き出す
+        subscriber = _Subscriber(self.request)
+        self.request.settimeout(BROKER_WRITE_TIMEOUT)
+        self.server.add(subscriber)
+        try:
+            while True:
+                self.wfile.write(subscriber.queue.get())
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            self.server.remove(subscriber)
+
+
+def serve(host='127.0.0.1', port=6390):
+    """ブローカーを起動して返す（別スレッドで動く。止めるときは shutdown()）"""
+    broker = Broker((host, port))
+    threading.Thread(target=broker.serve_forever, name='socket-broker', daemon=True).start()
+    return broker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ローカルのメッセージブローカー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+
+    broker = Broker((args.host, args.port))
+    print(f"Socket.IO broker listening on {args.host}:{args.port}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.server_close()
+
+
+if __name__ == '__main__':
+    main()
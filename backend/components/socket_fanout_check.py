@@ -0,0 +1,177 @@
+"""複数ワーカー間の Socket.IO 配信の確認
+
+ローカルブローカー（components.socket_broker）と2つのワーカー（server.py）を一時的な DB で起動し、
+ワーカー1への HTTP リクエストで送られたイベントが、ワーカー2に接続したクライアントに届くことを確認する。
+
+    sticky_created    POST /api/sticky
+    feedback_updated  POST /api/sticky/<id>/feedback
+
+必要なパッケージ（確認を実行する側だけ）:
+    pip install "python-socketio[client]"
+
+使い方（backend ディレクトリで実行。すべて届けば終了コード 0）:
+    python -m components.socket_fanout_check
+    python -m components.socket_fanout_check --async-mode threading
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def post(url, body):
+    req = urllib.request.Request(url, data=json.dumps(body).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=10) as res:
+        return json.loads(res.read().decode('utf-8'))
+
+
+def seed(db_path):
+    """テーマ・陣営2つ・生徒2人（別陣営）を作成して (theme_id, author_id, voter_id) を返す"""
+    sys.path.insert(0, BACKEND_DIR)
+    from components.db import connect
+    from components.migrations import migrate
+
+    migrate(db_path)
+    conn = connect(db_path)
+    c = conn.cursor()
+    c.execute('''INSERT INTO debate_settings (title, colorset_id, school_id, start_date, end_date, team1, team2)
+                 VALUES ('確認用テーマ', 1, '1', '2000-01-01 00:00:00', '2999-01-01 00:00:00', 'A', 'B')''')
+    theme_id = c.lastrowid
+    camp_ids = []
+    for name in ('A', 'B'):
+        c.execute('INSERT INTO camps (theme_id, camp_name) VALUES (?, ?)', (theme_id, name))
+        camp_ids.append(c.lastrowid)
+    student_ids = []
+    for i, camp_id in enumerate(camp_ids):
+        c.execute('''INSERT INTO students (school_id, name, number, class_id, password, user_type, camp_id)
+                     VALUES ('1', ?, ?, '1', 'x', 'student', ?)''', (f'student{i}', str(i), camp_id))
+        student_ids.append(c.lastrowid)
+    conn.commit()
+    conn.close()
+    return theme_id, student_ids[0], student_ids[1]
+
+
+def start_worker(port, env, log_path):
+    with open(log_path, 'wb') as log_file:
+        return subprocess.Popen([sys.executable, 'server.py'], cwd=BACKEND_DIR,
+                                env=dict(env, PORT=str(port), HOST='127.0.0.1'),
+                                stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def run(args):
+    import socketio
+
+    tmp = tempfile.mkdtemp(prefix='socket-fanout-')
+    db_path = os.path.join(tmp, 'database.db')
+    theme_id, author_id, voter_id = seed(db_path)
+
+    broker_port, port1, port2 = free_port(), free_port(), free_port()
+    env = dict(os.environ,
+               DATABASE_PATH=db_path,
+               SOCKETIO_ASYNC_MODE=args.async_mode,
+               SOCKETIO_MESSAGE_QUEUE=f'local://127.0.0.1:{broker_port}',
+               LLM_PROVIDER='none',
+               LOG_LEVEL='WARNING')
+    processes = [subprocess.Popen([sys.executable, '-m', 'components.socket_broker', '--port', str(broker_port)],
+                                  cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)]
+    try:
+        if not wait_for_port(broker_port):
+            print('FAIL broker did not start')
+            return 1
+        processes += [start_worker(port, env, os.path.join(tmp, f'worker{port}.log')) for port in (port1, port2)]
+        for port in (port1, port2):
+            if not wait_for_port(port):
+                print(f'FAIL worker on port {port} did not start (see {tmp}/worker{port}.log)')
+                return 1
+
+        received = {}
+        arrived = threading.Event()
+        client = socketio.Client(reconnection=False)
+
+        @client.on('*')
+        def on_any(event, data):
+            received.setdefault(event, []).append(data)
+            arrived.set()
+
+        client.connect(f'http://127.0.0.1:{port2}')
+        client.emit('join_school', {'school_id': '1'})
+        # 参加が処理されるまで少し待つ
+        time.sleep(0.5)
+
+        def expect(event, timeout=args.timeout):
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                if received.get(event):
+                    return received[event][-1]
+                arrived.wait(0.1)
+                arrived.clear()
+            return None
+
+        failures = 0
+        base1 = f'http://127.0.0.1:{port1}'
+        sticky = post(f'{base1}/api/sticky', {
+            'student_id': author_id, 'sticky_content': '別のワーカーにも届くか確認する付箋',
+            'sticky_color': '#ffffff', 'theme_id': theme_id})
+        sticky_id = sticky.get('sticky_id')
+        data = expect('sticky_created')
+        if data and data.get('sticky_id') == sticky_id:
+            print(f'ok   sticky_created sticky_id={sticky_id}')
+        else:
+            print(f'FAIL sticky_created not delivered (response={sticky})')
+            failures += 1
+
+        post(f'{base1}/api/sticky/{sticky_id}/feedback', {'student_id': voter_id, 'feedback_type': 'A'})
+        data = expect('feedback_updated')
+        if data and data.get('feedback_A') == 1:
+            print(f'ok   feedback_updated sticky_id={data.get("sticky_id")}')
+        else:
+            print(f'FAIL feedback_updated not delivered ({data})')
+            failures += 1
+
+        client.disconnect()
+        return 1 if failures else 0
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='複数ワーカー間の Socket.IO 配信の確認')
+    parser.add_argument('--async-mode', default='eventlet', choices=('eventlet', 'gevent', 'threading'))
+    parser.add_argument('--timeout', type=float, default=5, help='イベントを待つ秒数')
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Socket.IO の同時接続数の負荷試験
+
+多数のクライアントを接続して学校のルームに参加させ、接続を保ったまま HTTP の応答時間を測る。
+同じ条件で開発サーバー（python app.py）と本番用（python server.py）に対して実行して比べる。
+
+必要なパッケージ（試験を実行する側だけ）:
+    pip install python-socketio aiohttp
+
+使い方（backend ディレクトリで実行）:
+    python -m components.socket_loadtest --url http://127.0.0.1:5000 --clients 2000 --ramp 200 --hold 30
+
+出力:
+    connected / failed     接続できた・できなかったクライアント数
+    connect p50 / p95      接続にかかった時間
+    dropped                保持中に切断されたクライアント数
+    http p50 / p95         接続を保持している間の GET /metrics の応答時間
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def open_client(url, school_id, transports, timeout):
+    import socketio
+    client = socketio.AsyncClient(reconnection=False)
+    state = {'dropped': False}
+
+    @client.event
+    async def disconnect():
+        state['dropped'] = True
+
+    start = time.perf_counter()
+    await asyncio.wait_for(client.connect(url, transports=transports), timeout)
+    elapsed = time.perf_counter() - start
+    await client.emit('join_school', {'school_id': school_id})
+    return client, state, elapsed
+
+
+async def probe_http(url, seconds, interval):
+    import aiohttp
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + seconds
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.get(f"{url}/metrics") as res:
+                    await res.read()
+                    if res.status != 200:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+            await asyncio.sleep(interval)
+    return latencies, errors
+
+
+async def run(args):
+    transports = ['websocket'] if args.websocket_only else ['polling', 'websocket']
+    clients = []
+    connect_times = []
+    failed = 0
+
+    # ramp 台ずつ同時に接続する
+    for offset in range(0, args.clients, args.ramp):
+        batch = min(args.ramp, args.clients - offset)
+        results = await asyncio.gather(
+            *(open_client(args.url, args.school_id, transports, args.timeout) for _ in range(batch)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                failed += 1
+            else:
+                client, state, elapsed = result
+                clients.append((client, state))
+                connect_times.append(elapsed)
+        print(f"  {len(clients)} connected, {failed} failed")
+
+    latencies, http_errors = await probe_http(args.url, args.hold, args.probe_interval)
+    dropped = sum(1 for _, state in clients if state['dropped'])
+
+    print(f"connected    {len(clients)}")
+    print(f"failed       {failed}")
+    print(f"connect p50  {percentile(connect_times, 0.5) * 1000:.0f} ms")
+    print(f"connect p95  {percentile(connect_times, 0.95) * 1000:.0f} ms")
+    print(f"dropped      {dropped}")
+    if latencies:
+        print(f"http p50     {statistics.median(latencies) * 1000:.0f} ms")
+        print(f"http p95     {percentile(latencies, 0.95) * 1000:.0f} ms")
+    print(f"http errors  {http_errors}")
+
+    await asyncio.gather(*(client.disconnect() for client, _ in clients), return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO の同時接続数の負荷試験')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--ramp', type=int, default=100, help='同時に接続を始めるクライアント数')
+    parser.add_argument('--hold', type=float, default=30, help='接続を保持する秒数')
+    parser.add_argument('--timeout', type=float, default=20, help='1クライアントの接続のタイムアウト（秒）')
+    parser.add_argument('--probe-interval', type=float, default=0.5)
+    parser.add_argument('--school-id', default='1')
+    parser.add_argument('--websocket-only', action='store_true')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""複数ワーカーで Socket.IO のイベントを共有するメッセージキューの設定
+
+あるワーカーで emit したイベントを、別のワーカーに接続しているクライアントにも届ける。
+SOCKETIO_MESSAGE_QUEUE で使うキューを選ぶ（未設定なら1プロセスのみ）。
+
+    redis://localhost:6379/0      Redis（redis パッケージが必要）
+    amqp://guest@localhost//      RabbitMQ など kombu が対応するもの（kombu パッケージが必要）
+    local://127.0.0.1:6390        components.socket_broker（検証・開発用のローカルブローカー）
+
+    SOCKETIO_CHANNEL              キューのチャンネル名（既定 flask-socketio）
+"""
+import json
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+from components.logger import get_logger
+from components.socket_broker import SUBSCRIBE
+
+log = get_logger('socket_queue')
+
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'flask-socketio')
+
+# ブローカーに再接続するまでの待ち時間の上限（秒）
+_MAX_RETRY_SECONDS = 30
+
+
+class LocalBrokerManager(socketio.PubSubManager):
+    """components.socket_broker を使うクライアントマネージャー
+
+    1行1メッセージの JSON {"channel": ..., "data": ...} を送り、ブローカーから届いた
+    同じチャンネルのメッセージを PubSubManager に渡す。
+    """
+    name = 'local'
+
+    def __init__(self, url='local://127.0.0.1:6390', channel=SOCKETIO_CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6390
+        self._publish_sock = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        sock.settimeout(None)
+        return sock
+
+    def _publish(self, data):
+        line = json.dumps({'channel': self.channel, 'data': data}, ensure_ascii=False).encode('utf-8') + b'\n'
+        # 接続が切れていたら1回だけ繋ぎ直して送る
+        for attempt in range(2):
+            with self._publish_lock:
+                try:
+                    if self._publish_sock is None:
+                        self._publish_sock = self._connect()
+                    self._publish_sock.sendall(line)
+                    return
+                except OSError as e:
+                    if self._publish_sock is not None:
+                        self._publish_sock.close()
+                        self._publish_sock = None
+                    if attempt:
+                        log.error("Cannot publish to broker %s:%s: %s", self.host, self.port, e)
+
+    def _listen(self):
+        retry = 1
+        while True:
+            try:
+                sock = self._connect()
+                sock.sendall(SUBSCRIBE)
+                retry = 1
+                with sock, sock.makefile('rb') as reader:
+                    for line in reader:
+                        try:
+                            frame = json.loads(line)
+                        except ValueError:
+                            continue
+                        if frame.get('channel') == self.channel:
+                            yield frame['data']
+                log.warning("Broker %s:%s closed the connection", self.host, self.port)
+            except OSError as e:
+                log.warning("Cannot listen to broker %s:%s: %s", self.host, self.port, e)
+            # 切断中に配信されたメッセージは失われる（Redis の pub/sub と同じ）
+            time.sleep(retry)
+            retry = min(retry * 2, _MAX_RETRY_SECONDS)
+
+
+def socketio_options(url=None, channel=None):
+    """SocketIO(...) に渡すメッセージキューの設定を返す（未設定なら空）"""
+    url = SOCKETIO_MESSAGE_QUEUE if url is None else url
+    channel = channel or SOCKETIO_CHANNEL
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalBrokerManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
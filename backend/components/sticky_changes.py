@@ -0,0 +1,99 @@
+"""付箋の差分同期（GET /api/sticky/changes）
+
+学校・テーマのボードごとに単調増加する版数（board_version.version）を持ち、付箋を作成・更新するたびに
+同じトランザクションで版数を上げて sticky.updated_version に書き込む。削除した付箋は sticky_tombstone に残す。
+クライアントは前回受け取った version を since に渡し、それより後に変わった付箋と削除された付箋の ID だけを受け取る。
+
+    STICKY_TOMBSTONE_DAYS  削除の記録を残す日数（既定 30）。これより古い since には snapshot_required を返す
+"""
+import os
+
+from components import sticky_list
+from components.change_bus import log_change
+
+STICKY_TOMBSTONE_DAYS = int(os.getenv('STICKY_TOMBSTONE_DAYS', '30'))
+
+# since より後に削除された付箋のクエリ（components.query_plan でも確認する）
+TOMBSTONES_SQL = '''
+        SELECT sticky_id FROM sticky_tombstone
+         WHERE school_id = ? AND theme_id = ? AND deleted_version > ?
+         ORDER BY deleted_version
+    '''
+
+
+def next_board_version(c, school_id, theme_id):
+    """ボードの版数を1つ上げて返す（書き込みのトランザクション内で呼ぶ）"""
+    c.execute('''
+        INSERT INTO board_version (school_id, theme_id, version) VALUES (?, ?, 1)
+        ON CONFLICT(school_id, theme_id) DO UPDATE SET version = version + 1
+    ''', (str(school_id), theme_id))
+    c.execute('SELECT version FROM board_version WHERE school_id = ? AND theme_id = ?', (str(school_id), theme_id))
+    version = c.fetchone()[0]
+    # 他のプロセスの付箋一覧のキャッシュ（ETag）を無効にする
+    log_change(c, 'sticky', f"{school_id}:{theme_id}")
+    return version
+
+
+def board_version(c, school_id, theme_id):
+    """ボードの現在の版数と、差分を返せる最も古い since を返す"""
+    c.execute('SELECT version, tombstone_floor FROM board_version WHERE school_id = ? AND theme_id = ?',
+              (str(school_id), theme_id))
+    row = c.fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def mark_sticky_changed(c, sticky_id):
+    """付箋が変わったことを記録する（付箋が無ければ何もしない）"""
+    c.execute('SELECT school_id, theme_id FROM sticky WHERE sticky_id = ?', (sticky_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    version = next_board_version(c, row[0], row[1])
+    c.execute('UPDATE sticky SET updated_version = ? WHERE sticky_id = ?', (version, sticky_id))
+    return version
+
+
+def record_tombstone(c, sticky_id, school_id, theme_id):
+    """削除した付箋を記録し、保持期間を過ぎた削除の記録を消す（付箋を DELETE するトランザクション内で呼ぶ）"""
+    version = next_board_version(c, school_id, theme_id)
+    c.execute('''
+        INSERT OR REPLACE INTO sticky_tombstone (sticky_id, school_id, theme_id, deleted_version)
+        VALUES (?, ?, ?, ?)
+    ''', (sticky_id, str(school_id), theme_id, version))
+    prune_tombstones(c, school_id, theme_id)
+    return version
+
+
+def prune_tombstones(c, school_id, theme_id):
+    c.execute('''
+        SELECT MAX(deleted_version) FROM sticky_tombstone
+         WHERE school_id = ? AND theme_id = ? AND deleted_at < datetime('now', '+9 hours', ?)
+    ''', (str(school_id), theme_id, f'-{STICKY_TOMBSTONE_DAYS} days'))
+    floor = c.fetchone()[0]
+    if floor is None:
+        return
+    # 消した削除の記録より前の since からは差分を作れないので、その版数を記録しておく
+    c.execute('DELETE FROM sticky_tombstone WHERE school_id = ? AND theme_id = ? AND deleted_version <= ?',
+              (str(school_id), theme_id, floor))
+    c.execute('UPDATE board_version SET tombstone_floor = ? WHERE school_id = ? AND theme_id = ?',
+              (floor, str(school_id), theme_id))
+
+
+def fetch_changes(c, school_id, theme_id, since, fields):
+    """since より後に作成・更新された付箋と削除された付箋の ID を返す
+
+    {version, stickies, deleted} または since が古すぎる・新しすぎる場合は {version, snapshot_required: True}。
+    版数を先に読むので、返した version より後の変更が含まれることはあっても、取りこぼすことはない
+    （次回の since で同じ付箋がもう一度返るだけ）。
+    """
+    version, floor = board_version(c, school_id, theme_id)
+    if since < floor or since > version:
+        return {'version': version, 'snapshot_required': True}
+    if since == version:
+        return {'version': version, 'stickies': [], 'deleted': []}
+
+    sticky_list.query_stickies(c, fields, school_id=school_id, theme_id=theme_id, updated_since=since)
+    stickies = [dict(zip(fields, row)) for row in c.fetchall()]
+    c.execute(TOMBSTONES_SQL, (str(school_id), theme_id, since))
+    deleted = [row[0] for row in c.fetchall()]
+    return {'version': version, 'stickies': stickies, 'deleted': deleted}
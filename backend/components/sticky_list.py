@@ -0,0 +1,138 @@
+"""付箋一覧（GET /api/sticky）のキーセットページングと項目の絞り込み
+
+    limit=N        1ページの件数（STICKY_PAGE_MAX まで）。指定しなければ従来どおり全件
+    cursor=...     前のページのレスポンスの X-Next-Cursor（(display_index, sticky_id) の続きから返す）
+    fields=a,b     返す項目（sticky_id と display_index は常に含む）。概観の表示では sticky_content などの長い項目を省ける
+
+並び順は (display_index, sticky_id)。学校・テーマ・学生ごとのインデックスの末尾は rowid（sticky_id）なので、
+続きのページもインデックスの範囲検索になり、OFFSET のように読み飛ばした行を数え直さない。
+行はカーソルから少しずつ読み出して JSON 配列として書き出し、一覧全体をメモリに作らない。
+"""
+import json
+import os
+
+# 1ページの最大件数
+STICKY_PAGE_MAX = int(os.getenv('STICKY_PAGE_MAX', '500'))
+# ストリーミング時に一度に読み出す行数
+STICKY_FETCH_ROWS = 200
+
+# 項目名 -> SELECT する式（students の JOIN が必要な項目は JOIN_FIELDS）
+FIELDS = {
+    'sticky_id': 's.sticky_id',
+    'student_id': 's.student_id',
+    'sticky_content': 's.sticky_content',
+    'sticky_color': 's.sticky_color',
+    'x_axis': 's.x_axis',
+    'y_axis': 's.y_axis',
+    'display_index': 's.display_index',
+    'feedback_A': 's.feedback_A',
+    'feedback_B': 's.feedback_B',
+    'feedback_C': 's.feedback_C',
+    'ai_summary_content': 's.ai_summary_content',
+    'ai_teammate_avg_prediction': 's.ai_teammate_avg_prediction',
+    'ai_enemy_avg_prediction': 's.ai_enemy_avg_prediction',
+    'ai_overall_avg_prediction': 's.ai_overall_avg_prediction',
+    'teammate_avg_score': 's.teammate_avg_score',
+    'enemy_avg_score': 's.enemy_avg_score',
+    'overall_avg_score': 's.overall_avg_score',
+    'created_at': 's.created_at',
+    'student_name': 'st.name',
+    'author_camp_id': 'st.camp_id',
+    'version': 's.version',
+    'updated_version': 's.updated_version',
+}
+JOIN_FIELDS = {'student_name', 'author_camp_id'}
+
+# 付箋の作成・投票状態の確認で使うクエリ（app.py。components.query_plan でも確認する）
+MAX_DISPLAY_INDEX_SQL = 'SELECT MAX(display_index) FROM sticky WHERE school_id = ?'
+VOTE_STATUS_SQL = '''SELECT vote_type FROM sticky_votes 
+                     WHERE student_id = ? AND sticky_id = ?'''
+
+
+def parse_fields(value):
+    """fields= を項目名のリストにする（未指定なら全項目。不明な項目があれば ValueError）"""
+    names = [name.strip() for name in value.split(',') if name.strip()] if value else list(FIELDS)
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"不明な項目です: {', '.join(unknown)}")
+    # sticky_id と、次のページのカーソルに使う display_index は常に先頭の2項目にする
+    return ['sticky_id', 'display_index'] + [name for name in names if name not in ('sticky_id', 'display_index')]
+
+
+def parse_limit(value):
+    """limit= を件数にする（未指定なら None。不正なら ValueError）"""
+    if value is None or value == '':
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('limit は1以上を指定してください')
+    return min(limit, STICKY_PAGE_MAX)
+
+
+def encode_cursor(display_index, sticky_id):
+    return f"{display_index}:{sticky_id}"
+
+
+def parse_cursor(value):
+    """cursor= を (display_index, sticky_id) にする（未指定なら None。不正なら ValueError）"""
+    if not value:
+        return None
+    try:
+        display_index, sticky_id = value.split(':')
+        return int(display_index), int(sticky_id)
+    except ValueError:
+        raise ValueError('cursor が不正です')
+
+
+def query_stickies(c, fields, school_id=None, theme_id=None, student_id=None, cursor=None, limit=None,
+                   updated_since=None):
+    """条件に合う付箋を (display_index, sticky_id) 順に SELECT する（行は c から読み出す）
+
+    updated_since を指定すると、その版数より後に作成・更新された付箋だけにする（components.sticky_changes）
+    """
+    where, params = [], []
+    if school_id:
+        where.append('s.school_id = ?')
+        params.append(school_id)
+        if theme_id:
+            where.append('s.theme_id = ?')
+            params.append(theme_id)
+    elif student_id:
+        where.append('s.student_id = ?')
+        params.append(student_id)
+    if updated_since is not None:
+        where.append('s.updated_version > ?')
+        params.append(updated_since)
+    if cursor:
+        where.append('(s.display_index, s.sticky_id) > (?, ?)')
+        params.extend(cursor)
+    sql = f"SELECT {', '.join(FIELDS[name] for name in fields)} FROM sticky s"
+    if JOIN_FIELDS.intersection(fields):
+        sql += ' JOIN students st ON s.student_id = st.student_id'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY s.display_index, s.sticky_id'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    c.execute(sql, params)
+
+
+def iter_json_array(rows, fields):
+    """行を1件ずつ dict にして JSON 配列の断片を返す"""
+    yield '['
+    first = True
+    for row in rows:
+        item = json.dumps(dict(zip(fields, row)), ensure_ascii=False)
+        yield item if first else ',' + item
+        first = False
+    yield ']'
+
+
+def fetch_rows(c, size=STICKY_FETCH_ROWS):
+    """カーソルから size 件ずつ読み出す"""
+    while True:
+        rows = c.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
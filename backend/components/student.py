@@ -1,14 +1,15 @@
 from flask import jsonify, request
-import sqlite3
 from flask import Blueprint
-from components.init import get_db_connection
+from components.db import get_db_connection
+from components import resource_version
+from components.change_bus import log_change
 
 student_o = Blueprint('student_o', __name__, url_prefix='/api')
 
 @student_o.route('/students', methods=['GET'])
 def get_students():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('''SELECT student_id, school_id, class_id, number, name, user_type, sum_point, have_point,
                             camp_id, theme_color, user_color, blacklist_point, created_at, ex_flag 
@@ -40,7 +41,7 @@ def get_students():
 @student_o.route('/students/<int:student_id>', methods=['GET'])
 def get_student(student_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('''SELECT student_id, school_id, class_id, number, name, user_type, sum_point, have_point,
                             camp_id, theme_color, user_color, blacklist_point, created_at, ex_flag 
@@ -76,7 +77,7 @@ def update_student_points(student_id):
         return jsonify({'error': 'リクエストボディが必要です'}), 400
     
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         update_fields = []
@@ -119,7 +120,7 @@ def update_student_camp(student_id):
         return jsonify({'error': 'リクエストボディが必要です'}), 400
     
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # 陣営IDを更新しようとしている場合は期間チェックを行う
@@ -194,6 +195,8 @@ def update_student_camp(student_id):
         query = f"UPDATE students SET {', '.join(update_fields)} WHERE student_id = ?"
         
         c.execute(query, values)
+        if 'camp_id' in request.json:
+            log_change(conn, 'students', school_id)
         conn.commit()
         
         if c.rowcount == 0:
@@ -201,6 +204,8 @@ def update_student_camp(student_id):
             return jsonify({'error': 'Student not found'}), 404
             
         conn.close()
+        if 'camp_id' in request.json:
+            resource_version.bump(('student_camps',))
         return jsonify({'status': 'success', 'message': '陣営設定が更新されました'})
         
     except Exception as e:
@@ -216,7 +221,7 @@ def update_student_ex_flag(student_id):
         return jsonify({'error': 'ex_flag が必要です'}), 400
     
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('UPDATE students SET ex_flag = ? WHERE student_id = ?', (request.json['ex_flag'], student_id))
         conn.commit()
@@ -231,7 +236,7 @@ def update_student_ex_flag(student_id):
 @student_o.route('/students/class/<class_id>', methods=['GET'])
 def get_students_by_class(class_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('''SELECT student_id, school_id, class_id, number, name, user_type, sum_point, have_point,
                             camp_id, theme_color, user_color, blacklist_point, created_at 
@@ -262,7 +267,7 @@ def get_students_by_class(class_id):
 @student_o.route('/notifications/<int:teacher_id>', methods=['GET'])
 def get_notifications(teacher_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('''
             SELECT notification_id, student_id, reward_id, notification_content, is_read, saved_time
@@ -290,7 +295,7 @@ def get_notifications(teacher_id):
 @student_o.route('/notifications/<int:notification_id>/read', methods=['PATCH'])
 def mark_notification_read(notification_id):
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('''
             UPDATE notification 
@@ -307,7 +312,7 @@ def mark_notification_read(notification_id):
 @student_o.route('/studentlist', methods=['GET'])
 def get_studentlist():
     try:
-        conn = sqlite3.connect('database.db')
+        conn = get_db_connection()
         c = conn.cursor()
         # 必要なカラムのみ取得（class, number, name, rank）
         c.execute('''SELECT class, number, name, rank FROM students ORDER BY created_at DESC''')
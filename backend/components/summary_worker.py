@@ -0,0 +1,131 @@
+"""付箋の AI 要約をバックグラウンドで作成するワーカープール
+
+付箋はまず要約の代わりに本文の先頭30字を入れて作成・配信しておき、
+ワーカーが Gemini で要約を作成してから行を更新し、更新を通知する。
+キューには上限があり、溢れた付箋は先頭30字のまま（要約しない）とする。
+"""
+import os
+import queue
+import threading
+import time
+
+from components.db import get_db_connection
+from components.logger import get_logger
+from components.metrics import counter, gauge_func, histogram
+from components import resource_version, sticky_changes
+
+log = get_logger('summary')
+
+# ワーカースレッドの数
+SUMMARY_WORKERS = int(os.getenv('SUMMARY_WORKERS', '4'))
+# 要約待ちの付箋の最大数
+SUMMARY_QUEUE_SIZE = int(os.getenv('SUMMARY_QUEUE_SIZE', '200'))
+
+# 要約の長さの上限（フォールバックも同じ長さで切る）
+SUMMARY_MAX_CHARS = 30
+
+SUMMARY_DURATION = histogram(
+    'sticky_summary_duration_seconds', 'Time to summarize a sticky and store the result', ('outcome',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0))
+SUMMARY_QUEUE_WAIT = histogram(
+    'sticky_summary_queue_wait_seconds', 'Time a sticky waited in the summary queue')
+SUMMARY_DROPPED = counter(
+    'sticky_summary_dropped_total', 'Stickies not summarized because the queue was full')
+
+
+def fallback_summary(content):
+    """AI 要約が無いときに使う本文の先頭部分"""
+    return content[:SUMMARY_MAX_CHARS]
+
+
+class SummaryWorkerPool:
+    """上限付きのキューと固定数のワーカースレッド"""
+
+    def __init__(self, summarize, on_summarized, workers=SUMMARY_WORKERS, maxsize=SUMMARY_QUEUE_SIZE):
+        # summarize(content, school_id) -> 要約文
+        # on_summarized(sticky_id, school_id, version, summary) -> 更新の通知
+        self.summarize = summarize
+        self.on_summarized = on_summarized
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'sticky-summary-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, sticky_id, content, school_id=None):
+        """要約を依頼する。キューが一杯なら False を返す（付箋はフォールバックのまま）"""
+        try:
+            self.queue.put_nowait((sticky_id, content, school_id, time.perf_counter()))
+            return True
+        except queue.Full:
+            SUMMARY_DROPPED.inc()
+            log.warning("Summary queue is full, keeping fallback", extra={'fields': {'sticky_id': sticky_id}})
+            return False
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        while True:
+            sticky_id, content, school_id, enqueued_at = self.queue.get()
+            SUMMARY_QUEUE_WAIT.observe(time.perf_counter() - enqueued_at)
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                outcome = self._process(sticky_id, content, school_id)
+            except Exception as e:
+                log.exception("Failed to summarize sticky %s: %s", sticky_id, e)
+            finally:
+                SUMMARY_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+                self.queue.task_done()
+
+    def _process(self, sticky_id, content, school_id):
+        summary = self.summarize(content, school_id)
+        if not summary or summary == fallback_summary(content):
+            return 'unchanged'
+
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.execute('UPDATE sticky SET ai_summary_content = ?, version = version + 1 WHERE sticky_id = ?',
+                      (summary, sticky_id))
+            updated = c.rowcount
+            row = None
+            if updated:
+                sticky_changes.mark_sticky_changed(c, sticky_id)
+                c.execute('SELECT school_id, version, theme_id FROM sticky WHERE sticky_id = ?', (sticky_id,))
+                row = c.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+
+        # 要約中に付箋が削除された場合は通知しない
+        if not row:
+            return 'deleted'
+        resource_version.bump_board(row[0], row[2])
+        self.on_summarized(sticky_id, row[0], row[1], summary)
+        return 'ok'
+
+
+_pool = None
+
+
+def start_summary_workers(summarize, on_summarized):
+    """ワーカープールを開始する（2回目以降は既存のプールを返す）"""
+    global _pool
+    if _pool is None:
+        _pool = SummaryWorkerPool(summarize, on_summarized).start()
+        gauge_func('sticky_summary_queue_depth', 'Stickies waiting to be summarized', _pool.depth)
+    return _pool
+
+
+def submit_summary(sticky_id, content, school_id=None):
+    """付箋の要約を依頼する（ワーカー未開始なら何もしない）"""
+    if _pool is None:
+        return False
+    return _pool.submit(sticky_id, content, school_id)
@@ -1,12 +1,15 @@
 from flask import jsonify, request, current_app
 from flask import Blueprint
 from flask import Flask
-from components.init import get_db_connection
+from components.db import get_db_connection
+from components import resource_version
+from components.change_bus import log_change
 
 themes_o = Blueprint('themes_o', __name__, url_prefix='/api')
 
 # 1) テーマ一覧を取得
 @themes_o.route('/themes', methods=['GET'])
+@resource_version.conditional(lambda: [('themes',)])
 def list_themes():
     conn = get_db_connection()
     c = conn.cursor()
@@ -44,13 +47,16 @@ def create_theme():
       data['school_id'],
     ))
     theme_id = c.lastrowid
+    log_change(conn, 'debate_settings', theme_id)
     conn.commit()
     conn.close()
+    resource_version.bump(('themes',))
     return jsonify({'theme_id': theme_id}), 201
 
 
 # 3) テーマ詳細を取得
 @themes_o.route('/themes/<int:theme_id>', methods=['GET'])
+@resource_version.conditional(lambda theme_id: [('themes',)])
 def get_theme(theme_id):
     conn = get_db_connection()
     c = conn.cursor()
@@ -68,6 +74,7 @@ def get_theme(theme_id):
 
 # newest_theme: 学校ごとの最新(終了が未来のもの優先)テーマを一件取得
 @themes_o.route('/newest_theme', methods=['GET'])
+@resource_version.conditional(lambda: [('themes',)])
 def newest_theme():
     school_id = request.args.get('school_id')
     if not school_id:
@@ -120,6 +127,8 @@ def update_theme(theme_id):
         SET {', '.join(fields)}
       WHERE theme_id = ?
     ''', vals)
+    log_change(conn, 'debate_settings', theme_id)
     conn.commit()
     conn.close()
+    resource_version.bump(('themes',))
     return jsonify({'status': 'updated'})
\ No newline at end of file
@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
-import sqlite3
 import random
 from datetime import datetime
 from flask_cors import CORS
+from components.db import get_db_connection
+from components import resource_version, sticky_changes
+from components.change_bus import log_change
 
 topicset_o = Blueprint('topicset_o', __name__, url_prefix='/api')
 CORS(topicset_o, resources={
@@ -26,7 +28,7 @@ def add_topic():
     team2 = data.get('team2')
     school_id = data.get('school_id')
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db_connection()
     c = conn.cursor()
     try:
         # debate_settings記録を挿入する
@@ -56,8 +58,11 @@ def add_topic():
                SET camp_id = NULL
              WHERE school_id = ?
         ''', (school_id,))
+        log_change(conn, 'debate_settings', theme_id)
+        log_change(conn, 'students', school_id)
         
         conn.commit()
+        resource_version.bump(('themes',), ('student_camps',))
         return jsonify({'message': 'テーマが追加されました', 'theme_id': theme_id}), 201
     except Exception as e:
         conn.rollback()
@@ -66,9 +71,10 @@ def add_topic():
         conn.close()
 
 @topicset_o.route('/newest_theme', methods=['GET'])
+@resource_version.conditional(lambda: [('themes',)])
 def get_newest_theme():
     school_id = request.args.get('school_id')
-    conn = sqlite3.connect('database.db')
+    conn = get_db_connection()
     c = conn.cursor()
     try:
         c.execute('''
@@ -87,9 +93,10 @@ def get_newest_theme():
         conn.close()
 
 @topicset_o.route('/all_debate', methods=['GET'])
+@resource_version.conditional(lambda: [('themes',)])
 def get_all_debates():
     school_id = request.args.get('school_id')
-    conn = sqlite3.connect('database.db')
+    conn = get_db_connection()
     c = conn.cursor()
     try:
         c.execute('''
@@ -126,19 +133,36 @@ def get_all_debates():
 
 @topicset_o.route('/delete_debate/<int:theme_id>', methods=['DELETE'])
 def delete_debate(theme_id):
-    conn = sqlite3.connect('database.db')
+    conn = get_db_connection()
     c = conn.cursor()
     try:
+        c.execute('SELECT school_id FROM debate_settings WHERE theme_id = ?', (theme_id,))
+        theme = c.fetchone()
+        
         # 先に関連する camps 記録を削除する
         c.execute('DELETE FROM camps WHERE theme_id = ?', (theme_id,))
         
-        # sticky 記録を削除する
+        # 差分同期のクライアントにテーマの付箋の削除を伝える
+        if theme:
+            version = sticky_changes.next_board_version(c, theme[0], theme_id)
+            c.execute('''
+                INSERT OR REPLACE INTO sticky_tombstone (sticky_id, school_id, theme_id, deleted_version)
+                SELECT sticky_id, school_id, theme_id, ? FROM sticky WHERE theme_id = ?
+            ''', (version, theme_id))
+        
+        # 会話ダイジェスト、sticky 記録と陣営別得点を削除する
+        c.execute('DELETE FROM conversation_digest WHERE sticky_id IN (SELECT sticky_id FROM sticky WHERE theme_id = ?)', (theme_id,))
         c.execute('DELETE FROM sticky WHERE theme_id = ?', (theme_id,))
+        c.execute('DELETE FROM camp_score WHERE theme_id = ?', (theme_id,))
         
         # 最後に debate_settings 記録を削除する
         c.execute('DELETE FROM debate_settings WHERE theme_id = ?', (theme_id,))
+        log_change(conn, 'debate_settings', theme_id)
         
         conn.commit()
+        resource_version.bump(('themes',))
+        if theme:
+            resource_version.bump_board(theme[0], theme_id)
         return jsonify({'message': 'テーマが削除されました'}), 200
     except Exception as e:
         conn.rollback()
@@ -155,7 +179,7 @@ def clear_camp_selections():
     if not school_id:
         return jsonify({'error': 'school_idが必要です'}), 400
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db_connection()
     c = conn.cursor()
     try:
         # 現在の時間を取得する
@@ -178,8 +202,10 @@ def clear_camp_selections():
             SET camp_id = NULL 
             WHERE school_id = ?
         ''', (school_id,))
+        log_change(conn, 'students', school_id)
         
         conn.commit()
+        resource_version.bump(('student_camps',))
         
         return jsonify({
             'message': '陣営選択がクリアされました',
@@ -200,7 +226,7 @@ def force_clear_camps():
     if not school_id:
         return jsonify({'error': 'school_idが必要です'}), 400
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db_connection()
     c = conn.cursor()
     try:
         c.execute('''
@@ -208,7 +234,9 @@ def force_clear_camps():
                SET camp_id = NULL
              WHERE school_id = ?
         ''', (school_id,))
+        log_change(conn, 'students', school_id)
         conn.commit()
+        resource_version.bump(('student_camps',))
         return jsonify({'message': 'camp_id をクリアしました', 'cleared_students': c.rowcount}), 200
     except Exception as e:
         conn.rollback()
@@ -224,7 +252,7 @@ def check_theme_status():
     if not school_id:
         return jsonify({'error': 'school_idが必要です'}), 400
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db_connection()
     c = conn.cursor()
     try:
         # 現在の時間を取得する
@@ -245,8 +273,10 @@ def check_theme_status():
                 SET camp_id = NULL 
                 WHERE school_id = ?
             ''', (school_id,))
+            log_change(conn, 'students', school_id)
             
             conn.commit()
+            resource_version.bump(('student_camps',))
             
             return jsonify({
                 'message': '討論が終了し、陣営選択がクリアされました',
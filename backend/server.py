@@ -0,0 +1,40 @@
+"""本番用の起動スクリプト
+
+Werkzeug の開発サーバー（python app.py）ではなく、協調的なグリーンスレッドで同じアプリを動かす。
+多数の WebSocket 接続をスレッドを増やさずに保持できる。
+
+    python server.py                        # eventlet で 0.0.0.0:5000
+    SOCKETIO_ASYNC_MODE=gevent python server.py
+    HOST=127.0.0.1 PORT=5001 python server.py
+
+SQLite と LLM の呼び出しは components.async_mode.run_blocking で OS スレッドのプールに逃がす。
+プールの大きさは EVENTLET_THREADPOOL_SIZE（既定 20）で変えられる。
+eventlet の同時接続数の上限は EVENTLET_MAX_CONNECTIONS（既定 10000。eventlet 自体の既定は 1024）。
+"""
+import os
+
+from dotenv import load_dotenv
+
+# monkey patch の前に .env から実行モードを読む
+load_dotenv()
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'eventlet')
+ASYNC_MODE = os.environ['SOCKETIO_ASYNC_MODE']
+
+# 標準ライブラリ（socket・threading・time など）をグリーンスレッド対応に置き換えてからアプリを読み込む
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import app, socketio  # noqa: E402
+
+if __name__ == '__main__':
+    options = {}
+    if ASYNC_MODE == 'eventlet':
+        # WebSocket の接続はそれぞれグリーンスレッドを1つ保持するので、eventlet の既定（1024）では足りない
+        options['max_size'] = int(os.getenv('EVENTLET_MAX_CONNECTIONS', '10000'))
+    # threading は Werkzeug になるので、明示的に選んだ場合だけ許可する
+    socketio.run(app, host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', '5000')),
+                 allow_unsafe_werkzeug=(ASYNC_MODE == 'threading'), **options)
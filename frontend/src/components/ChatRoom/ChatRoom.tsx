@@ -38,6 +38,9 @@ const Avatar = ({ isUser, userId, userColor }: AvatarProps) => (
   </div>
 );
 
+// 生成を依頼してから ai_advice_updated を待つ最大時間（届かなければ表示中のアドバイスのままにする）
+const ADVICE_WAIT_MS = 30000;
+
 interface ChatRoomProps {
   stickyId: number;
   aiAdviceAgreed?: boolean;
@@ -49,6 +52,11 @@ const ChatRoom = ({ stickyId, aiAdviceAgreed = false }: ChatRoomProps) => {
   const [aiAdvice, setAiAdvice] = useState<string>("");
   const [showAiAdvice, setShowAiAdvice] = useState(false);
   const [isGeneratingAdvice, setIsGeneratingAdvice] = useState(false);
+  // 生成を依頼し、Socket.IO で結果が届くのを待っている
+  const [isWaitingAdvice, setIsWaitingAdvice] = useState(false);
+  const adviceTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
+  // ストリーミング中（最初の部分が届いたら表示中のアドバイスを置き換え、以降は末尾に足す）
+  const adviceStreamingRef = useRef(false);
   const messageListRef = useRef<HTMLDivElement>(null);
   const {
     messages,
@@ -57,9 +65,36 @@ const ChatRoom = ({ stickyId, aiAdviceAgreed = false }: ChatRoomProps) => {
     joinStickyChat,
     leaveStickyChat,
     connectChatSocket,
+    subscribeAIAdvice,
+    streamAIAdvice,
   } = useChat();
   const { fetchAIAdvice, generateAIAdvice, isLoading: aiLoading } = useAIHelp();
 
+  const stopWaitingAdvice = () => {
+    if (adviceTimerRef.current) {
+      clearTimeout(adviceTimerRef.current);
+      adviceTimerRef.current = null;
+    }
+    setIsWaitingAdvice(false);
+  };
+
+  // 生成を依頼する。Socket.IO が繋がっていれば生成途中の部分から表示し、
+  // 繋がっていなければ HTTP で依頼する（保存済みのアドバイスがすぐに返り、新しいアドバイスは ai_advice_updated で届く）
+  const requestAIAdvice = async () => {
+    adviceStreamingRef.current = false;
+    if (!streamAIAdvice(stickyId)) {
+      const adviceResponse = await generateAIAdvice(stickyId);
+      if (!adviceResponse.success) return;
+      const text = (adviceResponse.advice || "").trim();
+      if (text) {
+        setAiAdvice(text);
+      }
+    }
+    setIsWaitingAdvice(true);
+    if (adviceTimerRef.current) clearTimeout(adviceTimerRef.current);
+    adviceTimerRef.current = setTimeout(stopWaitingAdvice, ADVICE_WAIT_MS);
+  };
+
   // AIアドバイスを手動で更新する関数（生成して保存）
   const refreshAIAdvice = async () => {
     if (!aiAdviceAgreed) return;
@@ -67,17 +102,42 @@ const ChatRoom = ({ stickyId, aiAdviceAgreed = false }: ChatRoomProps) => {
     setIsGeneratingAdvice(true);
     try {
       // 手動更新は「生成して保存」を実行
-      const adviceResponse = await generateAIAdvice(stickyId);
-      if (adviceResponse.success) {
-        const text = (adviceResponse.advice || "").trim();
-        setAiAdvice(text);
-        setShowAiAdvice(text.length > 0);
-      }
+      await requestAIAdvice();
     } finally {
       setIsGeneratingAdvice(false);
     }
   };
 
+  // 自分宛てに生成されたアドバイスを表示する
+  useEffect(() => {
+    if (!aiAdviceAgreed) return;
+    const unsubscribe = subscribeAIAdvice((event, data) => {
+      if (data.sticky_id !== stickyId) return;
+      if (event === "ai_advice_chunk") {
+        const chunk = data.chunk || "";
+        setAiAdvice((prev) =>
+          adviceStreamingRef.current ? prev + chunk : chunk
+        );
+        adviceStreamingRef.current = true;
+        setShowAiAdvice(true);
+        stopWaitingAdvice();
+        return;
+      }
+      // ai_advice_updated / ai_advice_done は完成したアドバイス（途中の部分を置き換える）
+      adviceStreamingRef.current = false;
+      if (data.advice) {
+        const text = data.advice.trim();
+        setAiAdvice(text);
+        setShowAiAdvice(text.length > 0);
+      }
+      stopWaitingAdvice();
+    });
+    return () => {
+      unsubscribe();
+      stopWaitingAdvice();
+    };
+  }, [stickyId, aiAdviceAgreed, subscribeAIAdvice]);
+
   // 一番下にあるかチェック
   const checkIfAtBottom = () => {
     if (messageListRef.current) {
@@ -186,16 +246,10 @@ const ChatRoom = ({ stickyId, aiAdviceAgreed = false }: ChatRoomProps) => {
         // 送信後、DBから最新メッセージを取得
         await loadMessages(stickyId);
 
-        // メッセージ送信後は「生成して保存」→ その結果を表示（aiAdviceAgreedがtrueの場合のみ）
+        // メッセージ送信後は「生成して保存」を依頼し、結果は Socket.IO で受け取る（aiAdviceAgreedがtrueの場合のみ）
         if (aiAdviceAgreed) {
-          setTimeout(async () => {
-            const adviceResponse = await generateAIAdvice(stickyId);
-            if (adviceResponse.success) {
-              const text = (adviceResponse.advice || "").trim();
-              setAiAdvice(text);
-              setShowAiAdvice(text.length > 0);
-            }
-          }, 1000);
+          setShowAiAdvice(true);
+          requestAIAdvice();
         }
 
         setNewMessage("");
@@ -210,7 +264,8 @@ const ChatRoom = ({ stickyId, aiAdviceAgreed = false }: ChatRoomProps) => {
   return (
     <div className={styles.chatContainer}>
       {/* AIアドバイス表示場所 */}
-      {aiAdviceAgreed && (showAiAdvice || isGeneratingAdvice || aiLoading) && (
+      {aiAdviceAgreed &&
+        (showAiAdvice || isGeneratingAdvice || isWaitingAdvice || aiLoading) && (
         <div className={styles.aiAdviceContainer}>
           <div className={styles.aiAdviceHeader}>
             <span className={styles.aiAdviceTitle}>🤖 AIアドバイス</span>
@@ -218,7 +273,7 @@ const ChatRoom = ({ stickyId, aiAdviceAgreed = false }: ChatRoomProps) => {
               <button
                 className={styles.refreshAdviceButton}
                 onClick={refreshAIAdvice}
-                disabled={isGeneratingAdvice || aiLoading}
+                disabled={isGeneratingAdvice || isWaitingAdvice || aiLoading}
               >
                 🔄
               </button>
@@ -232,7 +287,7 @@ const ChatRoom = ({ stickyId, aiAdviceAgreed = false }: ChatRoomProps) => {
             </div>
           </div>
           <div className={styles.aiAdviceContent}>
-            {isGeneratingAdvice || aiLoading ? (
+            {isGeneratingAdvice || isWaitingAdvice || aiLoading ? (
               <div className={styles.loadingAdvice}>
                 <span>アドバイスを生成中...</span>
                 <div className={styles.loadingSpinner}></div>
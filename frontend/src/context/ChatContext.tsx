@@ -27,6 +27,17 @@ interface Message {
   user_vote_type?: string; // ユーザーの投票タイプを追加
 }
 
+// AIアドバイスのイベント（自分宛てのものだけが届く）
+export interface AIAdviceEvent {
+  sticky_id: number;
+  student_id: number;
+  advice?: string | null;
+  chunk?: string;
+  error?: string | null;
+}
+
+type AIAdviceListener = (event: string, data: AIAdviceEvent) => void;
+
 interface ChatContextType {
   messages: Message[];
   sendMessage: (message: {
@@ -40,6 +51,8 @@ interface ChatContextType {
   leaveStickyChat: (sticky_id: number) => void;
   connectChatSocket: () => void;
   disconnectChatSocket: () => void;
+  subscribeAIAdvice: (listener: AIAdviceListener) => () => void;
+  streamAIAdvice: (sticky_id: number) => boolean;
   currentStickyId: number | null;
 }
 
@@ -51,6 +64,9 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({
   const [messages, setMessages] = useState<Message[]>([]);
   const [currentStickyId, setCurrentStickyId] = useState<number | null>(null);
   const chatSocketRef = useRef<Socket | null>(null);
+  // 参加中の付箋（再接続したときに参加し直す）
+  const joinedStickyRef = useRef<number | null>(null);
+  const adviceListenersRef = useRef(new Set<AIAdviceListener>());
 
   // 特定の付箋のメッセージを読み込む
   const loadMessages = useCallback(async (sticky_id: number) => {
@@ -163,10 +179,14 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({
     []
   );
 
-  // 付箋チャットに参加
+  // 付箋チャットに参加（student_id を渡して自分宛てのAIアドバイスも受け取る）
   const joinStickyChat = useCallback((sticky_id: number) => {
+    joinedStickyRef.current = sticky_id;
     if (chatSocketRef.current && chatSocketRef.current.connected) {
-      chatSocketRef.current.emit("join_sticky_chat", { sticky_id });
+      chatSocketRef.current.emit("join_sticky_chat", {
+        sticky_id,
+        student_id: getCurrentUser()?.id,
+      });
       console.log(`付箋チャットに参加しました: sticky_${sticky_id}`);
       setCurrentStickyId(sticky_id);
     }
@@ -174,12 +194,39 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({
 
   // 付箋チャットから退出
   const leaveStickyChat = useCallback((sticky_id: number) => {
+    if (joinedStickyRef.current === sticky_id) {
+      joinedStickyRef.current = null;
+    }
     if (chatSocketRef.current && chatSocketRef.current.connected) {
-      chatSocketRef.current.emit("leave_sticky_chat", { sticky_id });
+      chatSocketRef.current.emit("leave_sticky_chat", {
+        sticky_id,
+        student_id: getCurrentUser()?.id,
+      });
       console.log(`付箋チャットから退出しました: sticky_${sticky_id}`);
     }
   }, []);
 
+  // AIアドバイスのイベントを受け取る（戻り値で登録を解除する）
+  const subscribeAIAdvice = useCallback((listener: AIAdviceListener) => {
+    adviceListenersRef.current.add(listener);
+    return () => {
+      adviceListenersRef.current.delete(listener);
+    };
+  }, []);
+
+  // チャットの Socket.IO でアドバイスの生成を依頼する（生成途中の部分が ai_advice_chunk で届く）。
+  // 未接続なら false を返すので、呼び出し側は HTTP で依頼する
+  const streamAIAdvice = useCallback((sticky_id: number) => {
+    const currentUser = getCurrentUser();
+    if (!currentUser || !chatSocketRef.current?.connected) return false;
+    chatSocketRef.current.emit("request_ai_advice", {
+      sticky_id,
+      student_id: currentUser.id,
+      school_id: currentUser.school_id,
+    });
+    return true;
+  }, []);
+
   // チャットSocket接続
   const connectChatSocket = useCallback(() => {
     if (chatSocketRef.current) {
@@ -194,8 +241,27 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({
 
     chatSocketRef.current.on("connect", () => {
       console.log("Chat Socket connected");
+      // 接続前に参加した付箋や、再接続で抜けたルームに参加し直す
+      if (joinedStickyRef.current !== null) {
+        chatSocketRef.current?.emit("join_sticky_chat", {
+          sticky_id: joinedStickyRef.current,
+          student_id: getCurrentUser()?.id,
+        });
+        setCurrentStickyId(joinedStickyRef.current);
+      }
     });
 
+    // 自分宛てのAIアドバイス（サーバーは依頼した学生のルーム・接続にだけ送る）
+    ["ai_advice_updated", "ai_advice_chunk", "ai_advice_done"].forEach(
+      (event) => {
+        chatSocketRef.current?.on(event, (data: AIAdviceEvent) => {
+          adviceListenersRef.current.forEach((listener) =>
+            listener(event, data)
+          );
+        });
+      }
+    );
+
     chatSocketRef.current.on("disconnect", () => {
       console.log("Chat Socket disconnected");
     });
@@ -269,6 +335,8 @@ export const ChatProvider: React.FC<{ children: React.ReactNode }> = ({
         leaveStickyChat,
         connectChatSocket,
         disconnectChatSocket,
+        subscribeAIAdvice,
+        streamAIAdvice,
         currentStickyId,
       }}
     >
@@ -25,6 +25,7 @@ interface Post {
   gemini?: string;
   theme_id?: number;
   author_camp_id?: number;
+  version?: number;
 }
 
 interface StickyResponse {
@@ -42,6 +43,32 @@ interface StickyResponse {
   created_at: string;
   student_name: string;
   author_camp_id?: number;
+  version?: number;
+}
+
+// sticky_updated の差分（join_school で sticky_delta: true を指定したときに届く）
+interface StickyDelta {
+  sticky_id: number;
+  version: number;
+  delta: true;
+  sticky_content?: string;
+  sticky_color?: string;
+  x_axis?: number;
+  y_axis?: number;
+  display_index?: number;
+  feedback_A?: number;
+  feedback_B?: number;
+  feedback_C?: number;
+  ai_summary_content?: string;
+}
+
+// board_resync（再接続時に resync_board への応答として届く）
+interface BoardResync {
+  school_id: string;
+  epoch: string;
+  latest_seq: number;
+  snapshot_required?: boolean;
+  events?: { seq: number; event: string; data: unknown }[];
 }
 
 interface UpdateData {
@@ -66,10 +93,14 @@ interface PostContextType {
   loadSchoolPosts: (school_id: string, theme_id: number) => Promise<void>;
   updatePost: (sticky_id: number, updates: Partial<Post>) => Promise<void>;
   deletePost: (sticky_id: number) => Promise<void>;
+  moveSticky: (sticky_id: number, x_axis: number, y_axis: number) => void;
   connectSocket: (school_id: string) => void;
   disconnectSocket: () => void;
 }
 
+// ドラッグ中の位置を送る最小間隔（サーバーは学校ごとに最大 POSITION_BROADCAST_HZ 回/秒でまとめて配信する）
+const MOVE_SEND_INTERVAL_MS = 50;
+
 const PostContext = createContext<PostContextType | undefined>(undefined);
 
 export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
@@ -79,6 +110,15 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
   const socketRef = useRef<Socket | null>(null);
   const [currentSchoolId, setCurrentSchoolId] = useState<string | null>(null);
   const { theme } = useDebateTheme();
+  // 最後に反映したボードのイベントの seq と epoch（再接続時に続きから受け取るため）
+  const boardSeqRef = useRef<{ seq: number; epoch: string | null }>({
+    seq: 0,
+    epoch: null,
+  });
+  const themeIdRef = useRef<number>(0);
+  useEffect(() => {
+    themeIdRef.current = theme?.theme_id || 0;
+  }, [theme]);
 
   const loadPosts = useCallback(async (student_id?: number) => {
     try {
@@ -104,6 +144,7 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
           feedback_C: item.feedback_C,
           gemini: item.ai_summary_content,
           author_camp_id: item.author_camp_id,
+          version: item.version,
         }));
         // 既にローカルで移動後の位置があれば尊重（Dashboard 側の localPositions は props ではないため、ここでは DB 値をそのまま採用）
         // 表示順は display_index を保つ
@@ -125,6 +166,11 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
         const response = await fetch(url);
         if (response.ok) {
           const data = await response.json();
+          // 取得した時点の seq から、再接続時に取り逃したイベントを受け取る
+          boardSeqRef.current = {
+            seq: Number(response.headers.get("X-Board-Seq") || 0),
+            epoch: response.headers.get("X-Board-Epoch"),
+          };
           const formattedPosts = data.map((item: StickyResponse) => ({
             id: item.sticky_id,
             text: item.sticky_content,
@@ -140,6 +186,7 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
             feedback_C: item.feedback_C,
             gemini: item.ai_summary_content,
             author_camp_id: item.author_camp_id,
+            version: item.version,
           }));
           // display_index順でソート
           formattedPosts.sort(
@@ -277,6 +324,20 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
     }
   }, []);
 
+  // ドラッグ中の位置を Socket.IO で送る（サーバーがまとめて同校に配信・保存する）。
+  // 付箋ごとに MOVE_SEND_INTERVAL_MS に1回まで送り、ドロップ時の位置は updatePost（PATCH）で保存する
+  const lastMoveSentRef = useRef<Map<number, number>>(new Map());
+  const moveSticky = useCallback(
+    (sticky_id: number, x_axis: number, y_axis: number) => {
+      if (!socketRef.current?.connected) return;
+      const now = Date.now();
+      if (now - (lastMoveSentRef.current.get(sticky_id) || 0) < MOVE_SEND_INTERVAL_MS) return;
+      lastMoveSentRef.current.set(sticky_id, now);
+      socketRef.current.emit("move_sticky", { sticky_id, x_axis, y_axis });
+    },
+    []
+  );
+
   // Socket.IO関連の関数
   const connectSocket = useCallback((school_id: string) => {
     if (socketRef.current) {
@@ -290,11 +351,41 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
     });
     setCurrentSchoolId(school_id);
 
+    // ボードのイベントの seq を記録する
+    const trackSeq = (data: { seq?: number }) => {
+      if (data.seq !== undefined && data.seq > boardSeqRef.current.seq) {
+        boardSeqRef.current.seq = data.seq;
+      }
+    };
+
     socketRef.current.on("connect", () => {
       console.log("Socket connected");
       // 学校のルームに参加
-      socketRef.current?.emit("join_school", { school_id });
+      // sticky_updated は変更された項目だけを受け取る
+      socketRef.current?.emit("join_school", { school_id, sticky_delta: true });
       console.log(`学校ルームに参加しました: school_${school_id}`);
+      // 付箋を取得済みなら、切断中（取得後）に取り逃したイベントを受け取り直す
+      if (boardSeqRef.current.epoch) {
+        socketRef.current?.emit("resync_board", {
+          school_id,
+          last_seq: boardSeqRef.current.seq,
+          epoch: boardSeqRef.current.epoch,
+        });
+      }
+    });
+
+    socketRef.current.on("board_resync", (data: BoardResync) => {
+      if (data.snapshot_required || !data.events) {
+        // 取り逃した範囲が残っていないので全件を取得し直す
+        console.log("Socket: 付箋を再取得します", data);
+        loadSchoolPosts(school_id, themeIdRef.current);
+        return;
+      }
+      console.log(`Socket: ${data.events.length}件のイベントを再適用します`);
+      for (const ev of data.events) {
+        socketRef.current?.listeners(ev.event).forEach((fn) => fn(ev.data));
+      }
+      boardSeqRef.current = { seq: data.latest_seq, epoch: data.epoch };
     });
 
     socketRef.current.on("disconnect", () => {
@@ -306,8 +397,9 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
     });
 
     // 新しい付箋が作成された時
-    socketRef.current.on("sticky_created", (data: StickyResponse) => {
+    socketRef.current.on("sticky_created", (data: StickyResponse & { seq?: number }) => {
       console.log("Socket: 新しい付箋を受信しました", data);
+      trackSeq(data);
       const newPost: Post = {
         id: data.sticky_id,
         text: data.sticky_content,
@@ -323,10 +415,12 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
         feedback_C: data.feedback_C,
         theme_id: theme?.theme_id,
         author_camp_id: data.author_camp_id,
+        version: data.version,
       };
       setPosts((prev) => {
         // display_index を保ったまま末尾に追加し、既存要素の display_index は変更しない
-        const next = [...prev, newPost];
+        // 再送で同じ付箋が届いても重複させない
+        const next = [...prev.filter((post) => post.id !== newPost.id), newPost];
         next.sort(
           (a: Post, b: Post) => (a.display_index || 0) - (b.display_index || 0)
         );
@@ -335,8 +429,33 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
     });
 
     // 付箋が更新された時
-    socketRef.current.on("sticky_updated", (data: StickyResponse) => {
+    socketRef.current.on("sticky_updated", (data: (StickyResponse | StickyDelta) & { seq?: number }) => {
       console.log("Socket: 付箋更新を受信しました", data);
+      trackSeq(data);
+      if ("delta" in data && data.delta) {
+        const delta = data;
+        setPosts((prev) =>
+          prev.map((post) => {
+            // 既に適用した版数以前の差分は無視する
+            if (post.id !== delta.sticky_id) return post;
+            if (post.version !== undefined && delta.version <= post.version) return post;
+            return {
+              ...post,
+              version: delta.version,
+              ...(delta.sticky_content !== undefined && { text: delta.sticky_content }),
+              ...(delta.sticky_color !== undefined && { color: delta.sticky_color }),
+              ...(delta.x_axis !== undefined && { x_axis: delta.x_axis }),
+              ...(delta.y_axis !== undefined && { y_axis: delta.y_axis }),
+              ...(delta.display_index !== undefined && { display_index: delta.display_index }),
+              ...(delta.feedback_A !== undefined && { feedback_A: delta.feedback_A }),
+              ...(delta.feedback_B !== undefined && { feedback_B: delta.feedback_B }),
+              ...(delta.feedback_C !== undefined && { feedback_C: delta.feedback_C }),
+              ...(delta.ai_summary_content !== undefined && { gemini: delta.ai_summary_content }),
+            };
+          })
+        );
+        return;
+      }
       const updatedPost: Post = {
         id: data.sticky_id,
         text: data.sticky_content,
@@ -352,6 +471,7 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
         feedback_C: data.feedback_C,
         gemini: data.ai_summary_content,
         author_camp_id: data.author_camp_id,
+        version: data.version,
       };
       setPosts((prev) =>
         prev.map((post) => (post.id === data.sticky_id ? updatedPost : post))
@@ -359,8 +479,9 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
     });
 
     // 付箋が削除された時
-    socketRef.current.on("sticky_deleted", (data: { sticky_id: number }) => {
+    socketRef.current.on("sticky_deleted", (data: { sticky_id: number; seq?: number }) => {
       console.log("Socket: 付箋削除を受信しました", data);
+      trackSeq(data);
       setPosts((prev) => prev.filter((post) => post.id !== data.sticky_id));
     });
 
@@ -372,23 +493,58 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
         feedback_A: number;
         feedback_B: number;
         feedback_C: number;
+        version?: number;
+        seq?: number;
       }) => {
         console.log("Socket: フィードバック更新を受信しました", data);
+        trackSeq(data);
         setPosts((prev) =>
-          prev.map((post) =>
-            post.id === data.sticky_id
-              ? {
-                  ...post,
-                  feedback_A: data.feedback_A,
-                  feedback_B: data.feedback_B,
-                  feedback_C: data.feedback_C,
-                }
-              : post
-          )
+          prev.map((post) => {
+            if (post.id !== data.sticky_id) return post;
+            // sticky_updated と同じく版数を記録する（既に適用した版数以前の更新は無視する）
+            if (data.version !== undefined && post.version !== undefined && data.version <= post.version) {
+              return post;
+            }
+            return {
+              ...post,
+              feedback_A: data.feedback_A,
+              feedback_B: data.feedback_B,
+              feedback_C: data.feedback_C,
+              ...(data.version !== undefined && { version: data.version }),
+            };
+          })
         );
       }
     );
-  }, []);
+
+    // ドラッグ中の付箋の位置。保存した位置は版数（version）と seq 付きで届く（再接続時にも再送される）
+    socketRef.current.on(
+      "sticky_positions",
+      (data: {
+        positions: { sticky_id: number; x_axis: number; y_axis: number; version?: number }[];
+        seq?: number;
+      }) => {
+        trackSeq(data);
+        const positions = new Map(data.positions.map((p) => [p.sticky_id, p]));
+        setPosts((prev) =>
+          prev.map((post) => {
+            const position = positions.get(post.id);
+            if (!position) return post;
+            // 既に新しい版数を反映している付箋には古い位置を適用しない
+            if (position.version !== undefined && post.version !== undefined && position.version <= post.version) {
+              return post;
+            }
+            return {
+              ...post,
+              x_axis: position.x_axis,
+              y_axis: position.y_axis,
+              ...(position.version !== undefined && { version: position.version }),
+            };
+          })
+        );
+      }
+    );
+  }, [loadSchoolPosts]);
 
   const disconnectSocket = useCallback(() => {
     if (socketRef.current) {
@@ -417,6 +573,7 @@ export const PostProvider: React.FC<{ children: React.ReactNode }> = ({
         loadSchoolPosts,
         updatePost,
         deletePost,
+        moveSticky,
         connectSocket,
         disconnectSocket,
       }}
@@ -29,6 +29,7 @@ const StickyNote = ({
   gridRef,
   maxPerRow,
   isLastMoved,
+  onMove,
   onMoveEnd,
   isSidebarHovered,
   currentUserId,
@@ -49,6 +50,7 @@ const StickyNote = ({
   gridRef: React.RefObject<HTMLDivElement | null>;
   maxPerRow: number;
   isLastMoved: boolean;
+  onMove: (id: number, x: number, y: number) => void;
   onMoveEnd: (id: number, x: number, y: number) => void;
   isSidebarHovered: boolean;
   currentUserId: number;
@@ -98,12 +100,22 @@ const StickyNote = ({
     }
   }, [position, getInitialPosition]);
 
-  // ローカル位置の更新のみ監視（Socket/DB更新は無視）
+  // ローカル位置の更新を反映
   useEffect(() => {
     if (localPosition && !dragging) {
       setPosition(localPosition);
     }
   }, [localPosition, dragging]);
+
+  // 他のユーザーがドラッグしている付箋は、Socket で届いた位置に追従する
+  // （自分の付箋は自分のドラッグとローカル位置を優先する）
+  useEffect(() => {
+    if (post.student_id === currentUserId || dragging || localPosition) return;
+    if (post.x_axis === undefined || post.y_axis === undefined) return;
+    const x = post.x_axis;
+    const y = post.y_axis;
+    setPosition((prev) => (prev && prev.x === x && prev.y === y ? prev : { x, y }));
+  }, [post.x_axis, post.y_axis, post.student_id, currentUserId, dragging, localPosition]);
   const offset = useRef({ x: 0, y: 0 });
   const noteRef = useRef<HTMLDivElement>(null);
 
@@ -153,6 +165,8 @@ const StickyNote = ({
             const maxY = grid.clientHeight - noteHeight - DRAG_MARGIN;
             y = Math.max(DRAG_MARGIN, Math.min(y, maxY));
             setPosition({ x, y });
+            // ドラッグ中の位置は Socket で送り、他のユーザーの画面にも反映する
+            onMove(post.id, x, y);
           }
         });
       }
@@ -178,7 +192,7 @@ const StickyNote = ({
         cancelAnimationFrame(animationId);
       }
     };
-  }, [dragging, gridRef, post.id, onMoveEnd, position]);
+  }, [dragging, gridRef, post.id, onMove, onMoveEnd, position]);
 
   const getTransform = () => {
     return `translate3d(${position?.x ?? 0}px, ${position?.y ?? 0}px, 0)`;
@@ -241,6 +255,7 @@ const Dashboard = () => {
     posts,
     loadSchoolPosts,
     updatePost,
+    moveSticky,
     connectSocket,
     disconnectSocket,
   } = usePost();
@@ -322,7 +337,7 @@ const Dashboard = () => {
       }));
 
       try {
-        // 即時にサーバーに保存
+        // ドロップした位置を保存（ドラッグ中の位置は moveSticky で送っている）
         await updatePost(id, { x_axis: x, y_axis: y });
 
         // 保存成功後、ローカル位置をクリア（固定位置を使用）
@@ -543,6 +558,7 @@ const Dashboard = () => {
                 gridRef={gridRef}
                 maxPerRow={maxPerRow}
                 isLastMoved={post.id === lastMovedNoteId}
+                onMove={moveSticky}
                 onMoveEnd={handleNoteMove}
                 isSidebarHovered={isSidebarHovered}
                 currentUserId={currentUser?.id || 0}